@@ -0,0 +1,63 @@
+"""
+Benchmark of the (cold) import time of `sr_olthad`, reporting the slowest imported
+modules (per `python -X importtime`) and whether any provider SDK got imported.
+
+Usage (from the `sr-olthad` directory):
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --n-runs 10 --n-slowest 20
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+PROVIDER_SDK_MODULES = ["deepseek", "google.generativeai", "groq", "openai"]
+
+
+def get_import_times_us(module: str) -> dict[str, int]:
+    """
+    Imports a module in a fresh interpreter and gets the cumulative import time (in
+    microseconds) of every (transitively) imported module.
+    """
+    completed_process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    import_times_us = {}
+    for line in completed_process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, imported_module = line.removeprefix("import time:").split("|")
+        import_times_us[imported_module.strip()] = int(cumulative_us)
+    return import_times_us
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--module", default="sr_olthad")
+    parser.add_argument("--n-runs", type=int, default=5)
+    parser.add_argument("--n-slowest", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [get_import_times_us(args.module) for _ in range(args.n_runs)]
+    total_times_ms = [run[args.module] / 1000 for run in runs]
+    print(
+        f"import {args.module}: median {statistics.median(total_times_ms):.1f}ms, "
+        f"min {min(total_times_ms):.1f}ms ({args.n_runs} runs)"
+    )
+
+    print("\nSlowest (cumulative) imports of the last run:")
+    slowest = sorted(runs[-1].items(), key=lambda item: item[1], reverse=True)
+    for imported_module, cumulative_us in slowest[: args.n_slowest]:
+        print(f"  {cumulative_us / 1000:>9.1f}ms  {imported_module}")
+
+    imported_sdks = [sdk for sdk in PROVIDER_SDK_MODULES if sdk in runs[-1]]
+    print(f"\nProvider SDKs imported: {', '.join(imported_sdks) or 'none'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Microbenchmark of `detect_extract_and_parse_json_from_text` vs. the regex-based extraction
+it replaced, on LM responses recorded in `SrOlthadTrace`s (see `sr_olthad/replay.py`) or,
+if no trace is given, on synthetic (planner-like) responses of growing sizes.
+
+Usage (from the `sr-olthad` directory):
+    python benchmarks/bench_json_extraction.py
+    python benchmarks/bench_json_extraction.py --traces trace1.json.gz trace2.json.gz
+"""
+
+import argparse
+import json
+import re
+import statistics
+import sys
+import time
+from collections.abc import Callable
+
+from pydantic import BaseModel, JsonValue
+
+from sr_olthad.framework.utils import detect_extract_and_parse_json_from_text
+from sr_olthad.replay import SrOlthadTrace
+
+_LEGACY_JSON_PATTERN = re.compile(r"\{(?:[^{}]|\{[^{}]*\})*\}")
+
+
+class AnyJsonObject(BaseModel):
+    """Accepts any JSON object (so that the benchmark doesn't depend on the agents)."""
+
+    model_config = {"extra": "allow"}
+
+
+def legacy_extract(text: str) -> BaseModel | None:
+    """The regex-based extraction (minus its error handling), for comparison."""
+    for json_str in reversed(_LEGACY_JSON_PATTERN.findall(text)):
+        try:
+            return AnyJsonObject.model_validate_json(json_str)
+        except ValueError:
+            continue
+    return None
+
+
+def extract(text: str) -> BaseModel | None:
+    try:
+        return detect_extract_and_parse_json_from_text(text, AnyJsonObject)
+    except ValueError:
+        return None
+
+
+def get_synthetic_response(n_subtasks: int) -> str:
+    """A long reasoning (full of braces, e.g., Minecraft JSON) followed by a JSON answer."""
+    inventory: JsonValue = {
+        "inventory": [
+            {"item": f"minecraft:item_{i}", "count": i, "nbt": {"damage": {"value": i}}}
+            for i in range(n_subtasks)
+        ]
+    }
+    reasoning = f"Looking at the env state {json.dumps(inventory)}, I'll use {{ and }}. "
+    answer = {"new_planned_subtasks": [f"Craft item {i}." for i in range(n_subtasks)]}
+    return reasoning * 4 + f"Final answer: {json.dumps(answer)}"
+
+
+def time_extraction(extract_fn: Callable[[str], object], responses: list[str]) -> float:
+    start = time.perf_counter()
+    for response in responses:
+        extract_fn(response)
+    return time.perf_counter() - start
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--traces", nargs="*", default=[], help="Paths of saved traces")
+    parser.add_argument("--n-runs", type=int, default=5)
+    args = parser.parse_args()
+
+    response_sets: dict[str, list[str]] = {}
+    for trace_fpath in args.traces:
+        trace = SrOlthadTrace.load(trace_fpath)
+        responses = [r for rs in trace.lm_responses.values() for r in rs]
+        response_sets[trace_fpath] = responses
+    if not response_sets:
+        for n_subtasks in (1, 10, 100, 1000):
+            response = get_synthetic_response(n_subtasks)
+            response_sets[f"synthetic ({len(response) / 1024:.1f} KiB)"] = [response] * 20
+
+    print(f"{'responses':<32} {'legacy regex':>14} {'brace scanner':>14} {'speedup':>8}")
+    for name, responses in response_sets.items():
+        legacy_s = statistics.median(
+            time_extraction(legacy_extract, responses) for _ in range(args.n_runs)
+        )
+        new_s = statistics.median(
+            time_extraction(extract, responses) for _ in range(args.n_runs)
+        )
+        print(
+            f"{name:<32} {legacy_s * 1000:>12.3f}ms {new_s * 1000:>12.3f}ms "
+            f"{legacy_s / new_s:>7.1f}x"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""
+Benchmarks of the per-step OLTHAD operations (see `sr_olthad/olthad.py`) on synthetic
+trees of ~10 to ~100k nodes, reporting the time and peak (traced) memory of each.
+
+Usage (from the `sr-olthad` directory):
+    python benchmarks/bench_olthad.py
+    python benchmarks/bench_olthad.py --max-nodes 20000 --save results.json
+    python benchmarks/bench_olthad.py --compare results.json --max-slowdown 1.5
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from sr_olthad.olthad import OlthadTraversal, TaskNode
+from sr_olthad.schema import TaskStatus
+
+#######################
+### Synthetic trees ###
+#######################
+
+
+@dataclass(frozen=True)
+class TreeShape:
+    """
+    Shape of a synthetic OLTHAD.
+
+    Attributes:
+        depth (int): The depth of the in-progress path below the root.
+        fan_out (int): The number of subtasks of every node that has subtasks.
+        bushy (bool): Whether the attempted/planned subtasks also have (full) subtrees
+            (otherwise, only the nodes of the in-progress path have subtasks).
+    """
+
+    depth: int
+    fan_out: int
+    bushy: bool
+
+    @property
+    def name(self) -> str:
+        return f"depth={self.depth},fan_out={self.fan_out},bushy={self.bushy}"
+
+    @property
+    def n_nodes(self) -> int:
+        if not self.bushy:
+            return 1 + self.depth * self.fan_out
+        return sum(self.fan_out**lvl for lvl in range(self.depth + 1))
+
+
+TREE_SHAPES = [
+    TreeShape(depth=2, fan_out=3, bushy=True),  # 13 nodes
+    TreeShape(depth=3, fan_out=10, bushy=True),  # 1,111 nodes
+    TreeShape(depth=4, fan_out=10, bushy=True),  # 11,111 nodes
+    TreeShape(depth=5, fan_out=10, bushy=True),  # 111,111 nodes
+    TreeShape(depth=10, fan_out=5, bushy=False),  # 51 nodes
+    TreeShape(depth=100, fan_out=3, bushy=False),  # 301 nodes
+]
+
+
+def build_traversal(shape: TreeShape) -> OlthadTraversal:
+    """
+    Synthesizes a traversal whose current node is at the end of an in-progress path
+    through the middle subtasks (attempted subtasks before it, planned ones after it).
+    """
+    traversal = OlthadTraversal(highest_level_task="Do the highest-level task.")
+    nodes = traversal._nodes
+
+    def add_subtasks(node: TaskNode, lvl: int, is_in_progress_path: bool) -> TaskNode:
+        in_progress_idx = shape.fan_out // 2
+        in_progress_subtask = None
+        for i in range(shape.fan_out):
+            if not is_in_progress_path or i < in_progress_idx:
+                status = TaskStatus.SUCCESS if is_in_progress_path else TaskStatus.PLANNED
+            elif i == in_progress_idx:
+                status = TaskStatus.IN_PROGRESS
+            else:
+                status = TaskStatus.PLANNED
+            subtask = TaskNode(
+                _id=f"{node._id}.{i + 1}",
+                _parent_id=node._id,
+                _task=f"Do subtask {i + 1} of task {node._id}.",
+                _status=status,
+                _retrospective="It went well." if status == TaskStatus.SUCCESS else None,
+            )
+            nodes[subtask._id] = subtask
+            if status == TaskStatus.PLANNED:
+                node._planned_subtasks.append(subtask)
+            else:
+                node._non_planned_subtasks.append(subtask)
+            if lvl + 1 < shape.depth:
+                if status == TaskStatus.IN_PROGRESS:
+                    in_progress_subtask = add_subtasks(subtask, lvl + 1, True)
+                elif shape.bushy:
+                    add_subtasks(subtask, lvl + 1, False)
+            elif status == TaskStatus.IN_PROGRESS:
+                in_progress_subtask = subtask
+        return in_progress_subtask
+
+    traversal._cur_node = add_subtasks(traversal._root_node, 0, True)
+    return traversal
+
+
+def clear_stringified_fragment_caches(traversal: OlthadTraversal) -> None:
+    for node in traversal.nodes.values():
+        node._stringified_fragments_cache = None
+
+
+##################
+### Operations ###
+##################
+
+
+@dataclass(frozen=True)
+class Operation:
+    """
+    A benchmarked operation.
+
+    Attributes:
+        name (str): The name of the operation.
+        setup (Callable[[OlthadTraversal], None]): Untimed preparation (run before every
+            timed run).
+        run (Callable[[OlthadTraversal], object]): The timed operation.
+        needs_fresh_tree (bool): Whether every timed run needs a freshly built tree
+            (e.g., because the operation destroys part of it).
+    """
+
+    name: str
+    run: Callable[[OlthadTraversal], object]
+    setup: Callable[[OlthadTraversal], None] = lambda _: None
+    needs_fresh_tree: bool = False
+
+
+def _exhaust_in_progress_descendants(traversal: OlthadTraversal) -> None:
+    # Like the backtracker, stringifies the partial rebuild at every level
+    for root_of_rebuild, _, _ in traversal.root_node.iter_in_progress_descendants():
+        root_of_rebuild.stringify()
+
+
+def _plan_subtasks_of_cur_node(traversal: OlthadTraversal) -> None:
+    traversal.update_planned_subtasks_of_cur_node(["Do A.", "Do B.", "Do C."]).commit()
+
+
+OPERATIONS = [
+    Operation(
+        name="stringify (cold cache)",
+        setup=clear_stringified_fragment_caches,
+        run=lambda t: t.root_node.stringify(),
+    ),
+    Operation(name="stringify (warm cache)", run=lambda t: t.root_node.stringify()),
+    Operation(
+        name="stringify (redacted)",
+        run=lambda t: t.root_node.stringify(redact_planned_subtasks_below=t.cur_node.id),
+    ),
+    Operation(
+        name="stringify (obfuscated)",
+        run=lambda t: t.root_node.stringify(obfuscate_status_of=t.cur_node.id),
+    ),
+    Operation(
+        name="diff (status update)",
+        run=lambda t: t.update_status_and_retrospective_of(
+            t.cur_node, TaskStatus.SUCCESS, "It went well."
+        ).get_diff(),
+    ),
+    Operation(
+        name="diff (planned subtasks update)",
+        run=lambda t: t.update_planned_subtasks_of_cur_node(["Do A.", "Do B."]).get_diff(),
+    ),
+    Operation(name="iter_in_progress_descendants", run=_exhaust_in_progress_descendants),
+    Operation(
+        name="backtrack_to (root)",
+        run=lambda t: t.backtrack_to(t.root_node.id),
+        needs_fresh_tree=True,
+    ),
+    Operation(name="update_planned_subtasks_of_cur_node", run=_plan_subtasks_of_cur_node),
+    Operation(
+        name="recurse_inward",
+        setup=_plan_subtasks_of_cur_node,
+        run=lambda t: t.recurse_inward(),
+    ),
+]
+
+
+#################
+### Benchmark ###
+#################
+
+
+def benchmark(shape: TreeShape, operation: Operation, n_runs: int) -> dict[str, float]:
+    """
+    Times `n_runs` runs of an operation and traces the peak memory of one more run.
+
+    Returns:
+        dict[str, float]: The median & min run times (seconds) and the peak memory (KiB).
+    """
+    traversal = build_traversal(shape)
+    times = []
+    for run_idx in range(n_runs + 1):
+        if operation.needs_fresh_tree:
+            traversal = build_traversal(shape)
+        operation.setup(traversal)
+        is_memory_run = run_idx == n_runs
+        if is_memory_run:
+            tracemalloc.start()
+            operation.run(traversal)
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        else:
+            start = time.perf_counter()
+            operation.run(traversal)
+            times.append(time.perf_counter() - start)
+    return {
+        "median_s": statistics.median(times),
+        "min_s": min(times),
+        "peak_memory_kib": peak_memory / 1024,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--max-nodes", type=int, default=200_000)
+    parser.add_argument("--n-runs", type=int, default=5)
+    parser.add_argument("--save", help="Path of a JSON file to save the results to")
+    parser.add_argument("--compare", help="Path of saved (baseline) JSON results")
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=1.5,
+        help="Max ratio of median times vs. the baseline before failing",
+    )
+    parser.add_argument(
+        "--min-regression-ms",
+        type=float,
+        default=0.5,
+        help="Min slowdown (in ms) to count as a regression (ignores sub-ms noise)",
+    )
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results: dict[str, dict[str, float]] = {}
+    regressions = []
+    print(f"{'tree':<34} {'operation':<37} {'median':>11} {'peak mem':>12}")
+    for shape in TREE_SHAPES:
+        if shape.n_nodes > args.max_nodes:
+            continue
+        for operation in OPERATIONS:
+            key = f"{shape.name} | {operation.name}"
+            result = benchmark(shape, operation, args.n_runs)
+            results[key] = result
+            line = (
+                f"{shape.name:<34} {operation.name:<37} "
+                f"{result['median_s'] * 1000:>9.3f}ms {result['peak_memory_kib']:>9.1f}KiB"
+            )
+            if key in baseline:
+                slowdown = result["median_s"] / baseline[key]["median_s"]
+                line += f" ({slowdown:.2f}x baseline)"
+                slowdown_ms = (result["median_s"] - baseline[key]["median_s"]) * 1000
+                if slowdown > args.max_slowdown and slowdown_ms > args.min_regression_ms:
+                    regressions.append(key)
+            print(line)
+
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) (> {args.max_slowdown}x baseline):")
+        for key in regressions:
+            print(f"  {key}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
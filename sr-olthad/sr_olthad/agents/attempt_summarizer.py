@@ -27,7 +27,10 @@ class AttemptSummarizer:
                 instruct_lm=cfg.INSTRUCT_LM,
                 response_json_model=AttemptSummarizerLmResponseOutputData,
                 max_tries_to_get_parsable_response=cfg.MAX_TRIES_TO_GET_VALID_LM_RESPONSE,
+                use_structured_output=cfg.USE_STRUCTURED_OUTPUT,
+                retry_strategy=cfg.RETRY_STRATEGY,
                 streams_handler=streams_handler,
+                stop_streams_at_valid_json=cfg.STOP_STREAMS_AT_VALID_JSON,
             )
         )
 
@@ -1,19 +1,32 @@
+import asyncio
 import functools
+from collections.abc import Generator
 
 from sr_olthad.config import BacktrackerCfg as cfg
-from sr_olthad.framework.agents import InstructLmAgent, InstructLmAgentOutput
-from sr_olthad.framework.schema import LmStreamsHandler
-from sr_olthad.lm_step import LmStepTemplate
+from sr_olthad.framework.agents import (
+    AdaptiveVotingPolicy,
+    InstructLmAgent,
+    InstructLmAgentOutput,
+    LogprobClfAgent,
+    VotingAgreementHistory,
+)
+from sr_olthad.framework.schema import InstructLm, LmStreamsHandler
+from sr_olthad.lm_step import LmStepTemplate, SpeculativeLmStepRun
 from sr_olthad.olthad import OlthadTraversal, PendingOlthadUpdate, TaskNode
 from sr_olthad.prompts import (
+    BACKTRACKER_ANSWER_ONLY_PROMPT,
+    BACKTRACKER_RETROSPECTIVE_PROMPT,
     EFFORT_WAS_EXHAUSTIVE_OPTIONS,
     IS_MOST_WORTHWHILE_PURSUIT_OPTIONS,
     WAS_PARTIAL_SUCCESS_OPTIONS,
     WAS_SUCCESSFULLY_COMPLETED_OPTIONS,
+    BacktrackerFusedClfLmResponseOutputData,
     BacktrackerSubAgentLmResponseOutputData,
 )
 from sr_olthad.schema import (
     BacktrackedFromTaskStatus,
+    BacktrackerStrategy,
+    BinaryChoiceOptions,
     LmAgentName,
     UserPromptInputData,
 )
@@ -57,19 +70,33 @@ class Backtracker:
 
         self.traversal = olthad_traversal
         self.lm_step_template = lm_step_template
+        self.streams_handler = streams_handler
+        self.voting_agreement_history = VotingAgreementHistory(
+            cfg.VOTING_AGREEMENT_HISTORY_FPATH
+        )
 
         ###################################################
         ### Initialize successful completion classifier ###
         ###################################################
 
-        self.successful_completion_clf: InstructLmAgent[
-            BacktrackerSubAgentLmResponseOutputData
-        ] = InstructLmAgent(
+        self.successful_completion_clf: (
+            InstructLmAgent[BacktrackerSubAgentLmResponseOutputData]
+            | LogprobClfAgent[BacktrackerSubAgentLmResponseOutputData]
+        ) = InstructLmAgent(
             instruct_lm=cfg.SuccessfulCompletionClfCfg.INSTRUCT_LM,
             response_json_model=BacktrackerSubAgentLmResponseOutputData,
             max_tries_to_get_parsable_response=cfg.SuccessfulCompletionClfCfg.MAX_TRIES_TO_GET_VALID_LM_RESPONSE,
+            use_structured_output=cfg.SuccessfulCompletionClfCfg.USE_STRUCTURED_OUTPUT,
+            retry_strategy=cfg.SuccessfulCompletionClfCfg.RETRY_STRATEGY,
+            stop_streams_at_valid_json=cfg.SuccessfulCompletionClfCfg.STOP_STREAMS_AT_VALID_JSON,
             num_calls_for_voting=cfg.SuccessfulCompletionClfCfg.N_CALLS_FOR_VOTING,
             max_async_calls=cfg.SuccessfulCompletionClfCfg.MAX_ASYNC_CALLS_FOR_VOTING,
+            early_stop_voting=cfg.SuccessfulCompletionClfCfg.EARLY_STOP_VOTING,
+            early_stop_vote_share=cfg.SuccessfulCompletionClfCfg.EARLY_STOP_VOTE_SHARE,
+            sample_votes_in_one_request=cfg.SuccessfulCompletionClfCfg.SAMPLE_VOTES_IN_ONE_REQUEST,
+            adaptive_voting=self._get_adaptive_voting_policy(
+                LmAgentName.SUCCESSFUL_COMPLETION_CLF
+            ),
             vote_field=BacktrackerSubAgentLmResponseOutputData.answer_attr,
             reason_field=BacktrackerSubAgentLmResponseOutputData.retrospective_attr,
             streams_handler=streams_handler,
@@ -80,14 +107,24 @@ class Backtracker:
         ### Initialize exhaustive effort classifier ###
         ###############################################
 
-        self.exhaustive_effort_clf: InstructLmAgent[
-            BacktrackerSubAgentLmResponseOutputData
-        ] = InstructLmAgent(
+        self.exhaustive_effort_clf: (
+            InstructLmAgent[BacktrackerSubAgentLmResponseOutputData]
+            | LogprobClfAgent[BacktrackerSubAgentLmResponseOutputData]
+        ) = InstructLmAgent(
             instruct_lm=cfg.ExhaustiveEffortClf.INSTRUCT_LM,
             response_json_model=BacktrackerSubAgentLmResponseOutputData,
             max_tries_to_get_parsable_response=cfg.ExhaustiveEffortClf.MAX_TRIES_TO_GET_VALID_LM_RESPONSE,
+            use_structured_output=cfg.ExhaustiveEffortClf.USE_STRUCTURED_OUTPUT,
+            retry_strategy=cfg.ExhaustiveEffortClf.RETRY_STRATEGY,
+            stop_streams_at_valid_json=cfg.ExhaustiveEffortClf.STOP_STREAMS_AT_VALID_JSON,
             num_calls_for_voting=cfg.ExhaustiveEffortClf.N_CALLS_FOR_VOTING,
             max_async_calls=cfg.ExhaustiveEffortClf.MAX_ASYNC_CALLS_FOR_VOTING,
+            early_stop_voting=cfg.ExhaustiveEffortClf.EARLY_STOP_VOTING,
+            early_stop_vote_share=cfg.ExhaustiveEffortClf.EARLY_STOP_VOTE_SHARE,
+            sample_votes_in_one_request=cfg.ExhaustiveEffortClf.SAMPLE_VOTES_IN_ONE_REQUEST,
+            adaptive_voting=self._get_adaptive_voting_policy(
+                LmAgentName.EXHAUSTIVE_EFFORT_CLF
+            ),
             vote_field=BacktrackerSubAgentLmResponseOutputData.answer_attr,
             reason_field=BacktrackerSubAgentLmResponseOutputData.retrospective_attr,
             streams_handler=streams_handler,
@@ -98,14 +135,24 @@ class Backtracker:
         ### Initialize partial success classifier ###
         #############################################
 
-        self.partial_success_clf: InstructLmAgent[
-            BacktrackerSubAgentLmResponseOutputData
-        ] = InstructLmAgent(
+        self.partial_success_clf: (
+            InstructLmAgent[BacktrackerSubAgentLmResponseOutputData]
+            | LogprobClfAgent[BacktrackerSubAgentLmResponseOutputData]
+        ) = InstructLmAgent(
             instruct_lm=cfg.PartialSuccessClfCfg.INSTRUCT_LM,
             response_json_model=BacktrackerSubAgentLmResponseOutputData,
             max_tries_to_get_parsable_response=cfg.PartialSuccessClfCfg.MAX_TRIES_TO_GET_VALID_LM_RESPONSE,
+            use_structured_output=cfg.PartialSuccessClfCfg.USE_STRUCTURED_OUTPUT,
+            retry_strategy=cfg.PartialSuccessClfCfg.RETRY_STRATEGY,
+            stop_streams_at_valid_json=cfg.PartialSuccessClfCfg.STOP_STREAMS_AT_VALID_JSON,
             num_calls_for_voting=cfg.PartialSuccessClfCfg.N_CALLS_FOR_VOTING,
             max_async_calls=cfg.PartialSuccessClfCfg.MAX_ASYNC_CALLS_FOR_VOTING,
+            early_stop_voting=cfg.PartialSuccessClfCfg.EARLY_STOP_VOTING,
+            early_stop_vote_share=cfg.PartialSuccessClfCfg.EARLY_STOP_VOTE_SHARE,
+            sample_votes_in_one_request=cfg.PartialSuccessClfCfg.SAMPLE_VOTES_IN_ONE_REQUEST,
+            adaptive_voting=self._get_adaptive_voting_policy(
+                LmAgentName.PARTIAL_SUCCESS_CLF
+            ),
             vote_field=BacktrackerSubAgentLmResponseOutputData.answer_attr,
             reason_field=BacktrackerSubAgentLmResponseOutputData.retrospective_attr,
             streams_handler=streams_handler,
@@ -116,20 +163,126 @@ class Backtracker:
         ### Initialize most worthwhile pursuit classifier ###
         #####################################################
 
-        self.most_worthwhile_pursuit_clf: InstructLmAgent[
-            BacktrackerSubAgentLmResponseOutputData
-        ] = InstructLmAgent(
+        self.most_worthwhile_pursuit_clf: (
+            InstructLmAgent[BacktrackerSubAgentLmResponseOutputData]
+            | LogprobClfAgent[BacktrackerSubAgentLmResponseOutputData]
+        ) = InstructLmAgent(
             instruct_lm=cfg.MostWorthwhilePursuitClfCfg.INSTRUCT_LM,
             response_json_model=BacktrackerSubAgentLmResponseOutputData,
             max_tries_to_get_parsable_response=cfg.MostWorthwhilePursuitClfCfg.MAX_TRIES_TO_GET_VALID_LM_RESPONSE,
+            use_structured_output=cfg.MostWorthwhilePursuitClfCfg.USE_STRUCTURED_OUTPUT,
+            retry_strategy=cfg.MostWorthwhilePursuitClfCfg.RETRY_STRATEGY,
+            stop_streams_at_valid_json=cfg.MostWorthwhilePursuitClfCfg.STOP_STREAMS_AT_VALID_JSON,
             num_calls_for_voting=cfg.MostWorthwhilePursuitClfCfg.N_CALLS_FOR_VOTING,
             max_async_calls=cfg.MostWorthwhilePursuitClfCfg.MAX_ASYNC_CALLS_FOR_VOTING,
+            early_stop_voting=cfg.MostWorthwhilePursuitClfCfg.EARLY_STOP_VOTING,
+            early_stop_vote_share=cfg.MostWorthwhilePursuitClfCfg.EARLY_STOP_VOTE_SHARE,
+            sample_votes_in_one_request=cfg.MostWorthwhilePursuitClfCfg.SAMPLE_VOTES_IN_ONE_REQUEST,
+            adaptive_voting=self._get_adaptive_voting_policy(
+                LmAgentName.MOST_WORTHWHILE_PURSUIT_CLF
+            ),
             vote_field=BacktrackerSubAgentLmResponseOutputData.answer_attr,
             reason_field=BacktrackerSubAgentLmResponseOutputData.retrospective_attr,
             streams_handler=streams_handler,
             aggregate_winning_vote_reasons=get_longest_of_winning_reasons,
         )
 
+        ###################################
+        ### Initialize fused classifier ###
+        ###################################
+
+        self.fused_clf: InstructLmAgent[BacktrackerFusedClfLmResponseOutputData] = (
+            InstructLmAgent(
+                instruct_lm=cfg.FusedClfCfg.INSTRUCT_LM,
+                response_json_model=BacktrackerFusedClfLmResponseOutputData,
+                max_tries_to_get_parsable_response=cfg.FusedClfCfg.MAX_TRIES_TO_GET_VALID_LM_RESPONSE,
+                use_structured_output=cfg.FusedClfCfg.USE_STRUCTURED_OUTPUT,
+                retry_strategy=cfg.FusedClfCfg.RETRY_STRATEGY,
+                stop_streams_at_valid_json=cfg.FusedClfCfg.STOP_STREAMS_AT_VALID_JSON,
+                streams_handler=streams_handler,
+            )
+        )
+
+        ##############################################################
+        ### Switch classifiers to logprob classification as needed ###
+        ##############################################################
+
+        if cfg.SuccessfulCompletionClfCfg.USE_LOGPROB_CLASSIFICATION:
+            self.successful_completion_clf = self._get_logprob_clf(
+                instruct_lm=cfg.SuccessfulCompletionClfCfg.INSTRUCT_LM,
+                options=WAS_SUCCESSFULLY_COMPLETED_OPTIONS,
+                answers_with_written_retrospectives=[True],
+                fallback_agent=self.successful_completion_clf,
+                streams_handler=streams_handler,
+            )
+        if cfg.ExhaustiveEffortClf.USE_LOGPROB_CLASSIFICATION:
+            self.exhaustive_effort_clf = self._get_logprob_clf(
+                instruct_lm=cfg.ExhaustiveEffortClf.INSTRUCT_LM,
+                options=EFFORT_WAS_EXHAUSTIVE_OPTIONS,
+                answers_with_written_retrospectives=[],
+                fallback_agent=self.exhaustive_effort_clf,
+                streams_handler=streams_handler,
+            )
+        if cfg.PartialSuccessClfCfg.USE_LOGPROB_CLASSIFICATION:
+            self.partial_success_clf = self._get_logprob_clf(
+                instruct_lm=cfg.PartialSuccessClfCfg.INSTRUCT_LM,
+                options=WAS_PARTIAL_SUCCESS_OPTIONS,
+                answers_with_written_retrospectives=[True, False],
+                fallback_agent=self.partial_success_clf,
+                streams_handler=streams_handler,
+            )
+        if cfg.MostWorthwhilePursuitClfCfg.USE_LOGPROB_CLASSIFICATION:
+            self.most_worthwhile_pursuit_clf = self._get_logprob_clf(
+                instruct_lm=cfg.MostWorthwhilePursuitClfCfg.INSTRUCT_LM,
+                options=IS_MOST_WORTHWHILE_PURSUIT_OPTIONS,
+                answers_with_written_retrospectives=[False],
+                fallback_agent=self.most_worthwhile_pursuit_clf,
+                streams_handler=streams_handler,
+            )
+
+    def _get_logprob_clf(
+        self,
+        instruct_lm: InstructLm,
+        options: BinaryChoiceOptions,
+        answers_with_written_retrospectives: list[bool],
+        fallback_agent: InstructLmAgent[BacktrackerSubAgentLmResponseOutputData],
+        streams_handler: LmStreamsHandler | None = None,
+    ) -> LogprobClfAgent[BacktrackerSubAgentLmResponseOutputData]:
+        """
+        Gets a classifier that classifies from the LM's logprobs for the answer letter only
+        (falling back to the regular classifier), generating a retrospective only for the
+        answers whose retrospectives are written to the OLTHAD (if so configured).
+        """
+        letters_needing_reason = None
+        if cfg.LOGPROB_CLF_RETROSPECTIVES_ONLY_WHEN_WRITTEN:
+            letters_needing_reason = [
+                options[answer].letter for answer in answers_with_written_retrospectives
+            ]
+        return LogprobClfAgent(
+            instruct_lm=instruct_lm,
+            response_json_model=BacktrackerSubAgentLmResponseOutputData,
+            answer_field=BacktrackerSubAgentLmResponseOutputData.answer_attr,
+            reason_field=BacktrackerSubAgentLmResponseOutputData.retrospective_attr,
+            option_letters=[option.letter for option in options.values()],
+            answer_only_prompt=BACKTRACKER_ANSWER_ONLY_PROMPT,
+            reason_prompt=BACKTRACKER_RETROSPECTIVE_PROMPT,
+            letters_needing_reason=letters_needing_reason,
+            fallback_agent=fallback_agent,
+            streams_handler=streams_handler,
+        )
+
+    def _get_adaptive_voting_policy(
+        self, lm_agent_name: LmAgentName
+    ) -> AdaptiveVotingPolicy | None:
+        if not cfg.ADAPTIVE_VOTING:
+            return None
+        return AdaptiveVotingPolicy(
+            history=self.voting_agreement_history,
+            key=lm_agent_name,
+            min_n_calls=cfg.ADAPTIVE_VOTING_MIN_N_CALLS,
+            min_unanimity_rate=cfg.ADAPTIVE_VOTING_MIN_UNANIMITY_RATE,
+        )
+
     def _process_successful_completion_clf_output(
         self, output: InstructLmAgentOutput[BacktrackerSubAgentLmResponseOutputData]
     ) -> tuple[bool, PendingOlthadUpdate]:
@@ -213,6 +366,55 @@ class Backtracker:
                 new_retrospective=output.data.retrospective,
             )
 
+    def _process_fused_clf_output(
+        self,
+        output: InstructLmAgentOutput[BacktrackerFusedClfLmResponseOutputData],
+    ) -> tuple[bool, PendingOlthadUpdate]:
+        """
+        Processes the output of the fused classifier, reading only the answers (and
+        retrospectives) that the backtracking decision tree needs.
+
+        Args:
+            output (InstructLmAgentOutput[BacktrackerFusedClfLmResponseOutputData]):
+                The output of the fused classifier.
+
+        Returns:
+            bool: Whether the task was deemed to have been successfully completed or to
+                have been given exhaustive effort (i.e., whether to backtrack from it).
+            PendingOlthadUpdate: The update to be applied to the OLTHAD traversal.
+        """
+        lm_choice = extract_letter_from_multiple_choice_response(
+            output.data.successful_completion_answer,
+            WAS_SUCCESSFULLY_COMPLETED_OPTIONS,
+        )
+        if lm_choice == WAS_SUCCESSFULLY_COMPLETED_OPTIONS[True].letter:
+            return True, self.traversal.update_status_and_retrospective_of(
+                node=self.traversal.cur_node,
+                new_status=BacktrackedFromTaskStatus.SUCCESS,
+                new_retrospective=output.data.successful_completion_retrospective,
+            )
+
+        lm_choice = extract_letter_from_multiple_choice_response(
+            output.data.exhaustive_effort_answer,
+            EFFORT_WAS_EXHAUSTIVE_OPTIONS,
+        )
+        if lm_choice != EFFORT_WAS_EXHAUSTIVE_OPTIONS[True].letter:
+            return False, self.traversal.update_nothing()
+
+        lm_choice = extract_letter_from_multiple_choice_response(
+            output.data.partial_success_answer,
+            WAS_PARTIAL_SUCCESS_OPTIONS,
+        )
+        if lm_choice == WAS_PARTIAL_SUCCESS_OPTIONS[True].letter:
+            new_status = BacktrackedFromTaskStatus.PARTIAL_SUCCESS
+        else:
+            new_status = BacktrackedFromTaskStatus.FAILURE
+        return True, self.traversal.update_status_and_retrospective_of(
+            node=self.traversal.cur_node,
+            new_status=new_status,
+            new_retrospective=output.data.partial_success_retrospective,
+        )
+
     def _process_most_worthwhile_pursuit_clf_output(
         self,
         output: InstructLmAgentOutput[BacktrackerSubAgentLmResponseOutputData],
@@ -244,10 +446,107 @@ class Backtracker:
                 new_retrospective=output.data.retrospective,
             )
 
+    def _iter_most_worthwhile_pursuit_clf_inputs(
+        self, env_state: str
+    ) -> Generator[tuple[UserPromptInputData, TaskNode], None, None]:
+        """
+        Generator that yields the most worthwhile pursuit classifier's prompt input data
+        for each depth level of the OLTHAD, from the root down to the current node,
+        alongside the (original) node in question at that depth level.
+        """
+        for (  # Iter through gradual reconstruction of olthad starting from cur=root
+            root_node_reconstructed_view,
+            cur_node_reconstructed_view,
+            cur_node_original,
+        ) in self.traversal.root_node.iter_in_progress_descendants():
+            prompt_input_data = UserPromptInputData(
+                env_state=env_state,
+                olthad=root_node_reconstructed_view.stringify(
+                    redact_planned_subtasks_below=cur_node_reconstructed_view.id,
+                    obfuscate_status_of=cur_node_reconstructed_view.id,
+                ),
+                task_in_question=cur_node_reconstructed_view.stringify(
+                    redact_planned_subtasks_below=cur_node_reconstructed_view.id,
+                    obfuscate_status_of=cur_node_reconstructed_view.id,
+                ),
+            )
+            yield prompt_input_data, cur_node_original
+
+            if cur_node_original.id == self.traversal.cur_node.id:
+                # We have reached the original current node, we are done
+                break
+
+    def _start_speculative_runs(
+        self, env_state: str, prompt_input_data: UserPromptInputData
+    ) -> dict[tuple[LmAgentName, str], SpeculativeLmStepRun]:
+        """
+        Speculatively starts the classifiers' LM runs concurrently, in the order in which
+        the backtracking decision tree would need them, until starting the next one would
+        exceed `cfg.MAX_SPECULATIVE_LM_CALLS`.
+
+        Returns:
+            dict[tuple[LmAgentName, str], SpeculativeLmStepRun]: The started runs, keyed
+                by the classifier's name and the id of the task in question.
+        """
+        classifiers = {
+            LmAgentName.SUCCESSFUL_COMPLETION_CLF: self.successful_completion_clf,
+            LmAgentName.EXHAUSTIVE_EFFORT_CLF: self.exhaustive_effort_clf,
+            LmAgentName.PARTIAL_SUCCESS_CLF: self.partial_success_clf,
+            LmAgentName.MOST_WORTHWHILE_PURSUIT_CLF: self.most_worthwhile_pursuit_clf,
+            LmAgentName.FUSED_CLF: self.fused_clf,
+        }
+
+        def iter_candidates() -> Generator[
+            tuple[LmAgentName, str, UserPromptInputData], None, None
+        ]:
+            cur_node_id = self.traversal.cur_node.id
+            if cfg.STRATEGY == BacktrackerStrategy.FUSED:
+                yield LmAgentName.FUSED_CLF, cur_node_id, prompt_input_data
+            else:
+                yield LmAgentName.SUCCESSFUL_COMPLETION_CLF, cur_node_id, prompt_input_data
+                yield LmAgentName.EXHAUSTIVE_EFFORT_CLF, cur_node_id, prompt_input_data
+                yield LmAgentName.PARTIAL_SUCCESS_CLF, cur_node_id, prompt_input_data
+            for (
+                mwp_prompt_input_data,
+                node_in_question,
+            ) in self._iter_most_worthwhile_pursuit_clf_inputs(env_state):
+                yield (
+                    LmAgentName.MOST_WORTHWHILE_PURSUIT_CLF,
+                    node_in_question.id,
+                    mwp_prompt_input_data,
+                )
+
+        speculative_runs = {}
+        n_lm_calls = 0
+        for lm_agent_name, node_id, candidate_prompt_input_data in iter_candidates():
+            clf = classifiers[lm_agent_name]
+            n_lm_calls += clf.num_calls_for_voting
+            if n_lm_calls > cfg.MAX_SPECULATIVE_LM_CALLS:
+                break
+            speculative_runs[(lm_agent_name, node_id)] = self.lm_step_template.speculate(
+                run_step=clf.run,
+                lm_agent_name=lm_agent_name,
+                prompt_input_data=candidate_prompt_input_data,
+                streams_handler=self.streams_handler,
+            )
+        return speculative_runs
+
     async def run(self, env_state: str) -> bool | None:
         """
         Runs the backtracker.
 
+        NOTE: If `cfg.STRATEGY` is `BacktrackerStrategy.FUSED`, the successful completion,
+        exhaustive effort, and partial success questions are answered by the fused
+        classifier in one LM call (rather than by their own classifiers, one at a time).
+
+        NOTE: If `cfg.SPECULATIVE_MODE` is enabled, the classifiers' LM calls are started
+        concurrently up front (up to `cfg.MAX_SPECULATIVE_LM_CALLS`) and those whose
+        results the decision tree ends up not needing are cancelled and discarded.
+        Likewise, if `cfg.MostWorthwhilePursuitClfCfg.EVALUATE_LEVELS_CONCURRENTLY` is
+        enabled, all depth levels' most worthwhile pursuit classifications are started
+        at once. The streams of these concurrent LM calls are buffered until their step is
+        emitted (see `LmStepTemplate.speculate`).
+
         Args:
             env_state (str): The current environment state.
 
@@ -268,6 +567,57 @@ class Backtracker:
             ),
         )
 
+        if cfg.SPECULATIVE_MODE:
+            speculative_runs = self._start_speculative_runs(env_state, prompt_input_data)
+        else:
+            speculative_runs = {}
+
+        try:
+            return await self._run_classifiers(
+                env_state=env_state,
+                prompt_input_data=prompt_input_data,
+                speculative_runs=speculative_runs,
+            )
+        finally:
+            # Discard any speculative runs whose results weren't needed
+            for speculative_run in speculative_runs.values():
+                speculative_run.output.cancel()
+            await asyncio.gather(
+                *(speculative_run.output for speculative_run in speculative_runs.values()),
+                return_exceptions=True,
+            )
+            # Flush the voting agreement history (saved in the background as recorded)
+            await self.voting_agreement_history.persist()
+
+    async def _run_classifiers(
+        self,
+        env_state: str,
+        prompt_input_data: UserPromptInputData,
+        speculative_runs: dict[tuple[LmAgentName, str], SpeculativeLmStepRun],
+    ) -> bool:
+        """Runs the classifiers' LM steps as the backtracking decision tree requires."""
+        if cfg.STRATEGY == BacktrackerStrategy.FUSED:
+            did_backtrack = await self._run_fused_clf(prompt_input_data, speculative_runs)
+        else:
+            did_backtrack = await self._run_cascaded_clfs(
+                prompt_input_data, speculative_runs
+            )
+        if did_backtrack:
+            return True
+        return await self._run_most_worthwhile_pursuit_clfs(env_state, speculative_runs)
+
+    async def _run_cascaded_clfs(
+        self,
+        prompt_input_data: UserPromptInputData,
+        speculative_runs: dict[tuple[LmAgentName, str], SpeculativeLmStepRun],
+    ) -> bool:
+        """
+        Runs the successful completion, exhaustive effort, and partial success classifiers'
+        LM steps (one at a time, as the decision tree requires them).
+
+        Returns:
+            bool: Whether backtracking occurred.
+        """
         ##########################################################################
         ### LM STEP: Classify whether the task has been successfully completed ###
         ##########################################################################
@@ -280,6 +630,9 @@ class Backtracker:
             cur_node_id=self.traversal.cur_node.id,
             prompt_input_data=prompt_input_data,
             n_streams_to_handle=cfg.SuccessfulCompletionClfCfg.N_CALLS_FOR_VOTING,
+            speculative_run=speculative_runs.get(
+                (LmAgentName.SUCCESSFUL_COMPLETION_CLF, self.traversal.cur_node.id)
+            ),
         )
 
         # Run lm step
@@ -303,6 +656,9 @@ class Backtracker:
             cur_node_id=self.traversal.cur_node.id,
             prompt_input_data=prompt_input_data,
             n_streams_to_handle=cfg.ExhaustiveEffortClf.N_CALLS_FOR_VOTING,
+            speculative_run=speculative_runs.get(
+                (LmAgentName.EXHAUSTIVE_EFFORT_CLF, self.traversal.cur_node.id)
+            ),
         )
 
         # Run lm step
@@ -322,6 +678,9 @@ class Backtracker:
                 cur_node_id=self.traversal.cur_node.id,
                 prompt_input_data=prompt_input_data,
                 n_streams_to_handle=cfg.PartialSuccessClfCfg.N_CALLS_FOR_VOTING,
+                speculative_run=speculative_runs.get(
+                    (LmAgentName.PARTIAL_SUCCESS_CLF, self.traversal.cur_node.id)
+                ),
             )
 
             # Run lm step
@@ -332,57 +691,108 @@ class Backtracker:
             self.traversal.backtrack_to(self.traversal.cur_node.parent_id)
             return True  # Return True to indicate that backtracking occurred
 
-        else:  # Effort was not deemed exhaustive
-            #######################################################################################
-            ### LM STEP(S): Classify if ancestor tasks are (still) the most worthwhile pursuits ###
-            #######################################################################################
-
-            for (  # Iter through gradual reconstruction of olthad starting from cur=root
-                root_node_reconstructed_copy,
-                cur_node_reconstructed_copy,
-                cur_node_original,
-            ) in self.traversal.root_node.iter_in_progress_descendants():
-                prompt_input_data = UserPromptInputData(
-                    env_state=env_state,
-                    olthad=root_node_reconstructed_copy.stringify(
-                        redact_planned_subtasks_below=cur_node_reconstructed_copy.id,
-                        obfuscate_status_of=cur_node_reconstructed_copy.id,
-                    ),
-                    task_in_question=cur_node_reconstructed_copy.stringify(
-                        redact_planned_subtasks_below=cur_node_reconstructed_copy.id,
-                        obfuscate_status_of=cur_node_reconstructed_copy.id,
-                    ),
-                )
+        return False  # (Effort was not deemed exhaustive)
 
-                # Compose lm step
-                lm_step = self.lm_step_template.compose(
-                    run_step=self.most_worthwhile_pursuit_clf.run,
-                    # NOTE: We pre-apply the node_to_update argument so that
-                    # self._process_most_worthwhile_pursuit_clf_output matches the
-                    # signature expected by lm_step_template.
-                    process_output=functools.partial(
-                        self._process_most_worthwhile_pursuit_clf_output,
-                        node_to_update=cur_node_original,
-                    ),
-                    lm_agent_name=LmAgentName.MOST_WORTHWHILE_PURSUIT_CLF,
-                    cur_node_id=cur_node_reconstructed_copy.id,
-                    prompt_input_data=prompt_input_data,
-                    n_streams_to_handle=cfg.MostWorthwhilePursuitClfCfg.N_CALLS_FOR_VOTING,
-                )
+    async def _run_fused_clf(
+        self,
+        prompt_input_data: UserPromptInputData,
+        speculative_runs: dict[tuple[LmAgentName, str], SpeculativeLmStepRun],
+    ) -> bool:
+        """
+        Runs the fused classifier's LM step (answering the successful completion,
+        exhaustive effort, and partial success questions at once).
 
-                # Run lm step
-                cur_task_was_deemed_to_still_be_the_most_worthwhile_pursuit = await lm_step()
+        Returns:
+            bool: Whether backtracking occurred.
+        """
+        ######################################################################################
+        ### LM STEP: Classify whether the task is done, was given up on, or partially done ###
+        ######################################################################################
 
-                # React to lm step result
-                if not cur_task_was_deemed_to_still_be_the_most_worthwhile_pursuit:
-                    # Backtrack to the parent of this current node in the gradual reconstruction
-                    self.traversal.backtrack_to(cur_node_reconstructed_copy.parent_id)
-                    return True
+        # Compose lm step
+        lm_step = self.lm_step_template.compose(
+            run_step=self.fused_clf.run,
+            process_output=self._process_fused_clf_output,
+            lm_agent_name=LmAgentName.FUSED_CLF,
+            cur_node_id=self.traversal.cur_node.id,
+            prompt_input_data=prompt_input_data,
+            speculative_run=speculative_runs.get(
+                (LmAgentName.FUSED_CLF, self.traversal.cur_node.id)
+            ),
+        )
+
+        # Run lm step
+        cur_task_is_to_be_backtracked_from = await lm_step()
+
+        # React to lm step result
+        if cur_task_is_to_be_backtracked_from:
+            # Backtrack to the parent of the current node
+            self.traversal.backtrack_to(self.traversal.cur_node.parent_id)
+            return True  # Return True to indicate that backtracking occurred
+        return False
+
+    async def _run_most_worthwhile_pursuit_clfs(
+        self,
+        env_state: str,
+        speculative_runs: dict[tuple[LmAgentName, str], SpeculativeLmStepRun],
+    ) -> bool:
+        """
+        Runs the most worthwhile pursuit classifier's LM steps for the ancestors of the
+        current task (and the task itself), from the root downward.
+
+        Returns:
+            bool: Whether backtracking occurred.
+        """
+        #######################################################################################
+        ### LM STEP(S): Classify if ancestor tasks are (still) the most worthwhile pursuits ###
+        #######################################################################################
+
+        mwp_inputs = self._iter_most_worthwhile_pursuit_clf_inputs(env_state)
+        if cfg.MostWorthwhilePursuitClfCfg.EVALUATE_LEVELS_CONCURRENTLY:
+            # Start (the not-yet-speculated) runs for all depth levels at once so that
+            # the levels below can be classified with (at most) one round-trip
+            mwp_inputs = list(mwp_inputs)
+            for mwp_prompt_input_data, node_in_question in mwp_inputs:
+                key = (LmAgentName.MOST_WORTHWHILE_PURSUIT_CLF, node_in_question.id)
+                if key not in speculative_runs:
+                    speculative_runs[key] = self.lm_step_template.speculate(
+                        run_step=self.most_worthwhile_pursuit_clf.run,
+                        lm_agent_name=LmAgentName.MOST_WORTHWHILE_PURSUIT_CLF,
+                        prompt_input_data=mwp_prompt_input_data,
+                        streams_handler=self.streams_handler,
+                    )
+
+        # Classify from the root downward, backtracking at the first "drop" (any
+        # concurrently started runs of lower levels are then discarded)
+        for mwp_prompt_input_data, node_in_question in mwp_inputs:
+            # Compose lm step
+            lm_step = self.lm_step_template.compose(
+                run_step=self.most_worthwhile_pursuit_clf.run,
+                # NOTE: We pre-apply the node_to_update argument so that
+                # self._process_most_worthwhile_pursuit_clf_output matches the
+                # signature expected by lm_step_template.
+                process_output=functools.partial(
+                    self._process_most_worthwhile_pursuit_clf_output,
+                    node_to_update=node_in_question,
+                ),
+                lm_agent_name=LmAgentName.MOST_WORTHWHILE_PURSUIT_CLF,
+                cur_node_id=node_in_question.id,
+                prompt_input_data=mwp_prompt_input_data,
+                n_streams_to_handle=cfg.MostWorthwhilePursuitClfCfg.N_CALLS_FOR_VOTING,
+                speculative_run=speculative_runs.get(
+                    (LmAgentName.MOST_WORTHWHILE_PURSUIT_CLF, node_in_question.id)
+                ),
+            )
+
+            # Run lm step
+            cur_task_was_deemed_to_still_be_the_most_worthwhile_pursuit = await lm_step()
 
-                if cur_node_reconstructed_copy.id == self.traversal.cur_node.id:
-                    # We have reached and assessed the original current node, we are done
-                    break
+            # React to lm step result
+            if not cur_task_was_deemed_to_still_be_the_most_worthwhile_pursuit:
+                # Backtrack to the parent of this node in question
+                self.traversal.backtrack_to(node_in_question.parent_id)
+                return True
 
-            # Finally, if ancestors (including cur task in question) are still deemed
-            # worthwhile, indicate that no backtracking occurred
-            return False
+        # Finally, if ancestors (including cur task in question) are still deemed
+        # worthwhile, indicate that no backtracking occurred
+        return False
@@ -1,13 +1,33 @@
 from typing import Protocol
 
-from sr_olthad.framework.lms import GeminiInstructLm, OpenAIInstructLm
+from sr_olthad.framework.agents import LmRetryStrategy
+from sr_olthad.framework.lms import GeminiInstructLm, HttpClientPoolCfg, OpenAIInstructLm
+from sr_olthad.framework.rate_limits import LmRateLimits
 from sr_olthad.framework.schema import InstructLm
+from sr_olthad.schema import BacktrackerStrategy
 
 # General config
 
 
 class SrOlthadCfg:
     JSON_DUMPS_INDENT = 3
+    # Whether `SrOlthad`s constructed in a running event loop warm up their LMs' clients
+    # (i.e., open connections) in the background so the first step doesn't pay for it
+    WARM_UP_LM_CLIENTS: bool = True
+    # Connection pool settings of the (shared) HTTP clients of the LMs
+    LM_HTTP_CLIENT_POOL_CFG = HttpClientPoolCfg(
+        max_connections=100, max_keepalive_connections=20, keepalive_expiry_seconds=60.0
+    )
+    # How long the Gemini LMs keep the system prompts in Gemini's (explicit, billed)
+    # context cache (if None, they aren't explicitly cached)
+    GEMINI_CONTEXT_CACHE_TTL_SECONDS: float | None = None
+    # Limits on the LM requests, shared by all the LMs of the same provider/model in the
+    # process (i.e., across agents and `SrOlthad` instances). If None, no limits
+    OPENAI_RATE_LIMITS: LmRateLimits | None = LmRateLimits(max_concurrent_requests=32)
+    # (Gemini 2.5 Pro's free tier, see https://ai.google.dev/gemini-api/docs/rate-limits)
+    GEMINI_RATE_LIMITS: LmRateLimits | None = LmRateLimits(
+        max_concurrent_requests=5, requests_per_minute=5, tokens_per_minute=250_000
+    )
 
 
 # Agent configs
@@ -15,68 +35,187 @@ class SrOlthadCfg:
 
 class LmAgentConfig(Protocol):
     MAX_TRIES_TO_GET_VALID_LM_RESPONSE: int
+    # How to retry after an unparsable LM response (REPAIR: ask the LM to only correct its
+    # JSON in a new chat turn, REGENERATE: regenerate the whole response from scratch)
+    # NOTE: REPAIR is opt-in (i.e., the agents default to REGENERATE)
+    RETRY_STRATEGY: LmRetryStrategy
+    # Whether to have the LM's responses constrained to the agent's JSON schema (falls
+    # back to extracting the JSON from unconstrained responses if the LM doesn't support it)
+    # NOTE: Constrained responses are only the JSON (i.e., without any reasoning before it)
+    USE_STRUCTURED_OUTPUT: bool
+    # Whether to stop the LM's streams (cancelling the rest of the generation) as soon as
+    # they've emitted a final JSON object (i.e., followed by a closing code fence) that is
+    # valid as the agent's response (i.e., skipping whatever the LM would write after it)
+    STOP_STREAMS_AT_VALID_JSON: bool
     INSTRUCT_LM: InstructLm
     PROMPTS_VERSION: str
 
 
 class AttemptSummarizerCfg:
     MAX_TRIES_TO_GET_VALID_LM_RESPONSE: int = 5
+    RETRY_STRATEGY: LmRetryStrategy = LmRetryStrategy.REGENERATE
+    USE_STRUCTURED_OUTPUT: bool = False
+    STOP_STREAMS_AT_VALID_JSON: bool = False
     INSTRUCT_LM: InstructLm = OpenAIInstructLm(
-        model="gpt-4.1-2025-04-14"
+        model="gpt-4.1-2025-04-14",
+        pool_cfg=SrOlthadCfg.LM_HTTP_CLIENT_POOL_CFG,
+        rate_limits=SrOlthadCfg.OPENAI_RATE_LIMITS,
     )  # GeminiInstructLm(model='gemini-2.0-flash-lite') # GroqInstructLm(model="llama-3.3-70b-versatile")
     PROMPTS_VERSION = "1.0"
 
 
 class BacktrackerCfg:
+    # Whether to ask the successful completion, exhaustive effort, and partial success
+    # questions w/ one LM call each, as needed (CASCADED), or all at once (FUSED, i.e., w/
+    # one LM call and one copy of the prompt tokens, see FusedClfCfg)
+    STRATEGY: BacktrackerStrategy = BacktrackerStrategy.CASCADED
+    # Whether to speculatively start the classifiers' LM calls concurrently (consuming
+    # only the results that the backtracking decision tree needs)
+    SPECULATIVE_MODE: bool = False
+    # Cap on the number of LM calls (incl. voting calls) started speculatively per run
+    MAX_SPECULATIVE_LM_CALLS: int = 8
+    # Whether the classifiers start voting w/ ADAPTIVE_VOTING_MIN_N_CALLS calls (making the
+    # rest of their N_CALLS_FOR_VOTING calls only if these disagree) when their first votes
+    # have been unanimous at least ADAPTIVE_VOTING_MIN_UNANIMITY_RATE of the time
+    ADAPTIVE_VOTING: bool = False
+    ADAPTIVE_VOTING_MIN_N_CALLS: int = 2
+    ADAPTIVE_VOTING_MIN_UNANIMITY_RATE: float = 0.8
+    # JSON file where the classifiers' voting agreement history is persisted between runs
+    # (if None, the history starts empty at every run)
+    VOTING_AGREEMENT_HISTORY_FPATH: str | None = None
+    # In the classifiers' logprob classification mode (see USE_LOGPROB_CLASSIFICATION),
+    # whether to generate retrospectives only for the answers whose retrospectives are
+    # written to the OLTHAD (vs. for every answer)
+    LOGPROB_CLF_RETROSPECTIVES_ONLY_WHEN_WRITTEN: bool = True
+
     class ExhaustiveEffortClf:
         N_CALLS_FOR_VOTING: int = 1
         MAX_ASYNC_CALLS_FOR_VOTING: int = 5
+        # Whether to stop voting as soon as the pending calls can't change the winner (or,
+        # if EARLY_STOP_VOTE_SHARE isn't None, once the leader has that share of the votes)
+        EARLY_STOP_VOTING: bool = False
+        EARLY_STOP_VOTE_SHARE: float | None = None
+        # Whether to sample the votes in one request (for the LMs that support it), paying
+        # for the prompt once (NOTE: then, early stopping can only skip re-tries)
+        SAMPLE_VOTES_IN_ONE_REQUEST: bool = False
         MAX_TRIES_TO_GET_VALID_LM_RESPONSE: int = 7
+        RETRY_STRATEGY: LmRetryStrategy = LmRetryStrategy.REGENERATE
+        USE_STRUCTURED_OUTPUT: bool = False
+        STOP_STREAMS_AT_VALID_JSON: bool = False
+        # Whether to classify from the LM's logprobs for the answer letter only (vs. from a
+        # reasoned JSON response), for the LMs that expose them (else, falls back to that)
+        USE_LOGPROB_CLASSIFICATION: bool = False
         INSTRUCT_LM: InstructLm = OpenAIInstructLm(
-            model="gpt-4.1-2025-04-14"
+            model="gpt-4.1-2025-04-14",
+            pool_cfg=SrOlthadCfg.LM_HTTP_CLIENT_POOL_CFG,
+            rate_limits=SrOlthadCfg.OPENAI_RATE_LIMITS,
         )  # GeminiInstructLm(model='gemini-2.0-flash-lite') # GroqInstructLm(model="llama-3.3-70b-versatile")
         PROMPTS_VERSION = "1.0"
 
     class MostWorthwhilePursuitClfCfg:
         N_CALLS_FOR_VOTING: int = 1
         MAX_ASYNC_CALLS_FOR_VOTING: int = 5
+        EARLY_STOP_VOTING: bool = False
+        EARLY_STOP_VOTE_SHARE: float | None = None
+        SAMPLE_VOTES_IN_ONE_REQUEST: bool = False
+        # Whether to classify all depth levels concurrently (vs. one level at a time)
+        EVALUATE_LEVELS_CONCURRENTLY: bool = False
         MAX_TRIES_TO_GET_VALID_LM_RESPONSE: int = 5
+        RETRY_STRATEGY: LmRetryStrategy = LmRetryStrategy.REGENERATE
+        USE_STRUCTURED_OUTPUT: bool = False
+        STOP_STREAMS_AT_VALID_JSON: bool = False
+        USE_LOGPROB_CLASSIFICATION: bool = False
         INSTRUCT_LM: InstructLm = OpenAIInstructLm(
-            model="gpt-4.1-2025-04-14"
+            model="gpt-4.1-2025-04-14",
+            pool_cfg=SrOlthadCfg.LM_HTTP_CLIENT_POOL_CFG,
+            rate_limits=SrOlthadCfg.OPENAI_RATE_LIMITS,
         )  # GeminiInstructLm(model='gemini-2.0-flash-lite') # GroqInstructLm(model="llama-3.3-70b-versatile")
         PROMPTS_VERSION = "1.0"
 
     class PartialSuccessClfCfg:
         N_CALLS_FOR_VOTING: int = 1
         MAX_ASYNC_CALLS_FOR_VOTING: int = 5
+        EARLY_STOP_VOTING: bool = False
+        EARLY_STOP_VOTE_SHARE: float | None = None
+        SAMPLE_VOTES_IN_ONE_REQUEST: bool = False
         MAX_TRIES_TO_GET_VALID_LM_RESPONSE: int = 7
+        RETRY_STRATEGY: LmRetryStrategy = LmRetryStrategy.REGENERATE
+        USE_STRUCTURED_OUTPUT: bool = False
+        STOP_STREAMS_AT_VALID_JSON: bool = False
+        USE_LOGPROB_CLASSIFICATION: bool = False
         INSTRUCT_LM: InstructLm = OpenAIInstructLm(
-            model="gpt-4.1-2025-04-14"
+            model="gpt-4.1-2025-04-14",
+            pool_cfg=SrOlthadCfg.LM_HTTP_CLIENT_POOL_CFG,
+            rate_limits=SrOlthadCfg.OPENAI_RATE_LIMITS,
         )  # GeminiInstructLm(model='gemini-2.0-flash-lite') # GroqInstructLm(model="llama-3.3-70b-versatile")
         PROMPTS_VERSION = "1.0"
 
     class SuccessfulCompletionClfCfg:
         N_CALLS_FOR_VOTING: int = 1
         MAX_ASYNC_CALLS_FOR_VOTING: int = 5
+        EARLY_STOP_VOTING: bool = False
+        EARLY_STOP_VOTE_SHARE: float | None = None
+        SAMPLE_VOTES_IN_ONE_REQUEST: bool = False
+        MAX_TRIES_TO_GET_VALID_LM_RESPONSE: int = 7
+        RETRY_STRATEGY: LmRetryStrategy = LmRetryStrategy.REGENERATE
+        USE_STRUCTURED_OUTPUT: bool = False
+        STOP_STREAMS_AT_VALID_JSON: bool = False
+        USE_LOGPROB_CLASSIFICATION: bool = False
+        INSTRUCT_LM: InstructLm = OpenAIInstructLm(
+            model="gpt-4.1-2025-04-14",
+            pool_cfg=SrOlthadCfg.LM_HTTP_CLIENT_POOL_CFG,
+            rate_limits=SrOlthadCfg.OPENAI_RATE_LIMITS,
+        )  # GeminiInstructLm(model='gemini-2.0-flash-lite') # GroqInstructLm(model="llama-3.3-70b-versatile")
+        PROMPTS_VERSION = "1.0"
+
+    class FusedClfCfg:
         MAX_TRIES_TO_GET_VALID_LM_RESPONSE: int = 7
+        RETRY_STRATEGY: LmRetryStrategy = LmRetryStrategy.REGENERATE
+        USE_STRUCTURED_OUTPUT: bool = False
+        STOP_STREAMS_AT_VALID_JSON: bool = False
         INSTRUCT_LM: InstructLm = OpenAIInstructLm(
-            model="gpt-4.1-2025-04-14"
+            model="gpt-4.1-2025-04-14",
+            pool_cfg=SrOlthadCfg.LM_HTTP_CLIENT_POOL_CFG,
+            rate_limits=SrOlthadCfg.OPENAI_RATE_LIMITS,
         )  # GeminiInstructLm(model='gemini-2.0-flash-lite') # GroqInstructLm(model="llama-3.3-70b-versatile")
         PROMPTS_VERSION = "1.0"
 
 
 class ForgetterCfg:
     MAX_TRIES_TO_GET_VALID_LM_RESPONSE: int = 5
+    RETRY_STRATEGY: LmRetryStrategy = LmRetryStrategy.REGENERATE
+    USE_STRUCTURED_OUTPUT: bool = False
+    STOP_STREAMS_AT_VALID_JSON: bool = False
     INSTRUCT_LM: InstructLm = GeminiInstructLm(
-        model="gemini-2.5-pro-exp-03-25"
+        model="gemini-2.5-pro-exp-03-25",
+        context_cache_ttl_seconds=SrOlthadCfg.GEMINI_CONTEXT_CACHE_TTL_SECONDS,
+        rate_limits=SrOlthadCfg.GEMINI_RATE_LIMITS,
     )  # OpenAIInstructLm(model="gpt-4.1-2025-04-14")  # GroqInstructLm(model="llama-3.3-70b-versatile")
     PROMPTS_VERSION = "1.0"
 
 
 class PlannerCfg:
     MAX_TRIES_TO_GET_VALID_LM_RESPONSE: int = 5
+    RETRY_STRATEGY: LmRetryStrategy = LmRetryStrategy.REGENERATE
+    USE_STRUCTURED_OUTPUT: bool = False
+    STOP_STREAMS_AT_VALID_JSON: bool = False
     INSTRUCT_LM: InstructLm = OpenAIInstructLm(
-        model="gpt-4.1-2025-04-14"
+        model="gpt-4.1-2025-04-14",
         # model="o4-mini-2025-04-16"
+        pool_cfg=SrOlthadCfg.LM_HTTP_CLIENT_POOL_CFG,
+        rate_limits=SrOlthadCfg.OPENAI_RATE_LIMITS,
     )  # GeminiInstructLm(model='gemini-2.0-flash-lite') # GroqInstructLm(model="llama-3.3-70b-versatile")
     PROMPTS_VERSION = "1.0"
+
+
+# All LM agent configs (e.g., to iterate over their `INSTRUCT_LM`s)
+LM_AGENT_CFGS: tuple[type[LmAgentConfig], ...] = (
+    AttemptSummarizerCfg,
+    BacktrackerCfg.ExhaustiveEffortClf,
+    BacktrackerCfg.FusedClfCfg,
+    BacktrackerCfg.MostWorthwhilePursuitClfCfg,
+    BacktrackerCfg.PartialSuccessClfCfg,
+    BacktrackerCfg.SuccessfulCompletionClfCfg,
+    ForgetterCfg,
+    PlannerCfg,
+)
@@ -2,5 +2,19 @@ from sr_olthad.framework.agents.instruct_lm import (
     InstructLmAgent,
     InstructLmAgentOutput,
     InstructLmAgentRunMethod,
+    InstructLmAgentStats,
     LmRetryHandler,
+    LmRetryInfo,
+    LmRetryStrategy,
+)
+from sr_olthad.framework.agents.logprob_clf import (
+    LogprobClfAgent,
+    LogprobClfAgentOutput,
+    LogprobClfAgentStats,
+    get_option_probabilities,
+)
+from sr_olthad.framework.agents.voting import (
+    AdaptiveVotingPolicy,
+    VotingAgreementCounts,
+    VotingAgreementHistory,
 )
@@ -1,35 +1,159 @@
 import asyncio
 import logging
+import re
 import warnings
 from collections import Counter
+from collections.abc import Coroutine
+from dataclasses import dataclass, replace
+from enum import StrEnum
 from functools import partial
-from json import JSONDecodeError
-from typing import Generic, Protocol, TypeVar
+from typing import Any, Generic, Protocol, TypeVar
 
-from pydantic import BaseModel, ValidationError
+from pydantic import BaseModel
 
+from sr_olthad.framework.agents.voting import AdaptiveVotingPolicy
 from sr_olthad.framework.schema import (
+    INSTRUCT_LM_CALL_CONTEXT,
     Agent,
     InstructLm,
+    InstructLmCallContext,
     InstructLmChatRole,
     InstructLmMessage,
+    LmErrorKind,
     LmStreamHandler,
     LmStreamsHandler,
+    StopLmStream,
 )
 from sr_olthad.framework.utils import (
+    StreamingJsonDetector,
     call_or_await,
     detect_extract_and_parse_json_from_text,
     get_semaphore_bound_coroutine,
 )
 
 
-class LmRetryHandler(Protocol):
-    def __call__(self, idx: int, msg: str) -> None: ...
+class LmRetryStrategy(StrEnum):
+    """
+    How an InstructLmAgent retries after an unparsable (or invalid) LM response.
+    """
+
+    REGENERATE = "regenerate"  # Regenerates a response to the same messages from scratch
+    # Asks the LM to correct its response (in a new turn of the chat), i.e., only to
+    # (re)generate the corrected JSON rather than the full response (e.g., its reasoning)
+    REPAIR = "repair"
+
+
+_REPAIR_PROMPT_TEMPLATE = (
+    "Your response couldn't be parsed as the JSON I asked for: {error}\n\n"
+    "Respond with only the corrected JSON."
+)
 
 
 LmJsonOutputModelT = TypeVar("LmJsonOutputModelT", bound=BaseModel)
 
 
+@dataclass
+class InstructLmAgentStats:
+    """
+    Counters of an InstructLmAgent's attempts at getting parsable LM responses.
+
+    Attributes:
+        n_attempts (int): Number of (unstructured) responses.
+        n_unparsable (int): Number of those that were unparsable.
+        n_structured_attempts (int): Number of structured-output responses.
+        n_structured_unparsable (int): Number of those that were unparsable.
+        n_structured_output_fallbacks (int): Number of times structured output was
+            turned off because the LM errored with it.
+        n_transient_errors (int): Number of LM calls that failed with transient errors
+            (e.g., rate limits).
+        n_fatal_errors (int): Number of LM calls that failed with fatal errors.
+        n_other_errors (int): Number of LM calls that failed with unknown errors.
+        backoff_seconds (float): Total time spent backing off before retries.
+        n_voting_calls_saved (int): Number of voting calls cancelled (or never started)
+            because the vote was already decided (see `early_stop_voting` and
+            `adaptive_voting`).
+        n_adaptive_voting_expansions (int): Number of adaptive votings whose first votes
+            disagreed (so the rest of the calls were made).
+    """
+
+    n_attempts: int = 0
+    n_unparsable: int = 0
+    n_structured_attempts: int = 0
+    n_structured_unparsable: int = 0
+    n_structured_output_fallbacks: int = 0
+    n_transient_errors: int = 0
+    n_fatal_errors: int = 0
+    n_other_errors: int = 0
+    backoff_seconds: float = 0.0
+    n_voting_calls_saved: int = 0
+    n_adaptive_voting_expansions: int = 0
+
+    def record_attempt(self, is_structured: bool, is_parsable: bool) -> None:
+        if is_structured:
+            self.n_structured_attempts += 1
+            self.n_structured_unparsable += not is_parsable
+        else:
+            self.n_attempts += 1
+            self.n_unparsable += not is_parsable
+
+    def estimate_n_retries_saved(self, unparsable_rate: float | None = None) -> float | None:
+        """
+        Estimates how many retries structured output saved, i.e., how many more of the
+        structured-output responses would have been unparsable at the unparsable rate of
+        the unstructured responses.
+
+        Args:
+            unparsable_rate (float | None): The unparsable rate of unstructured responses
+                (e.g., measured in a previous run). If None, the one measured here.
+
+        Returns:
+            float | None: The estimate (or None if there is no unparsable rate to use).
+        """
+        if unparsable_rate is None:
+            if self.n_attempts == 0:
+                return None
+            unparsable_rate = self.n_unparsable / self.n_attempts
+        expected_n_unparsable = unparsable_rate * self.n_structured_attempts
+        return expected_n_unparsable - self.n_structured_unparsable
+
+    def record_error(self, error_kind: LmErrorKind) -> None:
+        if error_kind == LmErrorKind.TRANSIENT:
+            self.n_transient_errors += 1
+        elif error_kind == LmErrorKind.FATAL:
+            self.n_fatal_errors += 1
+        elif error_kind == LmErrorKind.OTHER:
+            self.n_other_errors += 1
+        # (Invalid responses are counted by `record_attempt`)
+
+
+@dataclass(frozen=True)
+class LmRetryInfo:
+    """
+    Info about a retry of an InstructLmAgent (passed to `LmRetryHandler`s).
+
+    Attributes:
+        error_kind (LmErrorKind): The kind of error that is being retried.
+        delay_seconds (float): The backoff delay before the retry (0 if retried right
+            away).
+        n_tries_left (int): The number of tries left to get a parsable response.
+        n_transient_retries_left (int): The number of retries left after transient
+            errors.
+        stats (InstructLmAgentStats): A snapshot of the agent's counters.
+    """
+
+    error_kind: LmErrorKind
+    delay_seconds: float
+    n_tries_left: int
+    n_transient_retries_left: int
+    stats: InstructLmAgentStats
+
+
+class LmRetryHandler(Protocol):
+    def __call__(
+        self, idx: int, msg: str, retry_info: LmRetryInfo | None = None
+    ) -> None: ...
+
+
 class InstructLmAgentOutput(BaseModel, Generic[LmJsonOutputModelT]):
     """
     Output object for an InstructLmAgent.
@@ -59,6 +183,7 @@ class InstructLmAgentRunMethod(Protocol):
         self,
         input_messages: list[InstructLmMessage],
         retry_callback: LmRetryHandler | None = None,
+        streams_handler: LmStreamsHandler | None = None,
         **kwargs,
     ) -> InstructLmAgentOutput[LmJsonOutputModelT]:
         pass
@@ -111,6 +236,13 @@ class InstructLmAgent(Agent, Generic[LmJsonOutputModelT]):
         reason_field: str | None = None,
         aggregate_winning_vote_reasons: AggregateWinningVoteReasons = _default_aggregate_winning_vote_reasons,
         streams_handler: LmStreamsHandler | None = None,
+        stop_streams_at_valid_json: bool = False,
+        use_structured_output: bool = False,
+        retry_strategy: LmRetryStrategy = LmRetryStrategy.REGENERATE,
+        early_stop_voting: bool = False,
+        early_stop_vote_share: float | None = None,
+        sample_votes_in_one_request: bool = False,
+        adaptive_voting: AdaptiveVotingPolicy | None = None,
         logger: logging.Logger | None = None,
     ):
         super().__init__()
@@ -141,6 +273,26 @@ class InstructLmAgent(Agent, Generic[LmJsonOutputModelT]):
         self.reason_field = reason_field
         self.aggregate_winning_vote_reasons = aggregate_winning_vote_reasons
         self.streams_handler = streams_handler
+        # Whether to stop the LM streams (i.e., cancel the rest of the generations) as
+        # soon as they've emitted a final JSON object (i.e., followed by a closing code
+        # fence) that is valid as the response_json_model
+        self.stop_streams_at_valid_json = stop_streams_at_valid_json
+        # Whether to pass the response_json_model to the InstructLm for it to constrain its
+        # responses to (for the InstructLms that support it, see `InstructLm.generate`)
+        self.use_structured_output = use_structured_output
+        self.retry_strategy = retry_strategy
+        # Whether to stop voting (cancelling the pending calls) as soon as no pending call
+        # can change the winner, or, if early_stop_vote_share isn't None, as soon as the
+        # leading vote has at least that share of the (at least 2) votes so far
+        self.early_stop_voting = early_stop_voting
+        self.early_stop_vote_share = early_stop_vote_share
+        # Whether to sample the votes' (first) responses with one `generate_many` call
+        # (i.e., in one request paying for the prompt once, for the LMs that support it)
+        self.sample_votes_in_one_request = sample_votes_in_one_request
+        # If not None, how to adapt the number of voting calls to the agent's agreement
+        # history (with num_calls_for_voting as the max)
+        self.adaptive_voting = adaptive_voting
+        self.stats = InstructLmAgentStats()
         self.logger = logger
 
     def _warn(self, msg: str) -> None:
@@ -149,33 +301,264 @@ class InstructLmAgent(Agent, Generic[LmJsonOutputModelT]):
         else:
             warnings.warn(msg, stacklevel=2)
 
+    def _get_attempt_stream_handler(
+        self, stream_handler: LmStreamHandler | None
+    ) -> LmStreamHandler | None:
+        """
+        Gets the stream handler for an attempt, i.e., if `stop_streams_at_valid_json`,
+        wraps the stream handler (if any) so that the stream is stopped once it has
+        emitted a final JSON object that is valid as the response_json_model (see
+        `StreamingJsonDetector`).
+        """
+        if not self.stop_streams_at_valid_json:
+            return stream_handler
+        json_detector = StreamingJsonDetector(self.output_data_model)
+
+        def json_detecting_stream_handler(chunk_str: str) -> None:
+            if stream_handler is not None:
+                stream_handler(chunk_str)
+            if json_detector.feed(chunk_str):
+                raise StopLmStream
+
+        return json_detecting_stream_handler
+
+    def _is_structured_output_rejection(self, error: Exception) -> bool:
+        """
+        Whether an error of a structured-output call is the LM rejecting structured output,
+        i.e., not supporting it (e.g., a `NotImplementedError`, or a `TypeError` for the
+        unexpected `response_json_model` kwarg) or a bad request about the schema.
+        """
+        if isinstance(error, NotImplementedError):
+            return True
+        if isinstance(error, TypeError):  # (Any other TypeError is a bug to surface)
+            return "response_json_model" in str(error)
+        status_code = getattr(error, "status_code", getattr(error, "code", None))
+        return status_code == 400 and any(
+            term in str(error).lower() for term in ("response_format", "schema")
+        )
+
+    async def _generate(
+        self,
+        input_messages: list[InstructLmMessage],
+        stream_handler: LmStreamHandler | None = None,
+        **kwargs,  # kwargs passed through to the InstructLm.generate method
+    ) -> tuple[str, bool]:
+        """
+        Gets an LM response, with structured output if enabled (falling back to without
+        it for good if the LM rejects it, e.g., because it doesn't support it or the
+        schema, see `_is_structured_output_rejection`).
+
+        Returns:
+            tuple[str, bool]: The response and whether it was a structured output.
+        """
+        if self.use_structured_output:
+            try:
+                response = await self.instruct_lm.generate(
+                    messages=input_messages,
+                    stream_handler=self._get_attempt_stream_handler(stream_handler),
+                    response_json_model=self.output_data_model,
+                    **kwargs,
+                )
+                return response, True
+            except Exception as e:
+                if not self._is_structured_output_rejection(e):
+                    raise  # (Handled as usual, still with structured output)
+                self.use_structured_output = False
+                self.stats.n_structured_output_fallbacks += 1
+                self._warn(f"Structured output failed ({e}), falling back to without it")
+        response = await self.instruct_lm.generate(
+            messages=input_messages,
+            stream_handler=self._get_attempt_stream_handler(stream_handler),
+            **kwargs,
+        )
+        return response, False
+
+    def _is_n_completions_rejection(self, error: Exception) -> bool:
+        """
+        Whether an error of a `generate_many` call is the LM rejecting sampling n responses
+        in one request, i.e., not supporting it or a bad request about the `n` parameter.
+        """
+        if isinstance(error, NotImplementedError | TypeError):
+            return True
+        status_code = getattr(error, "status_code", getattr(error, "code", None))
+        return status_code == 400 and re.search(r"\bn\b", str(error)) is not None
+
+    async def _generate_many(
+        self,
+        sample_idxs: range,
+        input_messages: list[InstructLmMessage],
+        streams_handler: LmStreamsHandler | None = None,
+        **kwargs,  # kwargs passed through to the InstructLm.generate_many method
+    ) -> list[tuple[str, bool]] | None:
+        """
+        Gets the responses of the voting samples of `sample_idxs` with one
+        `InstructLm.generate_many` call (i.e., in one request, for the LMs that support it),
+        with structured output if enabled.
+
+        Returns:
+            list[tuple[str, bool]] | None: The responses and whether they were structured
+                outputs (or None if the call failed with a retryable error or because the
+                LM rejected the request, e.g., sampling n responses, in which case the
+                samples are to be generated separately, with the usual error handling).
+
+        Raises:
+            Exception: The error of the call if it is fatal otherwise (e.g., an
+                authentication error).
+        """
+        samples_streams_handler = None
+        if streams_handler is not None or self.stop_streams_at_valid_json:
+            stream_handlers = [
+                self._get_attempt_stream_handler(
+                    partial(streams_handler, stream_idx=idx) if streams_handler else None
+                )
+                for idx in sample_idxs
+            ]
+
+            def samples_streams_handler(chunk_str: str, stream_idx: int | None = None):
+                # (The stream_idx is the index of the response amongst the n responses)
+                if stream_handlers[stream_idx] is not None:
+                    stream_handlers[stream_idx](chunk_str)
+
+        if self.use_structured_output:
+            kwargs["response_json_model"] = self.output_data_model
+        # (The voting_sample_idx of the first of the samples, see `generate_many`)
+        call_context = InstructLmCallContext(voting_sample_idx=sample_idxs.start)
+        call_context_token = INSTRUCT_LM_CALL_CONTEXT.set(call_context)
+        try:
+            responses = await self.instruct_lm.generate_many(
+                input_messages,
+                len(sample_idxs),
+                samples_streams_handler,
+                max_concurrent_calls=self.max_async_calls,
+                **kwargs,
+            )
+        except Exception as e:
+            error_kind = self.instruct_lm.classify_error(e)
+            if (
+                error_kind == LmErrorKind.FATAL
+                and not self._is_n_completions_rejection(e)
+                and not (
+                    self.use_structured_output and self._is_structured_output_rejection(e)
+                )
+            ):
+                raise
+            self._warn(
+                f"Sampling the votes in one request failed ({error_kind} error: {e}), "
+                "sampling separately"
+            )
+            return None
+        finally:
+            INSTRUCT_LM_CALL_CONTEXT.reset(call_context_token)
+        return [(response, self.use_structured_output) for response in responses]
+
     async def _get_response_and_parse_with_retry(
         self,
         input_messages: list[InstructLmMessage],
         retry_callback: LmRetryHandler | None = None,
-        stream_handler: LmStreamsHandler | None = None,
+        stream_handler: LmStreamHandler | None = None,
         call_idx: int = 0,
+        first_response: tuple[str, bool] | None = None,
         **kwargs,  # kwargs passed through to the InstructLm.generate method
-    ) -> tuple[LmJsonOutputModelT, str]:
+    ) -> tuple[LmJsonOutputModelT, list[InstructLmMessage]]:
+        """
+        Gets an LM response and parses it, retrying as per the retry strategy after
+        unparsable responses (or unknown errors), and as per the LM's backoff policy after
+        transient errors (e.g., rate limits). Fatal errors (e.g., authentication errors)
+        aren't retried.
+
+        If `first_response` (i.e., a response and whether it was a structured output) is
+        provided (e.g., from `InstructLm.generate_many`), it is used as the first attempt's
+        response.
+
+        Returns:
+            tuple[LmJsonOutputModelT, list[InstructLmMessage]]: The parsed response and the
+                messages of the chat that led to it (incl. the response, and any repair
+                turns).
+        """
+        attempt_messages = input_messages
         tries_left = self.max_tries_to_get_parsable_response
+        n_transient_retries = 0
         while tries_left > 0:
+            call_context = InstructLmCallContext(
+                voting_sample_idx=call_idx if self.num_calls_for_voting > 1 else None,
+                attempt_idx=self.max_tries_to_get_parsable_response - tries_left,
+            )
+            call_context_token = INSTRUCT_LM_CALL_CONTEXT.set(call_context)
+            unparsable_response = None
             try:
-                response = await self.instruct_lm.generate(
-                    messages=input_messages, stream_handler=stream_handler, **kwargs
-                )
-                output_data = detect_extract_and_parse_json_from_text(
-                    text=response, model_to_extract=self.output_data_model
-                )
-                return output_data, response
-            # TODO: Change `Exception` to specific exceptions
-            except (ValidationError, JSONDecodeError, Exception) as e:
-                if tries_left == 1:
-                    raise e
-                tries_left -= 1
-                msg = f"Failed to get a parsable response: {e}, {tries_left} tries remaining"
+                if first_response is not None:
+                    (response, is_structured), first_response = first_response, None
+                else:
+                    response, is_structured = await self._generate(
+                        attempt_messages, stream_handler, **kwargs
+                    )
+                try:
+                    output_data = detect_extract_and_parse_json_from_text(
+                        text=response, model_to_extract=self.output_data_model
+                    )
+                except ValueError:  # (Incl. pydantic's ValidationError)
+                    self.stats.record_attempt(is_structured, is_parsable=False)
+                    unparsable_response = response
+                    raise
+                self.stats.record_attempt(is_structured, is_parsable=True)
+                return output_data, attempt_messages + [
+                    InstructLmMessage(role=InstructLmChatRole.ASSISTANT, content=response)
+                ]
+            except Exception as e:
+                if unparsable_response is not None:
+                    error_kind = LmErrorKind.INVALID_RESPONSE
+                else:
+                    error_kind = self.instruct_lm.classify_error(e)
+                    self.stats.record_error(error_kind)
+                if error_kind == LmErrorKind.FATAL:
+                    raise
+                backoff_policy = self.instruct_lm.backoff_policy
+                if error_kind == LmErrorKind.TRANSIENT:
+                    # Back off (w/out using up a try, since the LM didn't get to respond)
+                    if n_transient_retries == backoff_policy.max_retries:
+                        raise
+                    delay_seconds = backoff_policy.get_delay_seconds(
+                        retry_idx=n_transient_retries,
+                        retry_after_seconds=self.instruct_lm.get_retry_after_seconds(e),
+                    )
+                    n_transient_retries += 1
+                    msg = f"LM call failed: {e}, retrying in {delay_seconds:.1f}s"
+                else:  # Retry right away
+                    if tries_left == 1:
+                        raise
+                    tries_left -= 1
+                    delay_seconds = 0.0
+                    msg = f"Failed to get a parsable response: {e}, {tries_left} tries remaining"
+                if (
+                    self.retry_strategy == LmRetryStrategy.REPAIR
+                    and unparsable_response is not None
+                ):
+                    # (Always repairing the latest response, so the chat doesn't keep growing)
+                    attempt_messages = input_messages + [
+                        InstructLmMessage(
+                            role=InstructLmChatRole.ASSISTANT, content=unparsable_response
+                        ),
+                        InstructLmMessage(
+                            role=InstructLmChatRole.USER,
+                            content=_REPAIR_PROMPT_TEMPLATE.format(error=e),
+                        ),
+                    ]
                 self._warn(msg)
                 if retry_callback is not None:
-                    await call_or_await(retry_callback, call_idx, msg)
+                    retry_info = LmRetryInfo(
+                        error_kind=error_kind,
+                        delay_seconds=delay_seconds,
+                        n_tries_left=tries_left,
+                        n_transient_retries_left=backoff_policy.max_retries
+                        - n_transient_retries,
+                        stats=replace(self.stats),
+                    )
+                    await call_or_await(retry_callback, call_idx, msg, retry_info)
+                if delay_seconds > 0:
+                    self.stats.backoff_seconds += delay_seconds
+                    await asyncio.sleep(delay_seconds)
+            finally:
+                INSTRUCT_LM_CALL_CONTEXT.reset(call_context_token)
 
     async def _run(
         self,
@@ -183,35 +566,105 @@ class InstructLmAgent(Agent, Generic[LmJsonOutputModelT]):
         retry_callback: LmRetryHandler | None = None,
         stream_handler: LmStreamHandler | None = None,
         call_idx: int = 0,
+        first_response: tuple[str, bool] | None = None,
         **kwargs,  # kwargs passed through to the InstructLm.generate method
     ) -> InstructLmAgentOutput[LmJsonOutputModelT]:
-        # Get parsed response
-        output_data, response = await self._get_response_and_parse_with_retry(
+        # Get parsed response (and the messages of the chat that led to it)
+        output_data, messages = await self._get_response_and_parse_with_retry(
             input_messages=input_messages,
             retry_callback=retry_callback,
             stream_handler=stream_handler,
             call_idx=call_idx,
+            first_response=first_response,
             **kwargs,
         )
-        # Add assistant message to input message
-        messages = input_messages + [
-            InstructLmMessage(role=InstructLmChatRole.ASSISTANT, content=response)
-        ]
         # Return output
         return InstructLmAgentOutput(data=output_data, messages=messages)
 
-    async def _run_with_voting(
+    def _is_vote_decided(self, vote_counts: Counter, n_pending_calls: int) -> bool:
+        if not vote_counts:
+            return False
+        (_, n_leading_votes), *runner_up = vote_counts.most_common(2)
+        n_runner_up_votes = runner_up[0][1] if runner_up else 0
+        if n_leading_votes > n_runner_up_votes + n_pending_calls:
+            return True  # (The pending calls can no longer change the winner)
+        n_votes = sum(vote_counts.values())
+        return (
+            self.early_stop_vote_share is not None
+            and n_votes >= 2
+            and n_leading_votes / n_votes >= self.early_stop_vote_share
+        )
+
+    async def _gather_until_vote_is_decided(
+        self,
+        coroutines: list[Coroutine[Any, Any, InstructLmAgentOutput[LmJsonOutputModelT]]],
+        prior_vote_counts: Counter | None = None,
+    ) -> list[Exception | InstructLmAgentOutput[LmJsonOutputModelT] | None]:
+        """
+        Like `asyncio.gather(*coroutines, return_exceptions=True)`, but tallies the votes
+        (on top of the `prior_vote_counts`, if any) as the calls complete and cancels the
+        pending calls once the vote is decided.
+
+        Returns:
+            list[Exception | InstructLmAgentOutput[LmJsonOutputModelT] | None]: The
+                outputs (or exceptions) in the order of the coroutines (None for the
+                cancelled calls).
+        """
+        tasks = [asyncio.create_task(coroutine) for coroutine in coroutines]
+        outputs: list[Exception | InstructLmAgentOutput[LmJsonOutputModelT] | None]
+        outputs = [None] * len(tasks)
+        vote_counts = Counter(prior_vote_counts)
+        pending_tasks = set(tasks)
+        try:
+            while pending_tasks:
+                done_tasks, pending_tasks = await asyncio.wait(
+                    pending_tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done_tasks:
+                    task_idx = tasks.index(task)
+                    if task.exception() is not None:
+                        outputs[task_idx] = task.exception()
+                        continue
+                    outputs[task_idx] = task.result()
+                    vote_counts[getattr(task.result().data, self.vote_field)] += 1
+                if self._is_vote_decided(vote_counts, len(pending_tasks)):
+                    break
+        finally:
+            for task in pending_tasks:
+                task.cancel()
+            await asyncio.gather(*pending_tasks, return_exceptions=True)
+        self.stats.n_voting_calls_saved += len(pending_tasks)
+        return outputs
+
+    async def _sample_votes(
         self,
+        sample_idxs: range,
         input_messages: list[InstructLmMessage],
         retry_callback: LmRetryHandler | None = None,
         streams_handler: LmStreamsHandler | None = None,
+        prior_vote_counts: Counter | None = None,
         **kwargs,  # kwargs passed through to the InstructLm.generate method
-    ) -> InstructLmAgentOutput[LmJsonOutputModelT]:
+    ) -> list[Exception | InstructLmAgentOutput[LmJsonOutputModelT] | None]:
+        """
+        Runs the voting samples of `sample_idxs` (if early stopping, only until the vote,
+        incl. the `prior_vote_counts`, is decided).
+
+        Returns:
+            list[Exception | InstructLmAgentOutput[LmJsonOutputModelT] | None]: The
+                outputs (or exceptions) of the samples (None for the cancelled ones).
+        """
+        # If enabled, sample the votes' first responses in one request
+        first_responses = None
+        if self.sample_votes_in_one_request:
+            first_responses = await self._generate_many(
+                sample_idxs, input_messages, streams_handler, **kwargs
+            )
+
         # Prepare coroutines
         semaphore = asyncio.Semaphore(self.max_async_calls)
         coroutines = []
-        for coroutine_idx in range(self.num_calls_for_voting):
-            if self.streams_handler is not None:
+        for coroutine_idx in sample_idxs:
+            if streams_handler is not None:
                 # Turn it into a single stream handler by binding the stream_idx
                 stream_handler = partial(streams_handler, stream_idx=coroutine_idx)
             else:
@@ -225,20 +678,69 @@ class InstructLmAgent(Agent, Generic[LmJsonOutputModelT]):
                 retry_callback=retry_callback,
                 stream_handler=stream_handler,
                 call_idx=coroutine_idx,
+                first_response=(
+                    first_responses[coroutine_idx - sample_idxs.start]
+                    if first_responses is not None
+                    else None
+                ),
                 **kwargs,
             )
             coroutines.append(semaphore_bounded_coroutine)
 
-        # Await and gather coroutines
-        outputs: list[Exception | InstructLmAgentOutput[LmJsonOutputModelT]]
-        outputs = await asyncio.gather(*coroutines, return_exceptions=True)
+        # Await coroutines (if early stopping, only until the vote is decided)
+        if self.early_stop_voting:
+            return await self._gather_until_vote_is_decided(coroutines, prior_vote_counts)
+        return await asyncio.gather(*coroutines, return_exceptions=True)
 
-        # Filter out exceptions and count the "votes"
+    async def _run_with_voting(
+        self,
+        input_messages: list[InstructLmMessage],
+        retry_callback: LmRetryHandler | None = None,
+        streams_handler: LmStreamsHandler | None = None,
+        **kwargs,  # kwargs passed through to the InstructLm.generate method
+    ) -> InstructLmAgentOutput[LmJsonOutputModelT]:
+        # Sample the votes (if adaptive, possibly only a few first, making the rest of the
+        # calls only if these disagree)
+        n_initial_calls = self.num_calls_for_voting
+        if self.adaptive_voting is not None:
+            n_initial_calls = self.adaptive_voting.get_n_initial_calls(n_initial_calls)
+        outputs = await self._sample_votes(
+            range(n_initial_calls), input_messages, retry_callback, streams_handler, **kwargs
+        )
+        if self.adaptive_voting is not None:
+            initial_votes = [
+                getattr(output.data, self.vote_field)
+                for output in outputs
+                if isinstance(output, InstructLmAgentOutput)
+            ]
+            are_initial_votes_unanimous = self.adaptive_voting.record_first_votes(
+                initial_votes
+            )
+            n_remaining_calls = self.num_calls_for_voting - n_initial_calls
+            if n_remaining_calls > 0 and are_initial_votes_unanimous:
+                self.stats.n_voting_calls_saved += n_remaining_calls
+                outputs += [None] * n_remaining_calls
+            elif n_remaining_calls > 0:
+                self.stats.n_adaptive_voting_expansions += 1
+                outputs += await self._sample_votes(
+                    range(n_initial_calls, self.num_calls_for_voting),
+                    input_messages,
+                    retry_callback,
+                    streams_handler,
+                    prior_vote_counts=Counter(initial_votes),
+                    **kwargs,
+                )
+
+        # Filter out exceptions (and cancelled calls) and count the "votes"
         all_messages = []
         valid_outputs: list[InstructLmAgentOutput[LmJsonOutputModelT]] = []
         exceptions = []
         vote_counts = Counter()
+        n_calls_saved = 0
         for output in outputs:
+            if output is None:
+                n_calls_saved += 1
+                continue
             if isinstance(output, Exception):
                 exceptions.append(output)
                 continue
@@ -269,7 +771,7 @@ class InstructLmAgent(Agent, Generic[LmJsonOutputModelT]):
                 winning_reasons=winning_reasons,
                 winner=winner,
                 num_winning_votes=vote_counts[winner],
-                num_total_votes=self.num_calls_for_voting,
+                num_total_votes=self.num_calls_for_voting - n_calls_saved,
             )
             return InstructLmAgentOutput(
                 data=self.output_data_model(
@@ -282,14 +784,20 @@ class InstructLmAgent(Agent, Generic[LmJsonOutputModelT]):
         self,
         input_messages: list[InstructLmMessage],
         retry_callback: LmRetryHandler | None = None,
+        streams_handler: LmStreamsHandler | None = None,
         **kwargs,  # kwargs passed through to the InstructLm.generate method
     ) -> InstructLmAgentOutput[LmJsonOutputModelT]:
-        """Runs the agent with the retry and voting logic specified in __init__."""
+        """
+        Runs the agent with the retry and voting logic specified in __init__.
+
+        Args:
+            streams_handler (LmStreamsHandler | None): If not None, used instead of the
+                agent's streams handler for this run (e.g., to buffer its streams).
+        """
+        streams_handler = streams_handler or self.streams_handler
         if self.num_calls_for_voting > 1:
             return await self._run_with_voting(
-                input_messages, retry_callback, self.streams_handler, **kwargs
+                input_messages, retry_callback, streams_handler, **kwargs
             )
         else:
-            return await self._run(
-                input_messages, retry_callback, self.streams_handler, **kwargs
-            )
+            return await self._run(input_messages, retry_callback, streams_handler, **kwargs)
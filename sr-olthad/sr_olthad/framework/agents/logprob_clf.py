@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import math
+import warnings
+from collections.abc import Collection
+from dataclasses import dataclass
+from functools import partial
+from typing import Generic
+
+from sr_olthad.framework.agents.instruct_lm import (
+    InstructLmAgent,
+    InstructLmAgentOutput,
+    LmJsonOutputModelT,
+    LmRetryHandler,
+)
+from sr_olthad.framework.schema import (
+    Agent,
+    InstructLm,
+    InstructLmChatRole,
+    InstructLmMessage,
+    LmErrorKind,
+    LmStreamsHandler,
+)
+
+
+def get_option_probabilities(
+    token_logprobs: dict[str, float], option_letters: Collection[str]
+) -> dict[str, float] | None:
+    """
+    Gets the probability of each multiple-choice option from the log probabilities of the
+    first token of a response, i.e., the probability mass of the tokens that spell out
+    the option's letter (e.g., "A", " A", or "A."), renormalized over the options.
+
+    Returns:
+        dict[str, float] | None: The probabilities of the options (or None if none of the
+            options' letters are amongst the tokens).
+    """
+    option_masses = dict.fromkeys(option_letters, 0.0)
+    for token, logprob in token_logprobs.items():
+        letter = token.strip().rstrip(".):")
+        if letter in option_masses:
+            option_masses[letter] += math.exp(logprob)
+    total_mass = sum(option_masses.values())
+    if total_mass == 0:
+        return None
+    return {letter: mass / total_mass for letter, mass in option_masses.items()}
+
+
+@dataclass
+class LogprobClfAgentStats:
+    """
+    Counters of a LogprobClfAgent.
+
+    Attributes:
+        n_classifications (int): Number of classifications made from logprobs.
+        n_reasons_generated (int): Number of those for which a reason was generated.
+        n_fallbacks (int): Number of runs that fell back to the fallback agent.
+        n_transient_retries (int): Number of retries after transient errors (e.g., rate
+            limits) of the logprob classifications.
+        backoff_seconds (float): Total time spent backing off before those retries.
+    """
+
+    n_classifications: int = 0
+    n_reasons_generated: int = 0
+    n_fallbacks: int = 0
+    n_transient_retries: int = 0
+    backoff_seconds: float = 0.0
+
+
+class LogprobClfAgentOutput(InstructLmAgentOutput[LmJsonOutputModelT]):
+    """
+    Output object for a LogprobClfAgent.
+
+    Attributes:
+        option_probs (dict[str, float]): The probability of each option.
+    """
+
+    option_probs: dict[str, float]
+
+
+class LogprobClfAgent(Agent, Generic[LmJsonOutputModelT]):
+    """
+    A multiple-choice classifier that asks an instruct LM for the letter of its answer
+    choice only, reading the LM's top logprobs for that one token to get the probability
+    of each option (rather than sampling and parsing a full reasoned JSON response). The
+    reason for the answer is then generated (in a follow-up turn) only if needed.
+
+    Falls back to a (regular) `InstructLmAgent` if the LM doesn't expose logprobs (for
+    good) or if a run fails (e.g., none of the options are amongst the top tokens).
+
+    Args:
+        instruct_lm (InstructLm): The instruct LM (see `InstructLm.get_next_token_logprobs`).
+        response_json_model (type[LmJsonOutputModelT]): The output data model (e.g., the
+            same as the fallback agent's).
+        answer_field (str): The field of the model to put the chosen letter in.
+        reason_field (str): The field of the model to put the reason in ("" if it wasn't
+            generated).
+        option_letters (Collection[str]): The letters of the options.
+        answer_only_prompt (str): The (user) prompt appended to the input messages to ask
+            for the letter only.
+        reason_prompt (str): The (user) prompt appended after the answer to ask for the
+            reason.
+        letters_needing_reason (Collection[str] | None): The answers for which to generate
+            a reason (e.g., those for which it is used). If None, for all answers.
+        fallback_agent (InstructLmAgent[LmJsonOutputModelT] | None): The agent to fall
+            back to. If None, failures are raised.
+        n_top_logprobs (int): The number of most likely tokens to get logprobs for.
+        streams_handler (LmStreamsHandler | None): Gets the reasons' chunks as they are
+            streamed (as stream 0).
+        logger (logging.Logger | None): Logger for warnings (else, `warnings.warn`).
+    """
+
+    def __init__(
+        self,
+        instruct_lm: InstructLm,
+        response_json_model: type[LmJsonOutputModelT],
+        answer_field: str,
+        reason_field: str,
+        option_letters: Collection[str],
+        answer_only_prompt: str,
+        reason_prompt: str,
+        letters_needing_reason: Collection[str] | None = None,
+        fallback_agent: InstructLmAgent[LmJsonOutputModelT] | None = None,
+        n_top_logprobs: int = 20,
+        streams_handler: LmStreamsHandler | None = None,
+        logger: logging.Logger | None = None,
+    ):
+        super().__init__()
+
+        self.instruct_lm = instruct_lm
+        self.output_data_model = response_json_model
+        self.answer_field = answer_field
+        self.reason_field = reason_field
+        self.option_letters = list(option_letters)
+        self.answer_only_prompt = answer_only_prompt
+        self.reason_prompt = reason_prompt
+        self.letters_needing_reason = letters_needing_reason
+        self.fallback_agent = fallback_agent
+        self.n_top_logprobs = n_top_logprobs
+        self.streams_handler = streams_handler
+        # Turned off for good if the LM doesn't expose logprobs
+        self.use_logprobs = True
+        self.stats = LogprobClfAgentStats()
+        self.logger = logger
+
+    @property
+    def num_calls_for_voting(self) -> int:
+        if self.use_logprobs or self.fallback_agent is None:
+            return 1
+        return self.fallback_agent.num_calls_for_voting
+
+    def _warn(self, msg: str) -> None:
+        if self.logger is not None:
+            self.logger.warning(msg)
+        else:
+            warnings.warn(msg, stacklevel=2)
+
+    async def _classify(
+        self,
+        input_messages: list[InstructLmMessage],
+        streams_handler: LmStreamsHandler | None = None,
+        **kwargs,
+    ) -> LogprobClfAgentOutput[LmJsonOutputModelT]:
+        messages = [
+            *input_messages,
+            {"role": InstructLmChatRole.USER, "content": self.answer_only_prompt},
+        ]
+        token_logprobs = await self.instruct_lm.get_next_token_logprobs(
+            messages, self.n_top_logprobs, **kwargs
+        )
+        option_probs = get_option_probabilities(token_logprobs, self.option_letters)
+        if option_probs is None:
+            raise ValueError(
+                f"None of the options are amongst the top tokens: {list(token_logprobs)}"
+            )
+        answer = max(option_probs, key=option_probs.get)
+        messages = [*messages, {"role": InstructLmChatRole.ASSISTANT, "content": answer}]
+        self.stats.n_classifications += 1
+
+        reason = ""
+        if self.letters_needing_reason is None or answer in self.letters_needing_reason:
+            messages = [
+                *messages,
+                {"role": InstructLmChatRole.USER, "content": self.reason_prompt},
+            ]
+            stream_handler = None
+            if streams_handler is not None:
+                stream_handler = partial(streams_handler, stream_idx=0)
+            reason = await self.instruct_lm.generate(messages, stream_handler, **kwargs)
+            messages = [*messages, {"role": InstructLmChatRole.ASSISTANT, "content": reason}]
+            self.stats.n_reasons_generated += 1
+
+        data = self.output_data_model(
+            **{self.answer_field: answer, self.reason_field: reason.strip()}
+        )
+        return LogprobClfAgentOutput(data=data, messages=messages, option_probs=option_probs)
+
+    async def run(
+        self,
+        input_messages: list[InstructLmMessage],
+        retry_callback: LmRetryHandler | None = None,
+        streams_handler: LmStreamsHandler | None = None,
+        **kwargs,  # kwargs passed through to the InstructLm methods
+    ) -> InstructLmAgentOutput[LmJsonOutputModelT]:
+        """
+        Classifies from the LM's logprobs (returning a `LogprobClfAgentOutput`), or with the
+        fallback agent (returning its output) if that fails (see __init__). Transient errors
+        (e.g., rate limits) are first retried, backing off as per the LM's backoff policy.
+
+        Args:
+            streams_handler (LmStreamsHandler | None): If not None, used instead of the
+                agent's streams handler for this run (e.g., to buffer its streams).
+        """
+        n_transient_retries = 0
+        while self.use_logprobs:
+            try:
+                return await self._classify(
+                    input_messages, streams_handler or self.streams_handler, **kwargs
+                )
+            except Exception as e:
+                error_kind = (
+                    None
+                    if isinstance(e, NotImplementedError)
+                    else self.instruct_lm.classify_error(e)
+                )
+                backoff_policy = self.instruct_lm.backoff_policy
+                if (
+                    error_kind == LmErrorKind.TRANSIENT
+                    and n_transient_retries < backoff_policy.max_retries
+                ):
+                    delay_seconds = backoff_policy.get_delay_seconds(
+                        retry_idx=n_transient_retries,
+                        retry_after_seconds=self.instruct_lm.get_retry_after_seconds(e),
+                    )
+                    n_transient_retries += 1
+                    self.stats.n_transient_retries += 1
+                    self.stats.backoff_seconds += delay_seconds
+                    self._warn(
+                        f"Logprob classification failed ({e}), retrying in "
+                        f"{delay_seconds:.1f}s"
+                    )
+                    await asyncio.sleep(delay_seconds)
+                    continue
+                if self.fallback_agent is None:
+                    raise
+                if error_kind is None or error_kind == LmErrorKind.FATAL:
+                    # (E.g., the LM or its model doesn't expose logprobs)
+                    self.use_logprobs = False
+                    self._warn(f"Logprob classification failed ({e}), turning it off")
+                else:
+                    self._warn(f"Logprob classification failed ({e}), falling back")
+                self.stats.n_fallbacks += 1
+                break
+        return await self.fallback_agent.run(
+            input_messages, retry_callback, streams_handler, **kwargs
+        )
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import os
+from dataclasses import asdict, dataclass
+
+
+@dataclass
+class VotingAgreementCounts:
+    """
+    Attributes:
+        n_votings (int): Number of (recorded) self-consistency votings.
+        n_unanimous (int): Number of those whose first votes were unanimous.
+    """
+
+    n_votings: int = 0
+    n_unanimous: int = 0
+
+
+class VotingAgreementHistory:
+    """
+    Per-agent counts of how often the first votes of an agent's self-consistency 'votings'
+    agreed (i.e., were unanimous), optionally persisted as JSON between runs.
+
+    Args:
+        fpath (str | None): Path of the JSON file to load the counts from (if it exists)
+            and to save them to as they're recorded (see `record`). If None, they're only
+            kept in memory.
+    """
+
+    def __init__(self, fpath: str | None = None):
+        self.fpath = fpath
+        self.counts: dict[str, VotingAgreementCounts] = {}
+        self._is_updated_since_save = False
+        self._save_task: asyncio.Task | None = None
+        if fpath is not None and os.path.exists(fpath):
+            with open(fpath, encoding="utf-8") as f:
+                for key, counts in json.load(f).items():
+                    self.counts[key] = VotingAgreementCounts(**counts)
+
+    def get_unanimity_rate(self, key: str) -> float:
+        """
+        Gets the (Laplace-smoothed, i.e., 0.5 w/out any history) rate at which the first
+        votes of the agent's votings were unanimous.
+        """
+        counts = self.counts.get(key, VotingAgreementCounts())
+        return (counts.n_unanimous + 1) / (counts.n_votings + 2)
+
+    def record(self, key: str, is_unanimous: bool) -> None:
+        """
+        Records whether the first votes of a voting were unanimous, saving the counts to
+        `fpath` (if any) in the background if there's a running event loop (see `persist`
+        to wait for the save).
+        """
+        counts = self.counts.setdefault(key, VotingAgreementCounts())
+        counts.n_votings += 1
+        counts.n_unanimous += is_unanimous
+        self._is_updated_since_save = True
+        if self.fpath is not None and not self._is_save_pending():
+            try:
+                self._save_task = asyncio.get_running_loop().create_task(
+                    self._save_while_updated()
+                )
+            except RuntimeError:  # (No running event loop, saved at the next `persist`)
+                pass
+
+    def _is_save_pending(self) -> bool:
+        # (If so, the ongoing save saves again once done, coalescing any new updates)
+        return self._save_task is not None and not self._save_task.done()
+
+    async def persist(self) -> None:
+        """
+        Saves the counts to `fpath` (if any, and if updated since the last save) in a
+        thread, i.e., without blocking the event loop, or waits for the ongoing save (e.g.,
+        to flush the ones started in the background by `record`). Concurrent calls share
+        one ongoing save, which saves again if the counts were updated while it was writing.
+        """
+        if self.fpath is None:
+            return
+        if not self._is_save_pending():
+            if not self._is_updated_since_save:
+                return
+            self._save_task = asyncio.ensure_future(self._save_while_updated())
+        await asyncio.shield(self._save_task)
+
+    async def _save_while_updated(self) -> None:
+        while self._is_updated_since_save:
+            self._is_updated_since_save = False
+            # (Copied on the event loop, so that the thread doesn't read them mid-update)
+            counts = {key: asdict(counts) for key, counts in self.counts.items()}
+            await asyncio.to_thread(self._save_counts, self.fpath, counts)
+
+    def save(self, fpath: str) -> None:
+        """Saves the counts as JSON."""
+        self._save_counts(
+            fpath, {key: asdict(counts) for key, counts in self.counts.items()}
+        )
+
+    @staticmethod
+    def _save_counts(fpath: str, counts: dict[str, dict[str, int]]) -> None:
+        fpath_dir = os.path.dirname(fpath)
+        if fpath_dir:
+            os.makedirs(fpath_dir, exist_ok=True)
+        # (Written to a temp file first, so that the file is never left half-written)
+        tmp_fpath = f"{fpath}.tmp"
+        with open(tmp_fpath, "w", encoding="utf-8") as f:
+            json.dump(counts, f)
+        os.replace(tmp_fpath, fpath)
+
+
+@dataclass
+class AdaptiveVotingPolicy:
+    """
+    Policy for an `InstructLmAgent` to start its self-consistency 'voting' with only a
+    few calls when, in the agent's history, the first votes have mostly been unanimous,
+    making the rest of its calls only if these first votes disagree.
+
+    Attributes:
+        history (VotingAgreementHistory): The (possibly shared) agreement history.
+        key (str): The key of the agent in the history (e.g., its name).
+        min_n_calls (int): The number of calls to start with (and of first votes whose
+            agreement is recorded).
+        min_unanimity_rate (float): The min rate of unanimous first votes in the history
+            for starting with `min_n_calls` calls (else, all calls are made at once).
+    """
+
+    history: VotingAgreementHistory
+    key: str
+    min_n_calls: int = 2
+    min_unanimity_rate: float = 0.8
+
+    def get_n_initial_calls(self, n_calls: int) -> int:
+        """Gets how many of the (max) `n_calls` calls to start with."""
+        if self.history.get_unanimity_rate(self.key) >= self.min_unanimity_rate:
+            return min(self.min_n_calls, n_calls)
+        return n_calls
+
+    def record_first_votes(self, first_votes: list[object]) -> bool:
+        """
+        Records whether the first `min_n_calls` votes (if there are that many) agreed (the
+        history being saved in the background, see `VotingAgreementHistory.record`).
+
+        Returns:
+            bool: Whether they agreed.
+        """
+        if len(first_votes) < self.min_n_calls:
+            return False
+        is_unanimous = len(set(first_votes[: self.min_n_calls])) == 1
+        self.history.record(self.key, is_unanimous)
+        return is_unanimous
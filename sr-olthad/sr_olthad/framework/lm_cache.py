@@ -0,0 +1,298 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from enum import StrEnum
+
+from sr_olthad.framework.schema import (
+    INSTRUCT_LM_CALL_CONTEXT,
+    InstructLm,
+    InstructLmCallContext,
+    InstructLmMessage,
+    LmBackoffPolicy,
+    LmErrorKind,
+    LmStreamHandler,
+)
+from sr_olthad.framework.utils import call_stream_handler
+
+
+class VotingSampleCachePolicy(StrEnum):
+    """
+    How a `CachedInstructLm` treats the self-consistency 'voting' samples of an agent.
+    """
+
+    SHARED = "shared"  # All samples share one cache entry (i.e., they'll be identical)
+    PER_SAMPLE = "per_sample"  # Each sample index gets its own cache entry
+    BYPASS = "bypass"  # Samples are never read from or written to the cache
+
+
+class LmResponseCache:
+    """
+    Two-tier (in-memory LRU + optional on-disk SQLite) key-value store of LM responses.
+
+    The on-disk tier is read and written in a thread (i.e., without blocking the event
+    loop). Its entries' last access times are only written along with the next write,
+    and its expired and least recently used entries are only evicted every
+    `eviction_interval_n_sets` writes (so it can temporarily hold up to that many more
+    than `max_entries_on_disk` entries).
+
+    Args:
+        max_entries_in_memory (int): Max number of entries kept in the in-memory tier
+            (least recently used entries are evicted first).
+        db_fpath (str | None): Path of the SQLite database file for the on-disk tier. If
+            None, there is no on-disk tier.
+        max_entries_on_disk (int | None): Max number of entries kept in the on-disk tier
+            (least recently used entries are evicted first). If None, no limit.
+        ttl_seconds (float | None): Time after which an entry expires. If None, entries
+            never expire.
+        eviction_interval_n_sets (int): Number of writes between evictions of the
+            on-disk tier.
+    """
+
+    def __init__(
+        self,
+        max_entries_in_memory: int = 1024,
+        db_fpath: str | None = None,
+        max_entries_on_disk: int | None = None,
+        ttl_seconds: float | None = None,
+        eviction_interval_n_sets: int = 64,
+    ):
+        self.max_entries_in_memory = max_entries_in_memory
+        self.max_entries_on_disk = max_entries_on_disk
+        self.ttl_seconds = ttl_seconds
+        self.eviction_interval_n_sets = eviction_interval_n_sets
+        # Key -> (response, creation time)
+        self._memory: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        # Key -> last access time, of the on-disk entries accessed since the last write
+        self._pending_db_accesses: dict[str, float] = {}
+        self._n_sets_since_eviction = 0
+        self._db: sqlite3.Connection | None = None
+        # (The connection is used from the threads of `asyncio.to_thread`, one at a time)
+        self._db_lock = threading.Lock()
+        if db_fpath is not None:
+            db_dir = os.path.dirname(db_fpath)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            self._db = sqlite3.connect(db_fpath, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS lm_responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                "created_at REAL NOT NULL, last_accessed_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def _set_in_memory(self, key: str, response: str, created_at: float) -> None:
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries_in_memory:
+            self._memory.popitem(last=False)
+
+    def _get_from_db(self, key: str) -> tuple[str, float] | None:
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT response, created_at FROM lm_responses WHERE key = ?", (key,)
+            ).fetchone()
+
+    def _write_to_db(
+        self,
+        entry: tuple[str, str, float],
+        accesses: dict[str, float],
+        do_evict: bool,
+    ) -> None:
+        key, response, now = entry
+        with self._db_lock:
+            self._db.executemany(
+                "UPDATE lm_responses SET last_accessed_at = ? WHERE key = ?",
+                [
+                    (accessed_at, accessed_key)
+                    for accessed_key, accessed_at in accesses.items()
+                ],
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO lm_responses VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            if do_evict and self.ttl_seconds is not None:
+                self._db.execute(
+                    "DELETE FROM lm_responses WHERE created_at < ?",
+                    (now - self.ttl_seconds,),
+                )
+            if do_evict and self.max_entries_on_disk is not None:
+                self._db.execute(
+                    "DELETE FROM lm_responses WHERE key NOT IN (SELECT key FROM "
+                    "lm_responses ORDER BY last_accessed_at DESC LIMIT ?)",
+                    (self.max_entries_on_disk,),
+                )
+            self._db.commit()
+
+    async def get(self, key: str) -> str | None:
+        """
+        Gets the cached response for a key (or None if there is no unexpired entry).
+        """
+        if key in self._memory:
+            response, created_at = self._memory[key]
+            if not self._is_expired(created_at):
+                self._memory.move_to_end(key)
+                return response
+            del self._memory[key]
+        if self._db is None:
+            return None
+        row = await asyncio.to_thread(self._get_from_db, key)
+        if row is None:
+            return None
+        response, created_at = row
+        if self._is_expired(created_at):
+            return None  # (Deleted at the next eviction)
+        self._pending_db_accesses[key] = time.time()
+        self._set_in_memory(key, response, created_at)
+        return response
+
+    async def set(self, key: str, response: str) -> None:
+        """
+        Caches a response under a key (in both tiers), evicting entries as needed.
+        """
+        now = time.time()
+        self._set_in_memory(key, response, now)
+        if self._db is None:
+            return
+        accesses, self._pending_db_accesses = self._pending_db_accesses, {}
+        self._n_sets_since_eviction += 1
+        do_evict = self._n_sets_since_eviction >= self.eviction_interval_n_sets
+        if do_evict:
+            self._n_sets_since_eviction = 0
+        await asyncio.to_thread(self._write_to_db, (key, response, now), accesses, do_evict)
+
+    def clear(self) -> None:
+        """
+        Removes all entries from both tiers.
+        """
+        self._memory.clear()
+        self._pending_db_accesses.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM lm_responses")
+                self._db.commit()
+
+
+class CachedInstructLm(InstructLm):
+    """
+    Wraps an `InstructLm`, serving its responses from an `LmResponseCache` when the exact
+    same request (model, messages, and generation kwargs) has been made before.
+
+    The index of the attempt at getting a valid response (see `InstructLmCallContext`) is
+    part of the cache key, so that retries after an unusable (e.g., unparsable) response
+    don't get served that same response again.
+
+    Args:
+        instruct_lm (InstructLm): The `InstructLm` to wrap.
+        cache (LmResponseCache | None): The cache to use. If None, a new in-memory one is
+            created.
+        voting_sample_policy (VotingSampleCachePolicy): How to treat self-consistency
+            'voting' samples.
+    """
+
+    def __init__(
+        self,
+        instruct_lm: InstructLm,
+        cache: LmResponseCache | None = None,
+        voting_sample_policy: VotingSampleCachePolicy = VotingSampleCachePolicy.PER_SAMPLE,
+    ):
+        super().__init__()
+
+        self.instruct_lm = instruct_lm
+        self.cache = cache if cache is not None else LmResponseCache()
+        self.voting_sample_policy = voting_sample_policy
+
+    async def warm_up(self) -> None:
+        await self.instruct_lm.warm_up()
+
+    @property
+    def client_key(self) -> Hashable:
+        return self.instruct_lm.client_key
+
+    @property
+    def backoff_policy(self) -> LmBackoffPolicy:
+        return self.instruct_lm.backoff_policy
+
+    def classify_error(self, error: Exception) -> LmErrorKind:
+        return self.instruct_lm.classify_error(error)
+
+    def get_retry_after_seconds(self, error: Exception) -> float | None:
+        return self.instruct_lm.get_retry_after_seconds(error)
+
+    def _get_cache_key(
+        self,
+        messages: list[InstructLmMessage],
+        voting_sample_idx: int | None,
+        attempt_idx: int,
+        **kwargs,
+    ) -> str:
+        key_data = {
+            "lm": type(self.instruct_lm).__name__,
+            "model": getattr(self.instruct_lm, "model", None),
+            "messages": messages,
+            "kwargs": kwargs,
+            "voting_sample_idx": voting_sample_idx,
+            "attempt_idx": attempt_idx,
+        }
+        key_json = json.dumps(key_data, sort_keys=True, default=repr)
+        return hashlib.sha256(key_json.encode()).hexdigest()
+
+    async def generate(
+        self,
+        messages: list[InstructLmMessage],
+        stream_handler: LmStreamHandler | None = None,
+        **kwargs,
+    ) -> str:
+        call_context = INSTRUCT_LM_CALL_CONTEXT.get() or InstructLmCallContext()
+        voting_sample_idx = call_context.voting_sample_idx
+        if voting_sample_idx is not None:
+            if self.voting_sample_policy == VotingSampleCachePolicy.BYPASS:
+                return await self.instruct_lm.generate(messages, stream_handler, **kwargs)
+            if self.voting_sample_policy == VotingSampleCachePolicy.SHARED:
+                voting_sample_idx = None
+
+        key = self._get_cache_key(
+            messages, voting_sample_idx, call_context.attempt_idx, **kwargs
+        )
+        response = await self.cache.get(key)
+        if response is not None:
+            if stream_handler is not None:
+                # "Stream" the whole response as one chunk (nothing is left to stop)
+                call_stream_handler(stream_handler, response)
+            return response
+
+        response = await self.instruct_lm.generate(messages, stream_handler, **kwargs)
+        await self.cache.set(key, response)
+        return response
+
+    async def get_next_token_logprobs(
+        self,
+        messages: list[InstructLmMessage],
+        n_top: int = 20,
+        **kwargs,
+    ) -> dict[str, float]:
+        call_context = INSTRUCT_LM_CALL_CONTEXT.get() or InstructLmCallContext()
+        # (Logprobs don't vary across samples, so they're never cached per sample)
+        key = self._get_cache_key(
+            messages,
+            None,
+            call_context.attempt_idx,
+            next_token_logprobs_n_top=n_top,
+            **kwargs,
+        )
+        cached_logprobs_json = await self.cache.get(key)
+        if cached_logprobs_json is not None:
+            return json.loads(cached_logprobs_json)
+
+        logprobs = await self.instruct_lm.get_next_token_logprobs(messages, n_top, **kwargs)
+        await self.cache.set(key, json.dumps(logprobs))
+        return logprobs
@@ -1,222 +1,693 @@
 import asyncio
+import contextlib
+import datetime
+import email.utils
+import hashlib
 import os
+import sys
+import time
+import types
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+from functools import partial
+from typing import TYPE_CHECKING, TypeVar
 
-import google.generativeai as genai
-from deepseek import DeepSeekAPI
-from groq import AsyncGroq
-
-# from openai.types.chat import ChatCompletion , ChatCompletionChunk
-from groq.types.chat import ChatCompletion, ChatCompletionChunk
-from openai import AsyncOpenAI
+from pydantic import BaseModel
 
+from sr_olthad.framework.rate_limits import (
+    LmRateLimiter,
+    LmRateLimits,
+    estimate_n_tokens,
+    get_shared_rate_limiter,
+)
 from sr_olthad.framework.schema import (
     InstructLm,
     InstructLmChatRole,
     InstructLmMessage,
+    LmBackoffPolicy,
+    LmErrorKind,
     LmStreamHandler,
+    LmStreamsHandler,
+    classify_http_status_code,
 )
+from sr_olthad.framework.utils import call_stream_handler, get_portable_json_schema
+
+# NOTE: The provider SDKs are slow to import, so they are only imported (and the clients
+# only built) upon first use, i.e., only for the providers that are actually used
+if TYPE_CHECKING:
+    import google.generativeai as genai
+    import httpx
+    from groq import AsyncGroq
+
+    # from openai.types.chat import ChatCompletion , ChatCompletionChunk
+    from groq.types.chat import ChatCompletion, ChatCompletionChunk
+    from openai import AsyncOpenAI
 
 # TODO: Split up into separate files
 
+ClientT = TypeVar("ClientT")
+
+
+@dataclass(frozen=True)
+class HttpClientPoolCfg:
+    """
+    Connection pool settings for the (shared) HTTP clients of the `InstructLm`s.
+
+    Attributes:
+        max_connections (int): Max number of concurrent connections.
+        max_keepalive_connections (int): Max number of idle connections kept alive.
+        keepalive_expiry_seconds (float): Time after which idle connections are closed.
+        http2 (bool): Whether to use HTTP/2 (requires the `h2` package).
+    """
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry_seconds: float = 60.0
+    http2: bool = False
+
+    def get_httpx_limits(self) -> "httpx.Limits":
+        import httpx
+
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry_seconds,
+        )
+
+
+# Process-wide registry of API clients, so that all `InstructLm`s of the same
+# provider/endpoint/API key share one connection pool (and its warm connections)
+_SHARED_CLIENTS: dict[Hashable, object] = {}
+
+
+def get_shared_client(key: Hashable, create_client: Callable[[], ClientT]) -> ClientT:
+    """
+    Gets the process-wide shared API client for a key (e.g., (provider, base URL, API
+    key, pool cfg)), creating it with `create_client` if it doesn't exist yet.
+    """
+    if key not in _SHARED_CLIENTS:
+        _SHARED_CLIENTS[key] = create_client()
+    return _SHARED_CLIENTS[key]
+
+
+def _get_openai_compatible_response_format(
+    response_json_model: type[BaseModel], strict: bool
+) -> dict:
+    schema = get_portable_json_schema(
+        response_json_model, forbid_additional_properties=strict
+    )
+    json_schema = {"name": response_json_model.__name__, "schema": schema}
+    if strict:
+        json_schema["strict"] = True
+    return {"type": "json_schema", "json_schema": json_schema}
+
+
+def _get_retry_after_seconds_from_headers(headers: "httpx.Headers") -> float | None:
+    if (retry_after_ms := headers.get("retry-after-ms")) is not None:
+        with contextlib.suppress(ValueError):
+            return float(retry_after_ms) / 1000
+    if (retry_after := headers.get("retry-after")) is None:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:  # (Can also be an HTTP date)
+        with contextlib.suppress(TypeError, ValueError):
+            retry_at = email.utils.parsedate_to_datetime(retry_after)
+            return max(0.0, (retry_at - datetime.datetime.now(datetime.UTC)).total_seconds())
+    return None
+
+
+def _classify_openai_compatible_error(
+    error: Exception, sdk_module_name: str
+) -> LmErrorKind | None:
+    # (If the SDK was never imported, the error can't be one of its errors)
+    sdk_module = sys.modules.get(sdk_module_name)
+    if sdk_module is None:
+        return None
+    if isinstance(error, sdk_module.APIConnectionError):  # (Incl. timeouts)
+        return LmErrorKind.TRANSIENT
+    if isinstance(error, sdk_module.APIStatusError):
+        return classify_http_status_code(error.status_code)
+    return None
+
+
+def _get_rate_limiter(
+    provider: str, base_url: str | None, model: str, rate_limits: LmRateLimits | None
+) -> LmRateLimiter | None:
+    if rate_limits is None:
+        return None
+    return get_shared_rate_limiter((provider, base_url, model), rate_limits)
+
+
+def _acquire_rate_limit(
+    rate_limiter: LmRateLimiter | None, messages: list[InstructLmMessage]
+) -> contextlib.AbstractAsyncContextManager:
+    if rate_limiter is None:
+        return contextlib.nullcontext()
+    prompt = "".join(msg["content"] for msg in messages)
+    return rate_limiter.acquire(n_tokens=estimate_n_tokens(prompt))
+
+
+def _charge_response_tokens(rate_limiter: LmRateLimiter | None, response: str) -> None:
+    # (The responses' tokens aren't known (or budgeted for) until they're generated)
+    if rate_limiter is not None:
+        rate_limiter.charge_tokens(estimate_n_tokens(response))
+
+
+async def _warm_up_openai_compatible_client(client: "AsyncOpenAI | AsyncGroq") -> None:
+    # Listing the models is free and opens a (kept-alive) connection to the API
+    with contextlib.suppress(Exception):  # (Best effort: `generate` surfaces any issue)
+        await client.models.list()
+
 
 class OpenAIInstructLm(InstructLm):
-    def __init__(self, api_key: str | None = None, model: str = "gpt-3.5-turbo"):
+    # Whether the API can sample n responses in one request (see `generate_many`)
+    SUPPORTS_N_COMPLETIONS = True
+
+    def __init__(
+        self,
+        api_key: str | None = None,
+        model: str = "gpt-3.5-turbo",
+        base_url: str | None = None,
+        pool_cfg: HttpClientPoolCfg | None = None,
+        backoff_policy: LmBackoffPolicy | None = None,
+        rate_limits: LmRateLimits | None = None,
+    ):
         super().__init__()
 
-        self.client = AsyncOpenAI(api_key=api_key)
         self.model = model
+        if backoff_policy is not None:
+            self.backoff_policy = backoff_policy
+        self.rate_limiter = _get_rate_limiter("openai", base_url, model, rate_limits)
+        self._api_key = api_key
+        self._base_url = base_url
+        self._pool_cfg = pool_cfg if pool_cfg is not None else HttpClientPoolCfg()
+        self._client: AsyncOpenAI | None = None
+
+    @property
+    def client_key(self) -> Hashable:
+        return ("openai", self._base_url, self._api_key, self._pool_cfg)
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        """The (shared) API client (imports the SDK and gets the client upon first use)."""
+        if self._client is None:
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+            self._client = get_shared_client(
+                key=self.client_key,
+                create_client=lambda: AsyncOpenAI(
+                    api_key=self._api_key,
+                    base_url=self._base_url,
+                    max_retries=0,  # (Retries are up to the agents' retry logic)
+                    http_client=DefaultAsyncHttpxClient(
+                        limits=self._pool_cfg.get_httpx_limits(), http2=self._pool_cfg.http2
+                    ),
+                ),
+            )
+        return self._client
+
+    async def warm_up(self) -> None:
+        await _warm_up_openai_compatible_client(self.client)
+
+    def classify_error(self, error: Exception) -> LmErrorKind:
+        error_kind = _classify_openai_compatible_error(error, sdk_module_name="openai")
+        return error_kind if error_kind is not None else super().classify_error(error)
+
+    def get_retry_after_seconds(self, error: Exception) -> float | None:
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        return _get_retry_after_seconds_from_headers(response.headers)
 
     async def generate(
         self,
         messages: list[InstructLmMessage],
         stream_handler: LmStreamHandler | None = None,
+        response_json_model: type[BaseModel] | None = None,
         **kwargs,
         # E.g., temperature, max_tokens, top_p, presence_penalty, frequency_penalty...
     ) -> str:
-        if stream_handler is not None:
-            response_generator = await self.client.chat.completions.create(
-                model=self.model, messages=messages, stream=True, **kwargs
+        if response_json_model is not None:
+            kwargs["response_format"] = _get_openai_compatible_response_format(
+                response_json_model, strict=True
             )
-            full_response = ""
-            async for chunk in response_generator:
-                chunk: ChatCompletionChunk
-                if chunk.choices and chunk.choices[0].delta.content is not None:
-                    chunk_text = chunk.choices[0].delta.content
-                    stream_handler(chunk_text)
-                    full_response += chunk_text
-            return full_response
-        else:  # No need to stream
+        async with _acquire_rate_limit(self.rate_limiter, messages):
+            if stream_handler is not None:
+                response_generator = await self.client.chat.completions.create(
+                    model=self.model, messages=messages, stream=True, **kwargs
+                )
+                response = ""
+                async for chunk in response_generator:
+                    chunk: ChatCompletionChunk
+                    if chunk.choices and chunk.choices[0].delta.content is not None:
+                        chunk_text = chunk.choices[0].delta.content
+                        response += chunk_text
+                        if call_stream_handler(stream_handler, chunk_text):
+                            # Closing the connection cancels the rest of the generation
+                            await response_generator.close()
+                            break
+            else:  # No need to stream
+                chat_completion: ChatCompletion = await self.client.chat.completions.create(
+                    model=self.model, messages=messages, **kwargs
+                )
+                response = chat_completion.choices[0].message.content or ""
+        _charge_response_tokens(self.rate_limiter, response)
+        return response
+
+    async def generate_many(
+        self,
+        messages: list[InstructLmMessage],
+        n: int,
+        streams_handler: LmStreamsHandler | None = None,
+        max_concurrent_calls: int | None = None,
+        response_json_model: type[BaseModel] | None = None,
+        **kwargs,
+    ) -> list[str]:
+        if not self.SUPPORTS_N_COMPLETIONS or n == 1:
+            return await super().generate_many(
+                messages,
+                n,
+                streams_handler,
+                max_concurrent_calls=max_concurrent_calls,
+                response_json_model=response_json_model,
+                **kwargs,
+            )
+        if response_json_model is not None:
+            kwargs["response_format"] = _get_openai_compatible_response_format(
+                response_json_model, strict=True
+            )
+        async with _acquire_rate_limit(self.rate_limiter, messages):
+            if streams_handler is not None:
+                response_generator = await self.client.chat.completions.create(
+                    model=self.model, messages=messages, n=n, stream=True, **kwargs
+                )
+                responses = [""] * n
+                stopped_stream_idxs = set()
+                async for chunk in response_generator:
+                    chunk: ChatCompletionChunk
+                    for choice in chunk.choices:
+                        if choice.index in stopped_stream_idxs or not choice.delta.content:
+                            continue
+                        responses[choice.index] += choice.delta.content
+                        stream_handler = partial(streams_handler, stream_idx=choice.index)
+                        if call_stream_handler(stream_handler, choice.delta.content):
+                            stopped_stream_idxs.add(choice.index)
+                    if len(stopped_stream_idxs) == n:
+                        # (All the responses' streams were stopped, see `generate`)
+                        await response_generator.close()
+                        break
+            else:  # No need to stream
+                chat_completion: ChatCompletion = await self.client.chat.completions.create(
+                    model=self.model, messages=messages, n=n, **kwargs
+                )
+                responses = [""] * n
+                for choice in chat_completion.choices:
+                    responses[choice.index] = choice.message.content or ""
+        for response in responses:
+            _charge_response_tokens(self.rate_limiter, response)
+        return responses
+
+    async def get_next_token_logprobs(
+        self,
+        messages: list[InstructLmMessage],
+        n_top: int = 20,
+        **kwargs,
+    ) -> dict[str, float]:
+        async with _acquire_rate_limit(self.rate_limiter, messages):
             chat_completion: ChatCompletion = await self.client.chat.completions.create(
-                model=self.model, messages=messages, **kwargs
+                model=self.model,
+                messages=messages,
+                max_tokens=1,
+                logprobs=True,
+                top_logprobs=n_top,
+                **kwargs,
             )
-            return chat_completion.choices[0].message.content
+        response = chat_completion.choices[0].message.content or ""
+        _charge_response_tokens(self.rate_limiter, response)
+        logprobs = chat_completion.choices[0].logprobs
+        if logprobs is None or not logprobs.content:
+            raise ValueError("The API response has no logprobs")
+        # (If the same token appears twice, e.g., w/ different bytes, keep the likeliest)
+        token_logprobs = {}
+        for top_logprob in logprobs.content[0].top_logprobs:
+            token_logprobs[top_logprob.token] = max(
+                top_logprob.logprob, token_logprobs.get(top_logprob.token, float("-inf"))
+            )
+        return token_logprobs
 
 
 class GroqInstructLm(InstructLm):
-    def __init__(self, api_key: str | None = None, model: str = "llama-3.1-8b-instant"):
+    # (Longer delays, since Groq's rate limits are low and per minute)
+    backoff_policy = LmBackoffPolicy(base_delay_seconds=2.0)
+
+    def __init__(
+        self,
+        api_key: str | None = None,
+        model: str = "llama-3.1-8b-instant",
+        base_url: str | None = None,
+        pool_cfg: HttpClientPoolCfg | None = None,
+        backoff_policy: LmBackoffPolicy | None = None,
+        rate_limits: LmRateLimits | None = None,
+    ):
         super().__init__()
 
-        self.client = AsyncGroq(api_key=api_key)
         self.model = model
+        if backoff_policy is not None:
+            self.backoff_policy = backoff_policy
+        self.rate_limiter = _get_rate_limiter("groq", base_url, model, rate_limits)
+        self._api_key = api_key
+        self._base_url = base_url
+        self._pool_cfg = pool_cfg if pool_cfg is not None else HttpClientPoolCfg()
+        self._client: AsyncGroq | None = None
+
+    @property
+    def client_key(self) -> Hashable:
+        return ("groq", self._base_url, self._api_key, self._pool_cfg)
+
+    @property
+    def client(self) -> "AsyncGroq":
+        """The (shared) API client (imports the SDK and gets the client upon first use)."""
+        if self._client is None:
+            from groq import AsyncGroq, DefaultAsyncHttpxClient
+
+            self._client = get_shared_client(
+                key=self.client_key,
+                create_client=lambda: AsyncGroq(
+                    api_key=self._api_key,
+                    base_url=self._base_url,
+                    max_retries=0,  # (Retries are up to the agents' retry logic)
+                    http_client=DefaultAsyncHttpxClient(
+                        limits=self._pool_cfg.get_httpx_limits(), http2=self._pool_cfg.http2
+                    ),
+                ),
+            )
+        return self._client
+
+    async def warm_up(self) -> None:
+        await _warm_up_openai_compatible_client(self.client)
+
+    def classify_error(self, error: Exception) -> LmErrorKind:
+        error_kind = _classify_openai_compatible_error(error, sdk_module_name="groq")
+        return error_kind if error_kind is not None else super().classify_error(error)
+
+    def get_retry_after_seconds(self, error: Exception) -> float | None:
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        return _get_retry_after_seconds_from_headers(response.headers)
 
     async def generate(
         self,
         messages: list[InstructLmMessage],
         stream_handler: LmStreamHandler | None = None,
+        response_json_model: type[BaseModel] | None = None,
         **kwargs,
         # E.g., temperature, max_tokens, top_p, presence_penalty, frequency_penalty...
     ) -> str:
-        if stream_handler is not None:
-            response_generator = await self.client.chat.completions.create(
-                model=self.model, messages=messages, stream=True, **kwargs
+        if response_json_model is not None:
+            # NOTE: Only some Groq models support (and fewer, strictly) JSON schemas
+            kwargs["response_format"] = _get_openai_compatible_response_format(
+                response_json_model, strict=False
             )
-            full_response = ""
-            async for chunk in response_generator:
-                chunk: ChatCompletionChunk
-                if chunk.choices and chunk.choices[0].delta.content is not None:
-                    chunk_text = chunk.choices[0].delta.content
-                    stream_handler(chunk_text)
-                    full_response += chunk_text
-            return full_response
-        else:  # No need to stream
-            chat_completion: ChatCompletion = await self.client.chat.completions.create(
-                model=self.model, messages=messages, **kwargs
-            )
-            return chat_completion.choices[0].message.content
+        async with _acquire_rate_limit(self.rate_limiter, messages):
+            if stream_handler is not None:
+                response_generator = await self.client.chat.completions.create(
+                    model=self.model, messages=messages, stream=True, **kwargs
+                )
+                response = ""
+                async for chunk in response_generator:
+                    chunk: ChatCompletionChunk
+                    if chunk.choices and chunk.choices[0].delta.content is not None:
+                        chunk_text = chunk.choices[0].delta.content
+                        response += chunk_text
+                        if call_stream_handler(stream_handler, chunk_text):
+                            # Closing the connection cancels the rest of the generation
+                            await response_generator.close()
+                            break
+            else:  # No need to stream
+                chat_completion: ChatCompletion = await self.client.chat.completions.create(
+                    model=self.model, messages=messages, **kwargs
+                )
+                response = chat_completion.choices[0].message.content or ""
+        _charge_response_tokens(self.rate_limiter, response)
+        return response
+
+
+@dataclass
+class TokenUsage:
+    """
+    Running totals of the tokens used by an `InstructLm`'s calls.
+
+    Attributes:
+        n_calls (int): Number of (completed) calls.
+        prompt_tokens (int): Number of prompt tokens (including the cached ones).
+        cached_prompt_tokens (int): Number of prompt tokens served from a context cache.
+        completion_tokens (int): Number of generated tokens.
+    """
+
+    n_calls: int = 0
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+async def _close_genai_response_stream(response_stream: object) -> None:
+    """
+    Closes the underlying stream of a streamed Gemini response that is stopped early,
+    cancelling the rest of the generation (the SDK has no public way to).
+    """
+    stream = getattr(response_stream, "_iterator", None)
+    if callable(cancel := getattr(stream, "cancel", None)):
+        cancel()
+    if callable(aclose := getattr(stream, "aclose", None)):
+        # (Releasing the SDK's gRPC call, which cancels it if it isn't done)
+        await aclose()
 
 
 class GeminiInstructLm(InstructLm):
+    """
+    Google Gemini, with the system prompt passed as the model's system instruction (and,
+    optionally, put in Gemini's explicit context cache, so that the large static part of
+    the prompts isn't re-processed at every call).
+
+    Model objects are reused per system prompt and the calls are stateless (i.e., no
+    chat session is built per call).
+
+    Args:
+        api_key (str | None): The API key (if None, the `GOOGLE_API_KEY` env variable).
+        model (str): The model name.
+        context_cache_ttl_seconds (float | None): If not None, system prompts are put in
+            Gemini's explicit context cache for this long (and re-cached upon expiry).
+            NOTE: Gemini only caches contents above a minimum number of tokens, so shorter
+            system prompts are (silently) left uncached.
+        backoff_policy (LmBackoffPolicy | None): How to back off after transient errors
+            (if None, the class's default).
+        rate_limits (LmRateLimits | None): Limits shared by all the `InstructLm`s of the
+            same model in the process (if None, no limits).
+    """
+
     # NOTE: Rate limits @ https://ai.google.dev/gemini-api/docs/rate-limits
-    def __init__(self, api_key: str | None = None, model: str = "gemini-1.5-flash"):
+    # (Longer delays, since Gemini's (free tier) rate limits are low and per minute)
+    backoff_policy = LmBackoffPolicy(base_delay_seconds=2.0)
+    GENERATION_CONFIG_PARAMS = ("temperature", "top_p", "top_k", "max_output_tokens")
+    MAX_N_GENAI_MODELS = 32  # Max number of (least recently used) model objects kept
+
+    def __init__(
+        self,
+        api_key: str | None = None,
+        model: str = "gemini-1.5-flash",
+        context_cache_ttl_seconds: float | None = None,
+        backoff_policy: LmBackoffPolicy | None = None,
+        rate_limits: LmRateLimits | None = None,
+    ):
         super().__init__()
-        api_key = api_key or os.environ.get("GOOGLE_API_KEY")
-        genai.configure(api_key=api_key)
+        self._api_key = api_key
         self.model = model
-        self.genai_model = genai.GenerativeModel(model_name=model)
+        if backoff_policy is not None:
+            self.backoff_policy = backoff_policy
+        self.rate_limiter = _get_rate_limiter("gemini", None, model, rate_limits)
+        self.context_cache_ttl_seconds = context_cache_ttl_seconds
+        self.token_usage = TokenUsage()
+        self._is_genai_configured = False
+        # System prompt hash -> (model object, time after which it must be rebuilt)
+        self._genai_models: OrderedDict[str, tuple[genai.GenerativeModel, float]] = (
+            OrderedDict()
+        )
+        # System prompt hash -> the ongoing creation of its model object
+        self._pending_genai_models: dict[
+            str, asyncio.Future[tuple[genai.GenerativeModel, float]]
+        ] = {}
 
-    async def generate(
-        self,
-        messages: list[InstructLmMessage],
-        stream_handler: LmStreamHandler | None = None,
-        **kwargs,
-    ) -> str:
-        gemini_messages = self._convert_to_gemini_format(messages)
-        if stream_handler is not None:
-            return await self._generate_streaming(gemini_messages, stream_handler, **kwargs)
-        else:
-            response = await self._generate_non_streaming(gemini_messages, **kwargs)
-            return response
-
-    def _convert_to_gemini_format(self, messages: list[InstructLmMessage]) -> list:
-        gemini_messages = []
-        for msg in messages:
-            if msg["role"] == InstructLmChatRole.USER:
-                gemini_messages.append({"role": "user", "parts": [{"text": msg["content"]}]})
-            elif msg["role"] == InstructLmChatRole.ASSISTANT:
-                gemini_messages.append(
-                    {"role": "model", "parts": [{"text": msg["content"]}]}
+    def _get_genai(self) -> types.ModuleType:
+        """Imports the SDK (and configures it upon first use)."""
+        import google.generativeai as genai
+
+        if not self._is_genai_configured:
+            genai.configure(api_key=self._api_key or os.environ.get("GOOGLE_API_KEY"))
+            self._is_genai_configured = True
+        return genai
+
+    async def _create_genai_model(
+        self, system_instruction: str | None
+    ) -> tuple["genai.GenerativeModel", float]:
+        genai = self._get_genai()
+        if system_instruction is not None and self.context_cache_ttl_seconds is not None:
+            ttl = datetime.timedelta(seconds=self.context_cache_ttl_seconds)
+            try:
+                cached_content = await asyncio.to_thread(
+                    genai.caching.CachedContent.create,
+                    model=self.model,
+                    system_instruction=system_instruction,
+                    ttl=ttl,
                 )
-            elif msg["role"] == InstructLmChatRole.SYS:
-                # Gemini doesn't have a direct system message equivalent
-                # Prepend to the first user message or add as a user message if none exists
-                system_content = msg["content"]
-                if not gemini_messages:
-                    gemini_messages.append(
-                        {
-                            "role": "user",
-                            "parts": [{"text": f"[System Instruction] {system_content}"}],
-                        }
-                    )
-                elif gemini_messages and gemini_messages[0]["role"] == "user":
-                    gemini_messages[0]["parts"][0]["text"] = (
-                        f"[System Instruction] {system_content}\n\n"
-                        + gemini_messages[0]["parts"][0]["text"]
-                    )
-                else:
-                    # Insert system message as a user message at the beginning
-                    gemini_messages.insert(
-                        0,
-                        {
-                            "role": "user",
-                            "parts": [{"text": f"[System Instruction] {system_content}"}],
-                        },
-                    )
-        return gemini_messages
-
-    async def _generate_streaming(
-        self, gemini_messages: list, stream_handler: LmStreamHandler, **kwargs
-    ) -> str:
-        """Handle streaming generation"""
-        chat = self.genai_model.start_chat(history=gemini_messages[:-1])
-        last_message = gemini_messages[-1]["parts"][0]["text"] if gemini_messages else ""
-        generation_config = {}
-        for param in ["temperature", "top_p", "top_k", "max_output_tokens"]:
-            if param in kwargs:
-                generation_config[param] = kwargs[param]
-        response_stream = await chat.send_message_async(
-            last_message, generation_config=generation_config, stream=True
-        )
-        full_response = ""
-        async for chunk in response_stream:
-            if chunk.text:
-                stream_handler(chunk.text)
-                full_response += chunk.text
-        return full_response
-
-    async def _generate_non_streaming(self, gemini_messages: list, **kwargs) -> str:
-        """Handle non-streaming generation"""
-        chat = self.genai_model.start_chat(history=gemini_messages[:-1])
-        last_message = gemini_messages[-1]["parts"][0]["text"] if gemini_messages else ""
-        generation_config = {}
-        for param in ["temperature", "top_p", "top_k", "max_output_tokens"]:
-            if param in kwargs:
-                generation_config[param] = kwargs[param]
-        response = await chat.send_message_async(
-            last_message, generation_config=generation_config
+            except Exception:  # E.g., too few tokens to be cached
+                pass
+            else:
+                # (Rebuilt a bit before the cached content actually expires)
+                expires_at = time.time() + 0.9 * self.context_cache_ttl_seconds
+                return genai.GenerativeModel.from_cached_content(cached_content), expires_at
+        genai_model = genai.GenerativeModel(
+            model_name=self.model, system_instruction=system_instruction
         )
-        return response.text
+        return genai_model, float("inf")
 
+    async def _get_genai_model(
+        self, system_instruction: str | None
+    ) -> "genai.GenerativeModel":
+        key = hashlib.sha256((system_instruction or "").encode()).hexdigest()
+        if key in self._genai_models and time.time() < self._genai_models[key][1]:
+            self._genai_models.move_to_end(key)
+            return self._genai_models[key][0]
+        # (Concurrent calls with the same system prompt wait on the same creation, rather
+        # than each putting it in (and paying for) its own cached content)
+        pending = self._pending_genai_models.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._create_genai_model(system_instruction))
+            self._pending_genai_models[key] = pending
+            pending.add_done_callback(lambda _: self._pending_genai_models.pop(key, None))
+        # (Shielded, so that a cancelled call doesn't cancel the creation for the others)
+        self._genai_models[key] = await asyncio.shield(pending)
+        self._genai_models.move_to_end(key)
+        while len(self._genai_models) > self.MAX_N_GENAI_MODELS:
+            self._genai_models.popitem(last=False)
+        return self._genai_models[key][0]
 
-class DeepSeekInstructLm(InstructLm):
-    def __init__(self, api_key: str | None = None, model: str = "deepseek-chat"):
-        super().__init__()
+    def classify_error(self, error: Exception) -> LmErrorKind:
+        # (If the SDK was never imported, the error can't be one of its errors)
+        if "google.api_core.exceptions" in sys.modules:
+            from google.api_core import exceptions as google_exceptions
 
-        api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
+            if isinstance(error, google_exceptions.RetryError):  # (E.g., timeouts)
+                return LmErrorKind.TRANSIENT
+            if isinstance(error, google_exceptions.GoogleAPICallError) and error.code:
+                return classify_http_status_code(error.code)
+        return super().classify_error(error)
 
-        self.client = DeepSeekAPI(api_key=api_key)
-        self.model = model
+    @staticmethod
+    def _split_system_instruction(
+        messages: list[InstructLmMessage],
+    ) -> tuple[str | None, list[dict]]:
+        """Splits the messages into the system instruction and the (Gemini) contents."""
+        sys_prompts = []
+        contents = []
+        for msg in messages:
+            if msg["role"] == InstructLmChatRole.SYS:
+                sys_prompts.append(msg["content"])
+            else:
+                role = "user" if msg["role"] == InstructLmChatRole.USER else "model"
+                contents.append({"role": role, "parts": [{"text": msg["content"]}]})
+        return "\n\n".join(sys_prompts) or None, contents
+
+    def _record_usage(self, usage_metadata: object | None) -> None:
+        self.token_usage.n_calls += 1
+        if usage_metadata is None:
+            return
+        self.token_usage.prompt_tokens += usage_metadata.prompt_token_count
+        self.token_usage.cached_prompt_tokens += usage_metadata.cached_content_token_count
+        self.token_usage.completion_tokens += usage_metadata.candidates_token_count
 
     async def generate(
         self,
         messages: list[InstructLmMessage],
         stream_handler: LmStreamHandler | None = None,
+        response_json_model: type[BaseModel] | None = None,
         **kwargs,
-        # E.g., temperature, max_tokens, top_p, presence_penalty, frequency_penalty...
+        # E.g., temperature, top_p, top_k, max_output_tokens
     ) -> str:
-        async def async_chat_completion(messages, stream=False, **kwargs):
-            """Run DeepSeek's chat_completion method in a thread to make it async-compatible"""
-            loop = asyncio.get_event_loop()
-            return await loop.run_in_executor(
-                None,
-                lambda: self.client.chat_completion(
-                    prompt=messages, stream=stream, model=self.model, **kwargs
-                ),
-            )
+        system_instruction, contents = self._split_system_instruction(messages)
+        genai_model = await self._get_genai_model(system_instruction)
+        generation_config = {
+            param: kwargs[param]
+            for param in self.GENERATION_CONFIG_PARAMS
+            if param in kwargs
+        }
+        if response_json_model is not None:
+            generation_config["response_mime_type"] = "application/json"
+            schema = get_portable_json_schema(response_json_model)
+            if schema.get("properties"):  # (Gemini rejects schemas of empty objects)
+                generation_config["response_schema"] = schema
+        async with _acquire_rate_limit(self.rate_limiter, messages):
+            if stream_handler is not None:
+                response_stream = await genai_model.generate_content_async(
+                    contents, generation_config=generation_config, stream=True
+                )
+                response_text = ""
+                usage_metadata = None
+                chunks = aiter(response_stream)
+                async for chunk in chunks:
+                    # (The usage metadata of the last chunk has the totals)
+                    usage_metadata = chunk.usage_metadata
+                    if chunk.text:
+                        response_text += chunk.text
+                        if call_stream_handler(stream_handler, chunk.text):
+                            await chunks.aclose()
+                            await _close_genai_response_stream(response_stream)
+                            break
+            else:  # No need to stream
+                response = await genai_model.generate_content_async(
+                    contents, generation_config=generation_config
+                )
+                response_text = response.text
+                usage_metadata = response.usage_metadata
+        self._record_usage(usage_metadata)
+        _charge_response_tokens(self.rate_limiter, response_text)
+        return response_text
+
 
-        if stream_handler is not None:
-            stream_generator = await async_chat_completion(messages, stream=True, **kwargs)
+class DeepSeekInstructLm(OpenAIInstructLm):
+    """
+    DeepSeek through its OpenAI-compatible API, using the (natively async) OpenAI client,
+    so that streamed chunks yield to the event loop (and concurrent calls overlap).
 
-            async def async_stream_generator():
-                for chunk in stream_generator:
-                    yield chunk
+    Raises:
+        ValueError: If neither `api_key` nor the `DEEPSEEK_API_KEY` env variable is set.
+    """
 
-            full_response = ""
-            async for chunk_text in async_stream_generator():
-                if chunk_text:
-                    stream_handler(chunk_text)
-                    full_response += chunk_text
+    SUPPORTS_N_COMPLETIONS = False  # (DeepSeek's API doesn't take `n`)
 
-            return full_response
-        else:
-            response = await async_chat_completion(messages, stream=False, **kwargs)
-            return response
+    def __init__(
+        self,
+        api_key: str | None = None,
+        model: str = "deepseek-chat",
+        base_url: str = "https://api.deepseek.com",
+        pool_cfg: HttpClientPoolCfg | None = None,
+        backoff_policy: LmBackoffPolicy | None = None,
+        rate_limits: LmRateLimits | None = None,
+    ):
+        api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
+        if not api_key:
+            # (Else, the OpenAI client would send the `OPENAI_API_KEY` to DeepSeek's API)
+            raise ValueError(
+                "No DeepSeek API key: pass `api_key` or set the `DEEPSEEK_API_KEY` env "
+                "variable."
+            )
+        super().__init__(
+            api_key=api_key,
+            model=model,
+            base_url=base_url,
+            pool_cfg=pool_cfg,
+            backoff_policy=backoff_policy,
+            rate_limits=rate_limits,
+        )
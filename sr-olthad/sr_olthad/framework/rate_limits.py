@@ -0,0 +1,217 @@
+import asyncio
+import contextlib
+import time
+import weakref
+from collections.abc import AsyncIterator, Hashable
+from dataclasses import dataclass
+
+# (A common rule of thumb for English text and the usual BPE tokenizers)
+CHARS_PER_TOKEN_ESTIMATE = 4
+
+
+def estimate_n_tokens(text: str) -> int:
+    """Roughly estimates the number of tokens of a text (without a tokenizer)."""
+    return len(text) // CHARS_PER_TOKEN_ESTIMATE + 1
+
+
+@dataclass(frozen=True)
+class LmRateLimits:
+    """
+    Limits on the requests made to a provider's model (see `LmRateLimiter`).
+
+    Attributes:
+        max_concurrent_requests (int | None): Max number of requests in flight at once.
+        requests_per_minute (float | None): Max number of requests started per minute.
+        tokens_per_minute (float | None): Max number of (estimated) tokens per minute,
+            counting both the prompts and the responses.
+    """
+
+    max_concurrent_requests: int | None = None
+    requests_per_minute: float | None = None
+    tokens_per_minute: float | None = None
+
+
+@dataclass
+class LmRateLimiterStats:
+    """
+    Queueing metrics of an `LmRateLimiter`.
+
+    Attributes:
+        n_requests (int): Number of requests let through.
+        n_delayed_requests (int): Number of those that had to wait for a slot or budget.
+        wait_seconds (float): Total time requests spent waiting.
+        max_wait_seconds (float): Longest time a request spent waiting.
+        n_waiting (int): Number of requests currently waiting.
+        max_n_waiting (int): Max number of requests that were waiting at once.
+        n_in_flight (int): Number of requests currently in flight.
+        max_n_in_flight (int): Max number of requests that were in flight at once.
+    """
+
+    n_requests: int = 0
+    n_delayed_requests: int = 0
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    n_waiting: int = 0
+    max_n_waiting: int = 0
+    n_in_flight: int = 0
+    max_n_in_flight: int = 0
+
+
+class _TokenBucket:
+    """
+    Budget of `amount_per_minute` that refills continuously (i.e., w/out minute-long
+    bursts). Can be overdrawn (e.g., by responses longer than expected), in which case
+    later requests wait for it to refill.
+    """
+
+    def __init__(self, amount_per_minute: float):
+        self.capacity = amount_per_minute
+        self.refill_per_second = amount_per_minute / 60
+        self.amount = amount_per_minute
+        self._refilled_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed_seconds = now - self._refilled_at
+        self.amount = min(
+            self.capacity, self.amount + elapsed_seconds * self.refill_per_second
+        )
+        self._refilled_at = now
+
+    def get_wait_seconds(self, amount: float) -> float:
+        """Gets how long until `amount` is available (capped at the capacity)."""
+        self._refill()
+        missing_amount = min(amount, self.capacity) - self.amount
+        return max(0.0, missing_amount / self.refill_per_second)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.amount -= amount
+
+
+class LmRateLimiter:
+    """
+    Limits the requests to a provider's model to a max number of concurrent requests, and
+    to budgets of requests and tokens per minute, queueing the requests in FIFO order.
+
+    Meant to be shared by all the `InstructLm`s of the same provider/model in the process
+    (see `get_shared_rate_limiter`), since that's what the providers' limits apply to.
+
+    Args:
+        rate_limits (LmRateLimits): The limits to enforce.
+    """
+
+    def __init__(self, rate_limits: LmRateLimits):
+        self.rate_limits = rate_limits
+        self.stats = LmRateLimiterStats()
+        self._request_bucket = None
+        if rate_limits.requests_per_minute is not None:
+            self._request_bucket = _TokenBucket(rate_limits.requests_per_minute)
+        self._token_bucket = None
+        if rate_limits.tokens_per_minute is not None:
+            self._token_bucket = _TokenBucket(rate_limits.tokens_per_minute)
+        # NOTE: asyncio primitives are bound to an event loop, so they're kept per loop
+        # (e.g., for the multiple `asyncio.run`s of a script)
+        self._loop_primitives: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, tuple[asyncio.Semaphore | None, asyncio.Lock]
+        ] = weakref.WeakKeyDictionary()
+
+    def _get_loop_primitives(self) -> tuple[asyncio.Semaphore | None, asyncio.Lock]:
+        loop = asyncio.get_running_loop()
+        if loop not in self._loop_primitives:
+            semaphore = None
+            if self.rate_limits.max_concurrent_requests is not None:
+                semaphore = asyncio.Semaphore(self.rate_limits.max_concurrent_requests)
+            self._loop_primitives[loop] = (semaphore, asyncio.Lock())
+        return self._loop_primitives[loop]
+
+    def _get_wait_seconds(self, n_tokens: int) -> float:
+        wait_seconds = 0.0
+        if self._request_bucket is not None:
+            wait_seconds = self._request_bucket.get_wait_seconds(1)
+        if self._token_bucket is not None:
+            wait_seconds = max(wait_seconds, self._token_bucket.get_wait_seconds(n_tokens))
+        return wait_seconds
+
+    def charge_tokens(self, n_tokens: int) -> None:
+        """
+        Charges tokens to the tokens-per-minute budget (e.g., those of a response, which
+        aren't known until it is generated).
+        """
+        if self._token_bucket is not None:
+            self._token_bucket.take(n_tokens)
+
+    async def _wait_for_budget(self, lock: asyncio.Lock, n_tokens: int) -> bool:
+        was_delayed = lock.locked()
+        async with lock:  # (FIFO, so that requests with many tokens aren't starved)
+            while (wait_seconds := self._get_wait_seconds(n_tokens)) > 0:
+                was_delayed = True
+                await asyncio.sleep(wait_seconds)
+            if self._request_bucket is not None:
+                self._request_bucket.take(1)
+            self.charge_tokens(n_tokens)
+        return was_delayed
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, n_tokens: int = 0) -> AsyncIterator[None]:
+        """
+        Waits for a concurrency slot and for the budgets of one request and `n_tokens`
+        tokens, holding the slot for the duration of the `async with` block.
+
+        Args:
+            n_tokens (int): The (estimated) number of tokens of the request's prompt.
+        """
+        semaphore, lock = self._get_loop_primitives()
+        started_waiting_at = time.monotonic()
+        self.stats.n_waiting += 1
+        self.stats.max_n_waiting = max(self.stats.max_n_waiting, self.stats.n_waiting)
+        try:
+            was_delayed = semaphore is not None and semaphore.locked()
+            if semaphore is not None:
+                await semaphore.acquire()
+            try:
+                was_delayed |= await self._wait_for_budget(lock, n_tokens)
+            except BaseException:
+                if semaphore is not None:
+                    semaphore.release()
+                raise
+        finally:
+            self.stats.n_waiting -= 1
+
+        wait_seconds = time.monotonic() - started_waiting_at
+        self.stats.n_requests += 1
+        self.stats.n_delayed_requests += was_delayed
+        self.stats.wait_seconds += wait_seconds
+        self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, wait_seconds)
+        self.stats.n_in_flight += 1
+        self.stats.max_n_in_flight = max(self.stats.max_n_in_flight, self.stats.n_in_flight)
+        try:
+            yield
+        finally:
+            self.stats.n_in_flight -= 1
+            if semaphore is not None:
+                semaphore.release()
+
+
+# Process-wide registry of rate limiters, so that all `InstructLm`s of the same
+# provider/model (across agents and `SrOlthad` instances) share one
+_SHARED_RATE_LIMITERS: dict[Hashable, LmRateLimiter] = {}
+
+
+def get_shared_rate_limiter(key: Hashable, rate_limits: LmRateLimits) -> LmRateLimiter:
+    """
+    Gets the process-wide shared rate limiter for a key (e.g., (provider, base URL,
+    model)), creating it with `rate_limits` if it doesn't exist yet.
+
+    Raises:
+        ValueError: If the existing rate limiter for the key has different limits.
+    """
+    if key not in _SHARED_RATE_LIMITERS:
+        _SHARED_RATE_LIMITERS[key] = LmRateLimiter(rate_limits)
+    rate_limiter = _SHARED_RATE_LIMITERS[key]
+    if rate_limiter.rate_limits != rate_limits:
+        raise ValueError(
+            f"The rate limiter for {key} already exists with different limits "
+            f"({rate_limiter.rate_limits} vs. {rate_limits})"
+        )
+    return rate_limiter
@@ -1,6 +1,11 @@
+import asyncio
+import random
 from abc import ABC, abstractmethod
-from collections.abc import Callable
+from collections.abc import Callable, Hashable
+from contextvars import ContextVar
+from dataclasses import dataclass, replace
 from enum import StrEnum
+from functools import partial
 from typing import Any, Protocol, TypeAlias
 
 from pydantic import BaseModel
@@ -59,7 +64,100 @@ class LmStreamsHandler(Protocol):
         ...
 
 
+class StopLmStream(Exception):
+    """
+    Raised by an `LmStreamHandler` to stop the LM stream (i.e., cancel the rest of the
+    generation), in which case `InstructLm.generate` returns what was streamed so far.
+    """
+
+
+@dataclass(frozen=True)
+class InstructLmCallContext:
+    """
+    Info about the `InstructLm.generate` call being made in the current (async) context,
+    made available through `INSTRUCT_LM_CALL_CONTEXT` (e.g., to `InstructLm` wrappers).
+
+    Attributes:
+        voting_sample_idx (int | None): The index of the self-consistency 'voting' sample
+            being generated (or None if not voting).
+        attempt_idx (int): The index of the attempt at getting a valid response (i.e., 0
+            for the first attempt and incremented with every retry).
+    """
+
+    voting_sample_idx: int | None = None
+    attempt_idx: int = 0
+
+
+# (None if there is no ongoing call made by an `InstructLmAgent`)
+INSTRUCT_LM_CALL_CONTEXT: ContextVar[InstructLmCallContext | None] = ContextVar(
+    "instruct_lm_call_context", default=None
+)
+
+
+class LmErrorKind(StrEnum):
+    """
+    Kinds of errors of LM calls, which call for different ways of retrying.
+    """
+
+    TRANSIENT = "transient"  # E.g., rate limits, server errors, timeouts (retry w/ backoff)
+    INVALID_RESPONSE = "invalid_response"  # E.g., unparsable responses (retry right away)
+    FATAL = "fatal"  # E.g., authentication or bad request errors (don't retry)
+    OTHER = "other"  # Unknown errors (retry right away)
+
+
+def classify_http_status_code(status_code: int) -> LmErrorKind:
+    """Classifies the HTTP status code of a failed LM API request."""
+    if status_code in (408, 409, 429) or status_code >= 500:
+        return LmErrorKind.TRANSIENT
+    if 400 <= status_code < 500:
+        return LmErrorKind.FATAL
+    return LmErrorKind.OTHER
+
+
+@dataclass(frozen=True)
+class LmBackoffPolicy:
+    """
+    How to back off before retrying LM calls that failed with transient errors (e.g., due
+    to rate limits), so that retries don't amplify the load during rate-limit storms.
+
+    Attributes:
+        max_retries (int): Max number of retries (of the LM calls made to get one parsable
+            response).
+        base_delay_seconds (float): The delay before the first retry (doubled with every
+            retry).
+        max_delay_seconds (float): Cap on the delays (incl. those asked for by the API).
+        jitter (bool): Whether to use "full jitter", i.e., random delays between 0 and the
+            exponential delay (so that concurrent retries are spread out).
+    """
+
+    max_retries: int = 5
+    base_delay_seconds: float = 1.0
+    max_delay_seconds: float = 60.0
+    jitter: bool = True
+
+    def get_delay_seconds(
+        self, retry_idx: int, retry_after_seconds: float | None = None
+    ) -> float:
+        """
+        Gets the delay before a retry.
+
+        Args:
+            retry_idx (int): The index of the retry (0 for the first one).
+            retry_after_seconds (float | None): The delay asked for by the API (e.g., in a
+                Retry-After header), if any, which the delay won't be shorter than.
+        """
+        delay = min(self.max_delay_seconds, self.base_delay_seconds * 2**retry_idx)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        if retry_after_seconds is not None:
+            delay = max(delay, min(retry_after_seconds, self.max_delay_seconds))
+        return delay
+
+
 class InstructLm(ABC):
+    # How to back off before retrying after transient errors (can be set per provider/LM)
+    backoff_policy: LmBackoffPolicy = LmBackoffPolicy()
+
     @abstractmethod
     async def generate(
         self,
@@ -67,4 +165,116 @@ class InstructLm(ABC):
         stream_handler: LmStreamHandler | None = None,
         **kwargs,
     ) -> str:
+        """
+        Generates a response to the messages.
+
+        Args:
+            messages (list[InstructLmMessage]): The chat messages.
+            stream_handler (LmStreamHandler | None): If provided, gets the response's
+                chunks as they are streamed (and can stop the stream, see `StopLmStream`).
+            **kwargs: Generation kwargs. `InstructLm`s that support structured output
+                (i.e., schema-constrained decoding) take a `response_json_model` (type of
+                pydantic BaseModel) to constrain the response to (others may raise).
+        """
         pass
+
+    async def generate_many(
+        self,
+        messages: list[InstructLmMessage],
+        n: int,
+        streams_handler: LmStreamsHandler | None = None,
+        max_concurrent_calls: int | None = None,
+        **kwargs,
+    ) -> list[str]:
+        """
+        Generates n responses to the same messages (e.g., for self-consistency 'voting').
+
+        By default, makes n concurrent `generate` calls (each in the `InstructLmCallContext`
+        of its voting sample, counting from the current context's `voting_sample_idx`, if
+        any), at most `max_concurrent_calls` at a time. `InstructLm`s whose API can sample
+        n responses in one request (i.e., paying for the prompt once) override this.
+
+        Args:
+            messages (list[InstructLmMessage]): The chat messages.
+            n (int): The number of responses.
+            streams_handler (LmStreamsHandler | None): If provided, gets the responses'
+                chunks as they are streamed, with the `stream_idx` of their response (and
+                can stop that response's stream, see `StopLmStream`).
+            max_concurrent_calls (int | None): The max number of concurrent `generate`
+                calls, if making n of them (if None, no limit).
+            **kwargs: Generation kwargs (see `generate`).
+        """
+        call_context = INSTRUCT_LM_CALL_CONTEXT.get() or InstructLmCallContext()
+        first_sample_idx = call_context.voting_sample_idx or 0
+        semaphore = asyncio.Semaphore(max_concurrent_calls or max(n, 1))
+
+        async def generate_sample(sample_idx: int) -> str:
+            # (Set in the sample's own task, so it doesn't leak into the other samples)
+            INSTRUCT_LM_CALL_CONTEXT.set(
+                replace(call_context, voting_sample_idx=first_sample_idx + sample_idx)
+            )
+            stream_handler = None
+            if streams_handler is not None:
+                stream_handler = partial(streams_handler, stream_idx=sample_idx)
+            async with semaphore:
+                return await self.generate(messages, stream_handler, **kwargs)
+
+        return await asyncio.gather(*(generate_sample(idx) for idx in range(n)))
+
+    async def get_next_token_logprobs(
+        self,
+        messages: list[InstructLmMessage],
+        n_top: int = 20,
+        **kwargs,
+    ) -> dict[str, float]:
+        """
+        Gets the log probabilities of the most likely first tokens of a response to the
+        messages (i.e., generating only one token), for the `InstructLm`s whose API
+        exposes them.
+
+        Args:
+            messages (list[InstructLmMessage]): The chat messages.
+            n_top (int): The number of most likely tokens to get.
+            **kwargs: Generation kwargs (see `generate`).
+
+        Returns:
+            dict[str, float]: The log probabilities of the (up to) `n_top` tokens.
+
+        Raises:
+            NotImplementedError: If the `InstructLm` doesn't expose log probabilities.
+        """
+        raise NotImplementedError(f"{type(self).__name__} doesn't expose logprobs")
+
+    async def warm_up(self) -> None:
+        """
+        Warms up the underlying client (e.g., opens a connection to the API) so that the
+        first `generate` call doesn't pay for the setup. No-op by default.
+        """
+        return None
+
+    @property
+    def client_key(self) -> Hashable:
+        """
+        Key of the client that `warm_up` warms up (i.e., warming up one of the LMs with the
+        same key warms up all of them). Defaults to the LM itself (i.e., not shared).
+        """
+        return self
+
+    def classify_error(self, error: Exception) -> LmErrorKind:
+        """
+        Classifies an error raised by `generate` (to decide how to retry). By default, by
+        its HTTP status code (if it has one).
+        """
+        if isinstance(error, TimeoutError | ConnectionError):
+            return LmErrorKind.TRANSIENT
+        status_code = getattr(error, "status_code", None)
+        if isinstance(status_code, int):
+            return classify_http_status_code(status_code)
+        return LmErrorKind.OTHER
+
+    def get_retry_after_seconds(self, error: Exception) -> float | None:
+        """
+        Gets how long the API asked to wait before retrying (e.g., with a Retry-After
+        header) after an error raised by `generate` (or None if it didn't).
+        """
+        return None
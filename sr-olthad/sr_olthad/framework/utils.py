@@ -2,8 +2,8 @@ import asyncio
 import inspect
 import json
 import re
-from collections.abc import Awaitable, Callable, Coroutine
-from typing import Any, TypeVar
+from collections.abc import Awaitable, Callable, Coroutine, Iterator
+from typing import Any, Generic, TypeVar
 
 from jinja2 import Template
 from pydantic import BaseModel, ValidationError
@@ -12,6 +12,8 @@ from typing_extensions import ParamSpec
 from sr_olthad.framework.schema import (
     InstructLmChatRole,
     InstructLmMessage,
+    LmStreamHandler,
+    StopLmStream,
 )
 
 BaseModelT = TypeVar("BaseModelT", bound=BaseModel)
@@ -33,6 +35,44 @@ def get_prompt_json_spec(model_class: type[BaseModel]) -> str:
     return json.dumps(result, indent=2)
 
 
+# The JSON schema keywords supported by (all of) the providers' structured-output modes
+_PORTABLE_JSON_SCHEMA_KEYWORDS = {"type", "description", "enum", "items", "properties"}
+
+
+def get_portable_json_schema(
+    model_class: type[BaseModel], forbid_additional_properties: bool = False
+) -> dict[str, Any]:
+    """
+    Given a Pydantic BaseModel type, returns its JSON schema in a form that the providers'
+    structured-output (i.e., schema-constrained decoding) modes accept, i.e., with the
+    `$ref`s inlined, every field required, and without the keywords they don't support
+    (e.g., titles, defaults, or the `field_type`s of `json_schema_extra`).
+
+    NOTE: Doesn't support recursive models (nor unions).
+    """
+    schema = model_class.model_json_schema()
+    defs = schema.pop("$defs", {})
+
+    def make_portable(node: dict[str, Any]) -> dict[str, Any]:
+        if "$ref" in node:  # (Keeping the referring node's keywords, e.g., description)
+            node = {**defs[node["$ref"].split("/")[-1]], **node}
+        portable_node = {}
+        for keyword, value in node.items():
+            if keyword == "properties":
+                portable_node[keyword] = {k: make_portable(v) for k, v in value.items()}
+            elif keyword == "items":
+                portable_node[keyword] = make_portable(value)
+            elif keyword in _PORTABLE_JSON_SCHEMA_KEYWORDS:
+                portable_node[keyword] = value
+        if "properties" in portable_node:
+            portable_node["required"] = list(portable_node["properties"])
+            if forbid_additional_properties:
+                portable_node["additionalProperties"] = False
+        return portable_node
+
+    return make_portable(schema)
+
+
 def render_single_turn_prompt_templates_and_get_messages(
     user_prompt_template: Template,
     user_prompt_input_data: BaseModel | None = None,
@@ -66,35 +106,208 @@ def render_single_turn_prompt_templates_and_get_messages(
     return messages
 
 
+# The only chars that matter for finding where JSON objects start/end (incl. in strings)
+_JSON_STRUCTURAL_CHARS_PATTERN = re.compile(r'[{}"\\]')
+
+
+class JsonObjectScanner:
+    """
+    Single-pass (i.e., linear-time) scanner of the spans of the (candidate) JSON objects
+    in a text, i.e., of its substrings enclosed in balanced curly braces. It can be fed
+    the text incrementally (e.g., chunk by chunk as it is streamed).
+
+    Braces inside JSON strings are ignored, and so are quotes outside of any braces (e.g.,
+    in the prose around the JSON).
+    """
+
+    def __init__(self):
+        # Where to resume scanning (can exceed the text length by one when the text ends
+        # with a backslash escaping the first char of the next chunk)
+        self._scan_idx = 0
+        self._is_in_string = False
+        self._open_brace_idxs: list[int] = []
+
+    def scan(self, text: str) -> Iterator[tuple[int, int, int]]:
+        """
+        Scans the text (from where the previous scan of its previous chunks stopped).
+
+        Args:
+            text (str): The whole text so far.
+
+        Yields:
+            tuple[int, int, int]: The (start idx, end idx, nesting depth) of every candidate
+                object, as soon as its closing brace is scanned.
+        """
+        while match := _JSON_STRUCTURAL_CHARS_PATTERN.search(text, self._scan_idx):
+            char = match.group()
+            self._scan_idx = match.end()
+            if self._is_in_string:
+                if char == "\\":
+                    self._scan_idx += 1  # Skip the escaped char
+                elif char == '"':
+                    self._is_in_string = False
+            elif char == "{":
+                self._open_brace_idxs.append(match.start())
+            elif char == "}" and self._open_brace_idxs:
+                start_idx = self._open_brace_idxs.pop()
+                yield start_idx, self._scan_idx, len(self._open_brace_idxs)
+            elif char == '"' and self._open_brace_idxs:
+                self._is_in_string = True
+
+
+# In the reversed text: the braces, and the quotes with the backslashes that precede them
+# (in the actual text)
+_REVERSED_JSON_STRUCTURAL_TOKENS_PATTERN = re.compile(r'[{}]|"\\*')
+
+
+def iter_json_object_candidates(text: str) -> Iterator[str]:
+    """
+    Yields the candidate JSON objects of a text (i.e., its substrings enclosed in balanced
+    curly braces, ignoring braces in JSON strings), lazily scanning the text (once) from
+    its end. Candidates are yielded from the one that ends last, outer before nested.
+
+    Since a quoted closing brace in the prose after the JSON (e.g., 'I avoided "}".')
+    throws off which quotes open strings when scanning from the end, the candidates of a
+    (forward) `JsonObjectScanner` scan are yielded after those (minus the duplicates).
+    """
+    yielded_spans: set[tuple[int, int]] = set()
+    text_len = len(text)
+    end_idxs: list[int] = []  # End idxs of the candidates whose start isn't scanned yet
+    nested_spans: list[tuple[int, int]] = []  # (Yielded after their outermost candidate)
+    is_in_string = False
+    reversed_text = text[::-1]
+    for match in _REVERSED_JSON_STRUCTURAL_TOKENS_PATTERN.finditer(reversed_text):
+        token = match.group()
+        if token[0] == '"':
+            # A quote preceded by an odd number of backslashes is escaped
+            if end_idxs and len(token) % 2 == 1:
+                is_in_string = not is_in_string
+        elif is_in_string:
+            continue
+        elif token == "}":
+            end_idxs.append(text_len - match.start())
+        elif end_idxs:  # (I.e., a "{" that opens a candidate)
+            nested_spans.append((text_len - match.end(), end_idxs.pop()))
+            if end_idxs:
+                continue
+            for span in sorted(nested_spans, key=lambda s: (-s[1], s[0])):
+                yielded_spans.add(span)
+                yield text[span[0] : span[1]]
+            nested_spans.clear()
+    # Candidates nested in unbalanced (e.g., prose) closing braces, then those of the
+    # forward scan
+    forward_spans = [span[:2] for span in JsonObjectScanner().scan(text)]
+    for spans in (nested_spans, forward_spans):
+        for span in sorted(spans, key=lambda s: (-s[1], s[0])):
+            if span not in yielded_spans:
+                yielded_spans.add(span)
+                yield text[span[0] : span[1]]
+
+
+def _is_json_invalid_error(error: ValidationError) -> bool:
+    return any(err["type"] == "json_invalid" for err in error.errors())
+
+
 def detect_extract_and_parse_json_from_text(
     text: str, model_to_extract: type[BaseModelT]
 ) -> BaseModelT:
     """
-    Detects, extracts, and parses JSON from text as a specified Pydantic BaseModel.
+    Detects, extracts, and parses JSON from text as a specified Pydantic BaseModel,
+    preferring the JSON objects closer to the end of the text.
 
     Raises:
         ValueError: If no valid JSON is found in the text
         ValidationError: If the JSON doesn't match the model's structure
     """
-    try:
-        # Pattern to match JSON objects (including nested) between curly braces
-        json_pattern = r"\{(?:[^{}]|\{[^{}]*\})*\}"
-        matches = re.findall(json_pattern, text)
-        if len(matches) == 0:
-            raise ValueError("No valid JSON found in the text")
-        for json_str_match in reversed(matches):
+    for json_str in iter_json_object_candidates(text):
+        try:
+            # NOTE: Pydantic parses the JSON with its (fast, Rust-based) JSON parser
+            return model_to_extract.model_validate_json(json_str)
+        except ValidationError as e:
+            if _is_json_invalid_error(e):
+                continue  # Silently try next candidate if JSON parsing fails
+            # (The last parsable JSON is the answer, so earlier ones aren't fallen back to)
+            raise
+    raise ValueError("No valid JSON found in the text")
+
+
+_CODE_FENCE = "```"
+
+
+class StreamingJsonDetector(Generic[BaseModelT]):
+    """
+    Incrementally scans streamed text (chunk by chunk, in a single pass) for the first
+    complete top-level JSON object that is valid as a specified Pydantic BaseModel and is
+    final, i.e., followed by a closing code fence (e.g., so that an LM stream can be
+    stopped as soon as it has emitted its JSON answer).
+
+    A valid object followed by anything else (e.g., a draft or an example in the LM's
+    reasoning) isn't detected, since the answer may come later in the text.
+
+    Args:
+        model_to_detect (type[BaseModelT]): The model the JSON object must be valid as.
+
+    Attributes:
+        detected (BaseModelT | None): The detected object (None until detected).
+    """
+
+    def __init__(self, model_to_detect: type[BaseModelT]):
+        self.model_to_detect = model_to_detect
+        self.detected: BaseModelT | None = None
+        self._text = ""
+        self._scanner = JsonObjectScanner()
+        # The last valid object and its end idx, while it isn't known whether it's final
+        self._candidate: tuple[BaseModelT, int] | None = None
+
+    def _is_candidate_final(self) -> bool:
+        """Checks whether the candidate is final (dropping it if it is known not to be)."""
+        if self._candidate is None:
+            return False
+        candidate, end_idx = self._candidate
+        following_text = self._text[end_idx:].lstrip()
+        if following_text.startswith(_CODE_FENCE):
+            self.detected = candidate
+            return True
+        if not _CODE_FENCE.startswith(following_text):
+            self._candidate = None  # (Followed by something other than a closing fence)
+        return False
+
+    def feed(self, chunk_str: str) -> bool:
+        """
+        Scans the next chunk of the text.
+
+        Returns:
+            bool: Whether a valid (final) JSON object has been detected (by now).
+        """
+        if self.detected is not None:
+            return True
+        self._text += chunk_str
+        for start_idx, end_idx, depth in self._scanner.scan(self._text):
+            if depth > 0:
+                continue
+            if self._is_candidate_final():  # (E.g., a fence then another object)
+                return True
+            json_str = self._text[start_idx:end_idx]
             try:
-                return model_to_extract.model_validate_json(json_str_match)
-            except json.JSONDecodeError:
-                continue  # Silently try next match if JSON parsing fails
-            except ValidationError as e:
-                raise ValidationError(
-                    f"JSON data doesn't match the expected model structure: {str(e)}",
-                    model_to_extract,
-                ) from e
-        raise ValueError("No valid JSON could be parsed from the text")
-    except Exception as e:
-        raise ValueError(f"Error processing text: {str(e)}") from e
+                candidate = self.model_to_detect.model_validate_json(json_str)
+            except ValidationError:
+                continue  # (E.g., some other JSON in the LM's reasoning)
+            self._candidate = (candidate, end_idx)
+        return self._is_candidate_final()
+
+
+def call_stream_handler(stream_handler: LmStreamHandler, chunk_str: str) -> bool:
+    """
+    Passes a chunk of an LM stream to a stream handler.
+
+    Returns:
+        bool: Whether the stream handler asked to stop the stream (see `StopLmStream`).
+    """
+    try:
+        stream_handler(chunk_str)
+        return False
+    except StopLmStream:
+        return True
 
 
 P = ParamSpec("P")
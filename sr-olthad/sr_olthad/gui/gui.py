@@ -3,6 +3,7 @@ import textwrap
 
 from nicegui import html, ui
 
+from sr_olthad.framework.agents import LmRetryInfo
 from sr_olthad.framework.schema import InstructLmMessage, LmStreamsHandler
 from sr_olthad.lm_step import PostLmStepEmission, PreLmStepEmission
 
@@ -244,7 +245,9 @@ class GuiApp:
                 self.lm_response_text_boxes.append(text_box)
                 ui.separator()
 
-    async def handle_lm_retry(self, idx: int, msg: str) -> None:
+    async def handle_lm_retry(
+        self, idx: int, msg: str, retry_info: LmRetryInfo | None = None
+    ) -> None:
         with self.content:
             ui.notify(msg, type="warning")
         self.lm_response_text_boxes[idx].reset()
@@ -1,15 +1,17 @@
+import asyncio
 from collections.abc import Callable
 from dataclasses import dataclass
+from functools import cached_property
 from typing import Generic, Protocol, TypeVar
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from sr_olthad.framework.agents import (
     InstructLmAgentOutput,
     InstructLmAgentRunMethod,
     LmRetryHandler,
 )
-from sr_olthad.framework.schema import InstructLmMessage
+from sr_olthad.framework.schema import InstructLmMessage, LmStreamsHandler
 from sr_olthad.framework.utils import call_or_await
 from sr_olthad.olthad import PendingOlthadUpdate
 from sr_olthad.schema import (
@@ -28,8 +30,13 @@ class PreLmStepEmission(BaseModel):
 
 
 class PostLmStepEmission(BaseModel):
-    diff: list[str]
     full_messages: list[InstructLmMessage] | list[list[InstructLmMessage]]
+    get_diff: Callable[[], list[str]] = Field(exclude=True, repr=False)
+
+    @cached_property
+    def diff(self) -> list[str]:
+        """The "diff" of the pending OLTHAD update (computed on first access)."""
+        return self.get_diff()
 
 
 class PreLmStepHandler(Protocol):
@@ -60,19 +67,126 @@ class PostLmStepApprover(Protocol):
 LmStepOutputT = TypeVar("LmStepOutputT")
 
 
+class BufferedLmStreamsHandler:
+    """
+    An `LmStreamsHandler` that buffers the chunks it gets until it is released, upon which
+    it replays them to the wrapped streams handler (and then passes the next chunks on as
+    they come).
+
+    Args:
+        streams_handler (LmStreamsHandler): The wrapped streams handler.
+    """
+
+    def __init__(self, streams_handler: LmStreamsHandler):
+        self.streams_handler = streams_handler
+        self.is_released = False
+        self._chunks: list[tuple[str, int | None]] = []
+
+    def __call__(self, chunk_str: str, stream_idx: int | None = None):
+        if self.is_released:
+            self.streams_handler(chunk_str, stream_idx=stream_idx)
+        else:
+            self._chunks.append((chunk_str, stream_idx))
+
+    def release(self) -> None:
+        """Replays the buffered chunks and stops buffering."""
+        self.is_released = True
+        for chunk_str, stream_idx in self._chunks:
+            self.streams_handler(chunk_str, stream_idx=stream_idx)
+        self._chunks.clear()
+
+
+@dataclass
+class SpeculativeLmStepRun:
+    """
+    An LM agent run that was started ahead of (and possibly without ever) being needed by
+    a composed LM step.
+
+    Attributes:
+        input_messages (list[InstructLmMessage]): The input messages of the run.
+        output (asyncio.Task[InstructLmAgentOutput]): The (possibly still running) run.
+        streams_buffer (BufferedLmStreamsHandler | None): The buffer of the run's streams
+            (released once the step using the run has been emitted), if streamed.
+    """
+
+    input_messages: list[InstructLmMessage]
+    output: asyncio.Task[InstructLmAgentOutput]
+    streams_buffer: BufferedLmStreamsHandler | None = None
+
+
 class LmStep(Protocol, Generic[LmStepOutputT]):
     async def __call__(self) -> LmStepOutputT: ...
 
 
 @dataclass
 class LmStepTemplate:
-    pre_lm_step_handler: PreLmStepHandler = lambda _: None
-    lm_retry_handler: LmRetryHandler = lambda _, __: None
-    post_lm_step_approver: PostLmStepApprover = lambda _: True
+    """
+    Template for composing LM steps that emit to the (optional) pre-step handler and
+    post-step approver.
+
+    NOTE: If no pre-step handler and/or post-step approver is provided, the respective
+    emissions aren't constructed at all (and steps are always approved).
+    """
+
+    pre_lm_step_handler: PreLmStepHandler | None = None
+    lm_retry_handler: LmRetryHandler = lambda _, __, ___=None: None
+    post_lm_step_approver: PostLmStepApprover | None = None
     get_domain_specific_sys_prompt_input_data: GetDomainSpecificSysPromptInputData | None = (
         None
     )
 
+    def _get_input_messages(
+        self, lm_agent_name: LmAgentName, prompt_input_data: UserPromptInputData
+    ) -> list[InstructLmMessage]:
+        # Get sys prompt input data dynamically by calling the getter callback if any
+        if self.get_domain_specific_sys_prompt_input_data is None:
+            sys_prompt_input_data = None
+        else:
+            sys_prompt_input_data = self.get_domain_specific_sys_prompt_input_data(
+                lm_agent_name=lm_agent_name, user_prompt_input_data=prompt_input_data
+            )
+
+        # Get input messages
+        return get_input_messages(
+            lm_agent_name=lm_agent_name,
+            user_prompt_input_data=prompt_input_data,
+            sys_prompt_input_data=sys_prompt_input_data,
+        )
+
+    def speculate(
+        self,
+        run_step: InstructLmAgentRunMethod,
+        lm_agent_name: LmAgentName,
+        prompt_input_data: UserPromptInputData,
+        streams_handler: LmStreamsHandler | None = None,
+    ) -> SpeculativeLmStepRun:
+        """
+        Starts running an LM agent in the background so that its output can later be
+        consumed by a step composed with `speculative_run` (or cancelled if not needed).
+
+        If the LM agent streams (i.e., given its `streams_handler`), the run's streams are
+        buffered until its step has been emitted to the pre-step handler (so that they
+        aren't interleaved with the streams of the steps emitted before it).
+
+        NOTE: Must be called from within a running event loop.
+        """
+        input_messages = self._get_input_messages(lm_agent_name, prompt_input_data)
+        run_kwargs = {}
+        streams_buffer = None
+        if streams_handler is not None:
+            streams_buffer = BufferedLmStreamsHandler(streams_handler)
+            run_kwargs["streams_handler"] = streams_buffer
+        output = asyncio.create_task(
+            run_step(
+                input_messages=input_messages,
+                retry_callback=self.lm_retry_handler,
+                **run_kwargs,
+            )
+        )
+        return SpeculativeLmStepRun(
+            input_messages=input_messages, output=output, streams_buffer=streams_buffer
+        )
+
     def compose(
         self,
         run_step: InstructLmAgentRunMethod,
@@ -83,47 +197,62 @@ class LmStepTemplate:
         cur_node_id: str,
         prompt_input_data: UserPromptInputData,
         n_streams_to_handle: int = 1,
+        speculative_run: SpeculativeLmStepRun | None = None,
     ) -> LmStep[LmStepOutputT]:
+        """
+        Composes an LM step that runs the LM agent until its output is approved and then
+        commits the resulting pending OLTHAD update.
+
+        If a `speculative_run` (see `speculate`) is provided, its output is used for the
+        first attempt instead of running the LM agent again.
+        """
+
         async def _lm_step() -> LmStepOutputT:
-            # Get sys prompt input data dynamically by calling the getter callback if any
-            if self.get_domain_specific_sys_prompt_input_data is None:
-                sys_prompt_input_data = None
+            streams_buffer = None
+            if speculative_run is not None:
+                input_messages = speculative_run.input_messages
+                speculative_output = speculative_run.output
+                streams_buffer = speculative_run.streams_buffer
             else:
-                sys_prompt_input_data = self.get_domain_specific_sys_prompt_input_data(
-                    lm_agent_name=lm_agent_name, user_prompt_input_data=prompt_input_data
-                )
-
-            # Get input messages
-            input_messages = get_input_messages(
-                lm_agent_name=lm_agent_name,
-                user_prompt_input_data=prompt_input_data,
-                sys_prompt_input_data=sys_prompt_input_data,
-            )
+                input_messages = self._get_input_messages(lm_agent_name, prompt_input_data)
+                speculative_output = None
 
             # Prepare pre-lm callback
-            pre_step_emission = PreLmStepEmission(
-                lm_agent_name=lm_agent_name,
-                cur_node_id=cur_node_id,
-                input_messages=input_messages,
-                n_streams_to_handle=n_streams_to_handle,
-            )
+            if self.pre_lm_step_handler is not None:
+                pre_step_emission = PreLmStepEmission(
+                    lm_agent_name=lm_agent_name,
+                    cur_node_id=cur_node_id,
+                    input_messages=input_messages,
+                    n_streams_to_handle=n_streams_to_handle,
+                )
 
             # Run step until approved
             step_is_approved = False
             while not step_is_approved:
-                await call_or_await(self.pre_lm_step_handler, pre_step_emission)
-                output = await run_step(
-                    input_messages=input_messages,
-                    retry_callback=self.lm_retry_handler,
-                )
+                if self.pre_lm_step_handler is not None:
+                    await call_or_await(self.pre_lm_step_handler, pre_step_emission)
+                if speculative_output is not None:
+                    if streams_buffer is not None:
+                        streams_buffer.release()
+                    output = await speculative_output
+                    speculative_output = None  # (Re-runs are not speculative)
+                else:
+                    output = await run_step(
+                        input_messages=input_messages,
+                        retry_callback=self.lm_retry_handler,
+                    )
                 return_if_approved, pending_update = process_output(output)
-                post_step_emission = PostLmStepEmission(
-                    diff=pending_update.get_diff(),
-                    full_messages=output.messages,
-                )
-                step_is_approved = await call_or_await(
-                    self.post_lm_step_approver, post_step_emission
-                )
+                if self.post_lm_step_approver is None:
+                    step_is_approved = True
+                else:
+                    post_step_emission = PostLmStepEmission(
+                        full_messages=output.messages,
+                        # NOTE: The diff is only computed if the approver accesses it
+                        get_diff=pending_update.get_diff,
+                    )
+                    step_is_approved = await call_or_await(
+                        self.post_lm_step_approver, post_step_emission
+                    )
                 if step_is_approved:
                     pending_update.commit()
                     return return_if_approved
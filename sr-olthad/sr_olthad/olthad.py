@@ -6,10 +6,10 @@ is very high-up in the import hierarchy due to it being imported by sr_olthad.pr
 to construct and stringify example OLTHADs for the prompts (which are declared at import time).
 """
 
-import difflib
 import json
 from collections.abc import Callable, Generator
 from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import ClassVar, Self
 
 from sr_olthad.config import SrOlthadCfg
@@ -78,6 +78,17 @@ class OlthadTraversal:
     def nodes(self) -> dict[str, "TaskNode"]:
         return self._nodes
 
+    def _invalidate_stringified_path(self, node: "TaskNode") -> None:
+        """
+        Clears the cached stringified fragments of `node` and all of its ancestors.
+
+        NOTE: Must be called after any mutation of a node's status, retrospective, or
+        subtasks, since the cached fragments of its ancestors embed its own.
+        """
+        while node is not None:
+            node._stringified_fragments_cache = None
+            node = self._nodes.get(node._parent_id) if node._parent_id else None
+
     def backtrack_to(self, node_id: str | None) -> None:
         if node_id is None:  # Skip below if backtracking out of the root node
             self._cur_node = None
@@ -93,6 +104,7 @@ class OlthadTraversal:
                 del self._nodes[subtask_node._id]
             self._cur_node._non_planned_subtasks = []
             self._cur_node._planned_subtasks = []
+            self._invalidate_stringified_path(self._cur_node)
             # Backtrack
             self._cur_node = self._nodes[self._cur_node._parent_id]
 
@@ -114,6 +126,7 @@ class OlthadTraversal:
         self._cur_node._non_planned_subtasks.append(new_cur_node)
         self._cur_node = new_cur_node
         self._cur_node._status = TaskStatus.IN_PROGRESS
+        self._invalidate_stringified_path(self._cur_node)
 
     def update_planned_subtasks_of_cur_node(
         self, new_planned_subtasks: list[str]
@@ -139,6 +152,7 @@ class OlthadTraversal:
             for new_subtask_node in new_subtask_node_objects:
                 self._nodes[new_subtask_node._id] = new_subtask_node
             self._cur_node._planned_subtasks = new_subtask_node_objects
+            self._invalidate_stringified_path(self._cur_node)
 
         def get_diff():
             current_node_copy_with_changes = TaskNode(
@@ -164,9 +178,9 @@ class OlthadTraversal:
         new_status: TaskStatus,
         new_retrospective: str | None = None,
     ):
-        is_current_node = node == self._cur_node
+        is_current_node = node._id == self._cur_node._id
         is_subtask = node._parent_id == self._cur_node._id
-        is_ancestor = self._cur_node._id.startswith(node._id)
+        is_ancestor = node._is_ancestor_of(self._cur_node)
         if not is_current_node and not is_subtask and not is_ancestor:
             msg = "The node to update must be the current node, a subtask of the current node, or an ancestor of the current node."
             raise OlthadUsageError(msg)
@@ -185,6 +199,7 @@ class OlthadTraversal:
                 # (we've already asserted that it's the first planned subtask)
                 self._cur_node._planned_subtasks.remove(node)
                 self._cur_node._non_planned_subtasks.append(node)
+            self._invalidate_stringified_path(node)
 
         def get_diff():
             pending_change = TaskNode(
@@ -211,7 +226,56 @@ class OlthadTraversal:
         )
 
 
-@dataclass
+def _diff_line_lists(old_lines: list[str], new_lines: list[str]) -> list[str]:
+    """
+    Gets `difflib.Differ`-style diff lines for two lists of lines that are known to
+    stand in for one another, in linear time.
+
+    Lists of equal length are compared line by line (as is the case for, e.g., a task
+    node whose status changed). Otherwise, the common leading and trailing lines are
+    kept as context and whatever lies between them is removed/added as blocks.
+    """
+    if len(old_lines) == len(new_lines):
+        diff_lines = []
+        for old_line, new_line in zip(old_lines, new_lines, strict=True):
+            if old_line == new_line:
+                diff_lines.append("  " + old_line)
+            else:
+                diff_lines.append("- " + old_line)
+                diff_lines.append("+ " + new_line)
+        return diff_lines
+
+    n_common_leading = 0
+    max_n_common = min(len(old_lines), len(new_lines))
+    while (
+        n_common_leading < max_n_common
+        and old_lines[n_common_leading] == new_lines[n_common_leading]
+    ):
+        n_common_leading += 1
+    n_common_trailing = 0
+    while (
+        n_common_trailing < max_n_common - n_common_leading
+        and old_lines[-1 - n_common_trailing] == new_lines[-1 - n_common_trailing]
+    ):
+        n_common_trailing += 1
+
+    old_end = len(old_lines) - n_common_trailing
+    new_end = len(new_lines) - n_common_trailing
+    return (
+        ["  " + line for line in old_lines[:n_common_leading]]
+        + ["- " + line for line in old_lines[n_common_leading:old_end]]
+        + ["+ " + line for line in new_lines[n_common_leading:new_end]]
+        + ["  " + line for line in old_lines[old_end:]]
+    )
+
+
+@lru_cache(maxsize=1024)  # (Ancestry checks keep comparing the few ids on one path)
+def _get_id_path(node_id: str) -> tuple[int, ...]:
+    """Gets a node id as a tuple of ints (e.g., (1, 3, 2) for "1.3.2")."""
+    return tuple(int(part) for part in node_id.split("."))
+
+
+@dataclass(slots=True)
 class TaskNode:
     """A node in an OLTHAD (Open-Language Task Hierarchy of Any Depth)."""
 
@@ -225,6 +289,12 @@ class TaskNode:
     _parent_id: str | None
     _non_planned_subtasks: list[Self] = field(default_factory=list)
     _planned_subtasks: list[Self] = field(default_factory=list)
+    # Stringified fragments of this node's (sub)tree, keyed by (indent, indent level,
+    # whether planned subtasks are being redacted, whether the subtasks are truncated).
+    # Invalidated by `OlthadTraversal`. Only allocated once there is a fragment to cache.
+    _stringified_fragments_cache: dict[tuple[str, int, bool, bool], str] | None = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
     def __str__(self) -> str:
         return self.stringify()
@@ -270,22 +340,308 @@ class TaskNode:
         """Returns whether the node is the root of an OLTHAD."""
         return self._parent_id is None
 
+    def _is_ancestor_of(self, node: Self) -> bool:
+        """Returns whether this node is a (strict) ancestor of `node`."""
+        return node._id != self._id and self._is_self_or_ancestor_of(node._id)
+
+    def _is_self_or_ancestor_of(self, node_id: str | None) -> bool:
+        """Returns whether the node with id `node_id` is this node or a descendant of it."""
+        # (Quick rejection, since an ancestor's id is always a prefix of its descendants')
+        if node_id is None or not node_id.startswith(self._id):
+            return False
+        path, node_path = _get_id_path(self._id), _get_id_path(node_id)
+        return node_path[: len(path)] == path
+
+    def _get_partial_json_dumps(
+        self, indent: str, indent_lvl: int, obfuscate_status: bool = False
+    ) -> str:
+        """
+        Gets the (indented) JSON dumps of the node's own fields, leaving the object open
+        so that the subtasks can be appended.
+        """
+        if obfuscate_status:
+            status_str = TaskNode._OBFUSCATED_STATUS_STR
+        else:
+            status_str = self._status
+        partial_node_dict = {
+            "id": self._id,
+            "task": self._task,
+            "status": status_str,
+            "retrospective": self._retrospective,
+        }
+        dumps = json.dumps(partial_node_dict, indent=indent)
+        prepend = "\n" + indent * indent_lvl
+        return prepend + dumps[:-2].replace("\n", prepend)
+
+    def _add_stringified_fragment_parts(
+        self,
+        parts: list[str],
+        indent: str,
+        indent_lvl: int,
+        redact_planned_subtasks_below: str | None,
+        obfuscate_status_of: str | None,
+        should_redact_planned: bool = False,
+        truncate_below: str | None = None,
+    ) -> None:
+        """
+        Appends the parts of the stringified fragment of the node's (sub)tree to `parts`,
+        re-using the cached fragments of any subtrees that are unaffected by the
+        redaction/obfuscation/truncation (and flatly appending the parts of the others to
+        avoid re-copying their strings at every level).
+
+        NOTE: If `truncate_below` is provided, only the strict ancestors of the node with
+            that id show their subtasks.
+        """
+        is_on_truncation_path = self._is_self_or_ancestor_of(truncate_below)
+        is_truncated = truncate_below is not None and (
+            truncate_below == self._id or not is_on_truncation_path
+        )
+        is_cacheable = not (
+            is_on_truncation_path
+            or self._is_self_or_ancestor_of(redact_planned_subtasks_below)
+            or self._is_self_or_ancestor_of(obfuscate_status_of)
+        )
+        if is_cacheable:
+            # (Redaction doesn't affect the fragment if the subtasks are truncated)
+            cache_key = (
+                indent,
+                indent_lvl,
+                should_redact_planned and not is_truncated,
+                is_truncated,
+            )
+            fragments_cache = self._stringified_fragments_cache
+            if fragments_cache is not None and cache_key in fragments_cache:
+                parts.append(fragments_cache[cache_key])
+                return
+            own_parts = []
+        else:
+            own_parts = parts
+
+        if self._id == redact_planned_subtasks_below:
+            should_redact_planned = True
+
+        own_parts.append(
+            self._get_partial_json_dumps(
+                indent, indent_lvl, obfuscate_status=self._id == obfuscate_status_of
+            )
+        )
+        own_parts.append(",\n")
+        subtasks = [] if is_truncated else self.subtasks
+        if len(subtasks) > 0:
+            own_parts.append(indent * (indent_lvl + 1) + '"subtasks": [')
+            for i, subtask in enumerate(subtasks):
+                if should_redact_planned and subtask._status == TaskStatus.PLANNED:
+                    # Redact from here on (break the loop)
+                    own_parts.append("\n" + indent * (indent_lvl + 2))
+                    own_parts.append(TaskNode._REDACTED_PLANS_STR)
+                    break
+                subtask._add_stringified_fragment_parts(
+                    own_parts,
+                    indent=indent,
+                    indent_lvl=indent_lvl + 2,
+                    redact_planned_subtasks_below=redact_planned_subtasks_below,
+                    obfuscate_status_of=obfuscate_status_of,
+                    should_redact_planned=should_redact_planned,
+                    truncate_below=truncate_below,
+                )
+                if i < len(subtasks) - 1:
+                    own_parts.append(",")
+            own_parts.append("\n" + indent * (indent_lvl + 1) + "]\n")
+        else:
+            own_parts.append(indent * (indent_lvl + 1) + '"subtasks": null\n')
+        own_parts.append(indent * indent_lvl + "}")
+
+        if is_cacheable:
+            fragment = "".join(own_parts)
+            if self._stringified_fragments_cache is None:
+                self._stringified_fragments_cache = {}
+            self._stringified_fragments_cache[cache_key] = fragment
+            parts.append(fragment)
+
+    def _get_stringified_fragment(
+        self,
+        indent: str,
+        indent_lvl: int,
+        redact_planned_subtasks_below: str | None,
+        obfuscate_status_of: str | None,
+        should_redact_planned: bool = False,
+        truncate_below: str | None = None,
+    ) -> str:
+        """
+        Gets the stringified fragment of the node's (sub)tree (see
+        `_add_stringified_fragment_parts`).
+        """
+        parts = []
+        self._add_stringified_fragment_parts(
+            parts,
+            indent=indent,
+            indent_lvl=indent_lvl,
+            redact_planned_subtasks_below=redact_planned_subtasks_below,
+            obfuscate_status_of=obfuscate_status_of,
+            should_redact_planned=should_redact_planned,
+            truncate_below=truncate_below,
+        )
+        return "".join(parts)
+
+    def _get_stringified_lines(
+        self,
+        indent: str,
+        indent_lvl: int,
+        redact_planned_subtasks_below: str | None,
+        obfuscate_status_of: str | None,
+        should_redact_planned: bool = False,
+        is_followed_by_sibling: bool = False,
+    ) -> list[str]:
+        """Gets the (newline-less) lines of the node's stringified fragment."""
+        lines = self._get_stringified_fragment(
+            indent=indent,
+            indent_lvl=indent_lvl,
+            redact_planned_subtasks_below=redact_planned_subtasks_below,
+            obfuscate_status_of=obfuscate_status_of,
+            should_redact_planned=should_redact_planned,
+        )[1:].split("\n")
+        if is_followed_by_sibling:
+            lines[-1] += ","
+        return lines
+
+    def _get_diff_lines(
+        self,
+        indent: str,
+        indent_lvl: int,
+        pending_changes: dict[str, Self],
+        redact_planned_subtasks_below: str | None,
+        obfuscate_status_of: str | None,
+        should_redact_planned: bool = False,
+    ) -> list[str]:
+        """
+        Gets the (newline-less) `difflib.Differ`-style diff lines of the node's
+        stringified fragment against that of its pending change (if any), only walking
+        into the subtrees that contain pending changes.
+        """
+        if not any(self._is_self_or_ancestor_of(node_id) for node_id in pending_changes):
+            lines = self._get_stringified_lines(
+                indent=indent,
+                indent_lvl=indent_lvl,
+                redact_planned_subtasks_below=redact_planned_subtasks_below,
+                obfuscate_status_of=obfuscate_status_of,
+                should_redact_planned=should_redact_planned,
+            )
+            return ["  " + line for line in lines]
+
+        node_for_update = pending_changes.get(self._id, self)
+        if self._id == redact_planned_subtasks_below:
+            should_redact_planned = True
+
+        # Diff the node's own fields
+        obfuscate_status = self._id == obfuscate_status_of
+        old_lines = self._get_partial_json_dumps(indent, indent_lvl, obfuscate_status)
+        new_lines = node_for_update._get_partial_json_dumps(
+            indent, indent_lvl, obfuscate_status
+        )
+        diff_lines = _diff_line_lists(
+            old_lines=(old_lines + ",")[1:].split("\n"),
+            new_lines=(new_lines + ",")[1:].split("\n"),
+        )
+
+        # Diff the subtasks
+        def get_subtask_lines(subtask: TaskNode | None, is_followed: bool) -> list[str]:
+            if subtask is None:
+                return []
+            return subtask._get_stringified_lines(
+                indent=indent,
+                indent_lvl=indent_lvl + 2,
+                redact_planned_subtasks_below=redact_planned_subtasks_below,
+                obfuscate_status_of=obfuscate_status_of,
+                should_redact_planned=should_redact_planned,
+                is_followed_by_sibling=is_followed,
+            )
+
+        def get_subtasks_section_lines(subtasks: list[TaskNode]) -> list[str]:
+            if len(subtasks) == 0:
+                return [prepend + '"subtasks": null']
+            lines = [prepend + '"subtasks": [']
+            n_unredacted = get_n_unredacted(subtasks)
+            for i, subtask in enumerate(subtasks[:n_unredacted]):
+                lines += get_subtask_lines(subtask, is_followed=i < len(subtasks) - 1)
+            if n_unredacted < len(subtasks):
+                lines.append(redacted_plans_line)
+            return lines + [prepend + "]"]
+
+        def get_n_unredacted(subtasks: list[TaskNode]) -> int:
+            if should_redact_planned:
+                for i, subtask in enumerate(subtasks):
+                    if subtask._status == TaskStatus.PLANNED:
+                        return i
+            return len(subtasks)
+
+        prepend = indent * (indent_lvl + 1)
+        redacted_plans_line = indent * (indent_lvl + 2) + TaskNode._REDACTED_PLANS_STR
+        old_subtasks = self.subtasks
+        new_subtasks = node_for_update.subtasks
+        if len(old_subtasks) == 0 or len(new_subtasks) == 0:
+            # I.e., no subtasks on either side or all subtasks were added/removed
+            diff_lines += _diff_line_lists(
+                old_lines=get_subtasks_section_lines(old_subtasks),
+                new_lines=get_subtasks_section_lines(new_subtasks),
+            )
+        else:
+            diff_lines.append("  " + prepend + '"subtasks": [')
+            n_old_unredacted = get_n_unredacted(old_subtasks)
+            n_new_unredacted = get_n_unredacted(new_subtasks)
+            for i in range(max(n_old_unredacted, n_new_unredacted)):
+                old_subtask = old_subtasks[i] if i < n_old_unredacted else None
+                new_subtask = new_subtasks[i] if i < n_new_unredacted else None
+                old_is_followed = i < len(old_subtasks) - 1
+                new_is_followed = i < len(new_subtasks) - 1
+                if old_subtask is None or old_subtask is not new_subtask:
+                    diff_lines += _diff_line_lists(
+                        old_lines=get_subtask_lines(old_subtask, old_is_followed),
+                        new_lines=get_subtask_lines(new_subtask, new_is_followed),
+                    )
+                    continue
+                # Same node on both sides, so only walk into it for nested changes
+                diff_lines += old_subtask._get_diff_lines(
+                    indent=indent,
+                    indent_lvl=indent_lvl + 2,
+                    pending_changes=pending_changes,
+                    redact_planned_subtasks_below=redact_planned_subtasks_below,
+                    obfuscate_status_of=obfuscate_status_of,
+                    should_redact_planned=should_redact_planned,
+                )
+                # Its closing brace (always context) may only differ by a trailing comma
+                closing_line = diff_lines.pop()[2:]
+                diff_lines += _diff_line_lists(
+                    old_lines=[closing_line + ("," if old_is_followed else "")],
+                    new_lines=[closing_line + ("," if new_is_followed else "")],
+                )
+
+            diff_lines += _diff_line_lists(
+                old_lines=[redacted_plans_line] * (n_old_unredacted < len(old_subtasks)),
+                new_lines=[redacted_plans_line] * (n_new_unredacted < len(new_subtasks)),
+            )
+            diff_lines.append("  " + prepend + "]")
+
+        diff_lines.append("  " + indent * indent_lvl + "}")
+        return diff_lines
+
     def iter_in_progress_descendants(
         self,
-    ) -> Generator[tuple[Self, Self, Self], None, None]:
+    ) -> Generator[
+        tuple["TruncatedTaskNodeView", "TruncatedTaskNodeView", Self], None, None
+    ]:
         """
-        Generator that gradually rebuilds the node's tree of descendents, yielding
-        the PARTIALLY REBUILT root alongside the current depth level's "in-progress"
-        node.
+        Generator that gradually "rebuilds" the node's tree of descendents level by level
+        (along the path of "in-progress" nodes), yielding copy-free views of the
+        PARTIALLY REBUILT tree and of the current depth level's "in-progress" node.
 
         NOTE: This method should only be called if the node is in-progress.
 
         Yields:
-            tuple[TaskNode, TaskNode, TaskNode]: Tuple where:
-                - The first element is the root of the rebuild (a copy of the node
-                    with no subtasks).
-                - The second element is the current depth level's "in-progress" node
-                    (a copy of the node with no subtasks).
+            tuple[TruncatedTaskNodeView, TruncatedTaskNodeView, TaskNode]: Tuple where:
+                - The first element is a view of the node's tree truncated below the
+                    current depth level's "in-progress" node.
+                - The second element is a view of the current depth level's "in-progress"
+                    node without its subtasks.
                 - The third element is the current depth level's "in-progress" node
                     (the original node).
         """
@@ -295,55 +651,20 @@ class TaskNode:
                 "This method should only ever be called if the node is in-progress"
             )
 
-        childless_copy_of_self = TaskNode(
-            _id=self._id,
-            _parent_id=self._parent_id,
-            _task=self._task,
-            _status=self._status,
-            _retrospective=self._retrospective,
-            # (No further subtasks since this is a level-by-level rebuild)
-            _non_planned_subtasks=[],
-            _planned_subtasks=[],
-        )
-
-        cur_in_progress_node_childless_copy = childless_copy_of_self
         cur_in_progress_node = self
-
-        # Name change for readability since during rebuild it will get children
-        root_of_rebuild = childless_copy_of_self
-
         while True:
-            yield root_of_rebuild, cur_in_progress_node_childless_copy, cur_in_progress_node
-
-            if len(cur_in_progress_node.subtasks) == 0:  # If rebuild complete
-                break
-
-            for subtask in cur_in_progress_node.subtasks:
-                # Partially reconstruct subtask
-                subtask_childless_copy = TaskNode(
-                    _id=subtask._id,
-                    _parent_id=subtask._parent_id,
-                    _task=subtask._task,
-                    _status=subtask._status,
-                    _retrospective=subtask._retrospective,
-                    # (No further subtasks since this is a level-by-level rebuild)
-                    _non_planned_subtasks=[],
-                    _planned_subtasks=[],
-                )
-                # Add it to the rebuild
-                if subtask._status == TaskStatus.PLANNED:
-                    cur_in_progress_node_childless_copy._planned_subtasks.append(
-                        subtask_childless_copy
-                    )
-                else:
-                    cur_in_progress_node_childless_copy._non_planned_subtasks.append(
-                        subtask_childless_copy
-                    )
-
-            cur_in_progress_node = cur_in_progress_node.in_progress_subtask
-            cur_in_progress_node_childless_copy = (
-                cur_in_progress_node_childless_copy.in_progress_subtask
+            yield (
+                TruncatedTaskNodeView(self, cur_in_progress_node._id),
+                TruncatedTaskNodeView(cur_in_progress_node, cur_in_progress_node._id),
+                cur_in_progress_node,
             )
+            non_planned_subtasks = cur_in_progress_node._non_planned_subtasks
+            if (  # If rebuild complete (i.e., no further in-progress subtask)
+                len(non_planned_subtasks) == 0
+                or non_planned_subtasks[-1]._status != TaskStatus.IN_PROGRESS
+            ):
+                break
+            cur_in_progress_node = non_planned_subtasks[-1]
 
     def stringify(
         self,
@@ -356,8 +677,15 @@ class TaskNode:
         """
         Stringifies the task node to get an LM-friendly string.
 
-        NOTE: If `pending_node_updates` is provided, this function will return a
-            "diff" (list[str]).
+        NOTE: If `pending_changes` is provided, this function will return a "diff"
+            (list[str]) in the format of `difflib.Differ` (minus its "? " hint lines)
+            that is emitted directly from the tree walk: unchanged subtrees as context
+            lines ("  ") and changed nodes as removed/added ("- "/"+ ") blocks.
+
+        NOTE: When not getting a "diff", stringified fragments of subtrees are cached on
+            the nodes and reused across calls. `OlthadTraversal` invalidates the fragments
+            along the path from any node it mutates to the root, so nodes should only be
+            mutated through it (or have their caches cleared manually).
 
         Args:
             indent (int): The number of spaces to indent each level of the task node.
@@ -375,209 +703,69 @@ class TaskNode:
                 `pending_changes` is provided or `get_diff` is True.
         """
 
-        def get_partial_json_dumps(
-            node: TaskNode,
-            indent_lvl: int,
-        ) -> str:
-            if node._id != obfuscate_status_of:
-                status_str = node._status
-            else:
-                status_str = TaskNode._OBFUSCATED_STATUS_STR
-            partial_node_dict = {
-                "id": node._id,
-                "task": node._task,
-                "status": status_str,
-                "retrospective": node._retrospective,
-            }
-            dumps = json.dumps(partial_node_dict, indent=indent)
-            lines = dumps[:-2].split("\n")
-            with_cur_indent = ""
-            prepend = "\n" + indent * indent_lvl
-            for line in lines:
-                indented_line = prepend + line
-                with_cur_indent += indented_line
-            return with_cur_indent
-
         indent = " " * indent
-        output_str = ""
-        output_str_w_changes = ""
-
-        def increment_node_str_to_output_str(
-            node: TaskNode,
-            indent_lvl: int = 0,
-            should_redact_planned: bool = False,
-            parent_subtasks: list[TaskNode] | None = None,
-        ) -> str:
-            nonlocal output_str
-            nonlocal output_str_w_changes
-
-            parent_is_a_pending_change = (
-                node.parent_id is not None
-                and pending_changes is not None
-                and node.parent_id in pending_changes
+
+        if pending_changes:
+            diff_lines = self._get_diff_lines(
+                indent=indent,
+                indent_lvl=0,
+                pending_changes=pending_changes,
+                redact_planned_subtasks_below=redact_planned_subtasks_below,
+                obfuscate_status_of=obfuscate_status_of,
             )
+        else:
+            output_str = self._get_stringified_fragment(
+                indent=indent,
+                indent_lvl=0,
+                redact_planned_subtasks_below=redact_planned_subtasks_below,
+                obfuscate_status_of=obfuscate_status_of,
+            ).strip()
+            if not get_diff:
+                return output_str
+            # Sometimes we want to get a "diff" even when there's no pending changes
+            diff_lines = ["  " + line for line in output_str.split("\n")]
 
-            if pending_changes is not None and node._id in pending_changes:
-                node_for_update = pending_changes[node._id]
-            elif parent_is_a_pending_change and len(parent_subtasks) > 0:
-                idx_of_node_in_parent_subtasks = parent_subtasks.index(node)
-                if (
-                    len(pending_changes[node.parent_id].subtasks)
-                    <= idx_of_node_in_parent_subtasks
-                ):
-                    # This happens if the planner plans less subtasks than was already planned
-                    # Although skipping this node will make it not appear in the output w/out
-                    # changes (making the diff technically incorrect since the original wont
-                    # have these further nodes that existed before), skipping it doesn't
-                    # really affect the diff in a consequential way since the user will still
-                    # always get to see that at least one future plan is being changed.
-                    return
-
-                node_for_update = pending_changes[node.parent_id].subtasks[
-                    idx_of_node_in_parent_subtasks
-                ]
-            else:
-                node_for_update = node
+        # Like `str.splitlines(keepends=True)`, all lines but the last end with a newline
+        return [line + "\n" for line in diff_lines[:-1]] + diff_lines[-1:]
+
+
+@dataclass(frozen=True, slots=True)
+class TruncatedTaskNodeView:
+    """
+    Copy-free view of a `TaskNode`'s (sub)tree truncated below one of its nodes (i.e.,
+    where only the strict ancestors of that node show their subtasks).
+    """
 
-            output_str += get_partial_json_dumps(node, indent_lvl) + ",\n"
+    _node: TaskNode
+    _truncate_below: str
 
-            if node_for_update is not None:
-                partial_dumps = get_partial_json_dumps(node_for_update, indent_lvl)
-                output_str_w_changes += partial_dumps
-                output_str_w_changes += ",\n"
+    @property
+    def id(self) -> str:
+        return self._node._id
 
-            # Check if we should redact this node's planned subtasks
-            if (
-                redact_planned_subtasks_below is not None
-                and node._id == redact_planned_subtasks_below
-            ):
-                should_redact_planned = True
-
-            # Increment subtasks
-            if parent_is_a_pending_change and node.task != node_for_update.task:
-                assert len(node.subtasks) == 0
-                assert len(node_for_update.subtasks) == 0
-                prepend = indent * (indent_lvl + 1)
-                output_str += prepend + '"subtasks": null\n'
-                output_str_w_changes += prepend + '"subtasks": null\n'
-            elif len(node.subtasks) > 0:
-                # Open the subtasks list/array
-                prepend = indent * (indent_lvl + 1)
-                output_str += prepend + '"subtasks": ['
-                if node_for_update is not None:
-                    output_str_w_changes += prepend + '"subtasks": ['
-
-                # Iterate through subtasks
-                n_subtasks = len(node.subtasks)
-                if isinstance(node_for_update, TaskNode):
-                    n_subtasks_of_node_for_update = len(node_for_update.subtasks)
-                else:
-                    n_subtasks_of_node_for_update = 0
-                for i in range(max(n_subtasks, n_subtasks_of_node_for_update)):
-                    if len(node.subtasks) > i:
-                        subtask = node.subtasks[i]
-                        # Check if we've reached a planned subtask that should be redacted
-                        if should_redact_planned and subtask._status == TaskStatus.PLANNED:
-                            # Redact from here on (break the loop)
-                            prepend = "\n" + indent * (indent_lvl + 2)
-                            output_str += prepend + TaskNode._REDACTED_PLANS_STR
-                            if node_for_update is not None:
-                                output_str_w_changes += prepend
-                                output_str_w_changes += TaskNode._REDACTED_PLANS_STR
-                            break
-                        # Recursive call to increment the subtask to the output string
-                        increment_node_str_to_output_str(
-                            node=subtask,
-                            indent_lvl=indent_lvl + 2,
-                            should_redact_planned=should_redact_planned,
-                            parent_subtasks=node.subtasks,
-                        )
-                        # Add comma if not last
-                        if i < n_subtasks - 1:
-                            output_str += ","
-                            if node_for_update is not None:
-                                output_str_w_changes += ","
-                    else:
-                        new_subtask_in_update = node_for_update.subtasks[i]
-                        partial_dumps = get_partial_json_dumps(
-                            new_subtask_in_update, indent_lvl + 2
-                        )
-                        output_str_w_changes += partial_dumps + ",\n"
-                        prepend = indent * (indent_lvl + 3)
-                        output_str_w_changes += prepend + '"subtasks": null\n'
-                        prepend = indent * (indent_lvl + 2)
-                        output_str_w_changes += prepend + "}"
-                        # Add comma if not last
-                        if i < n_subtasks_of_node_for_update - 1:
-                            output_str_w_changes += ","
-
-                # Finally, close the subtasks list/array
-                prepend = "\n" + indent * (indent_lvl + 1)
-                output_str += prepend + "]\n"
-                if node_for_update is not None:
-                    output_str_w_changes += prepend + "]\n"
-            elif (
-                node_for_update is not None and len(node_for_update.subtasks) > 0
-            ):  # I.e., the update = addition of these subtasks
-                # Open the subtasks list/array
-                prepend = indent * (indent_lvl + 1)
-                output_str += prepend + '"subtasks": null\n'
-                output_str_w_changes += prepend + '"subtasks": ['
-                # Iterate through subtasks
-                n_subtasks = len(node_for_update.subtasks)
-                for i, subtask in enumerate(node_for_update.subtasks):
-                    # Add subtask to the output string with changes
-                    subtask_dict = {
-                        "id": subtask._id,
-                        "task": subtask._task,
-                        "status": subtask._status,
-                        "retrospective": subtask._retrospective,
-                        "subtasks": None,
-                    }
-                    subtask_dump = json.dumps(
-                        subtask_dict, indent=SrOlthadCfg.JSON_DUMPS_INDENT
-                    )
-                    subtask_dump = "\n".join(  # Add indent to each line
-                        [
-                            indent * (indent_lvl + 2) + line
-                            for line in subtask_dump.splitlines()
-                        ]
-                    )
-                    output_str_w_changes += "\n" + subtask_dump
-                    # Add comma if not last subtask
-                    if i < n_subtasks - 1:
-                        output_str_w_changes += ","
-                # Finally, close the subtasks list/array
-                prepend = "\n" + indent * (indent_lvl + 1)
-                output_str_w_changes += prepend + "]\n"
-            else:
-                prepend = indent * (indent_lvl + 1)
-                output_str += prepend + '"subtasks": null\n'
-                if node_for_update is not None:
-                    output_str_w_changes += prepend + '"subtasks": null\n'
-
-            # Close the node dict/object string after incrementing subtasks
-            prepend = indent * indent_lvl
-            output_str += prepend + "}"
-            if node_for_update is not None:
-                output_str_w_changes += prepend + "}"
-
-        increment_node_str_to_output_str(self)
-        output_str = output_str.strip()
-        output_str_w_changes = output_str_w_changes.strip()
-        if pending_changes:
-            # Create/return "diff" (list[str]) and return it
-            differ = difflib.Differ()
-            diff = differ.compare(
-                # TODO: Possible optimization - changing above logic to have
-                # appended lines to a list in order to avoid this split
-                output_str.splitlines(keepends=True),
-                output_str_w_changes.splitlines(keepends=True),
-            )
-            return list(diff)
-        elif get_diff:
-            # Sometimes we want to get a "diff" even when there's no pending changes
-            output_lines = output_str.splitlines(keepends=True)
-            return list(difflib.Differ().compare(output_lines, output_lines))
-        else:
-            return output_str
+    def stringify(
+        self,
+        indent: int = SrOlthadCfg.JSON_DUMPS_INDENT,
+        redact_planned_subtasks_below: str | None = None,
+        obfuscate_status_of: str | None = None,
+    ) -> str:
+        """
+        Stringifies the truncated (sub)tree like `TaskNode.stringify` (without "diffs").
+
+        Args:
+            indent (int): The number of spaces to indent each level of the task node.
+            redact_planned_subtasks_below (str | None): If provided, all
+                planned subtasks below this task will be redacted. Defaults to None.
+            obfuscate_status_of (str | None): If provided, the status of the
+                task with this description will be obfuscated. Defaults to None.
+
+        Returns:
+            str: The string representation.
+        """
+        return self._node._get_stringified_fragment(
+            indent=" " * indent,
+            indent_lvl=0,
+            redact_planned_subtasks_below=redact_planned_subtasks_below,
+            obfuscate_status_of=obfuscate_status_of,
+            truncate_below=self._truncate_below,
+        ).strip()
@@ -4,6 +4,12 @@ from sr_olthad.prompts.attempt_summarizer import (
 from sr_olthad.prompts.attempt_summarizer import (
     AttemptSummarizerLmResponseOutputData,
 )
+from sr_olthad.prompts.backtracker._common import (
+    ANSWER_ONLY_PROMPT as BACKTRACKER_ANSWER_ONLY_PROMPT,
+)
+from sr_olthad.prompts.backtracker._common import (
+    RETROSPECTIVE_PROMPT as BACKTRACKER_RETROSPECTIVE_PROMPT,
+)
 from sr_olthad.prompts.backtracker._common import (
     BacktrackerSubAgentLmResponseOutputData,
 )
@@ -13,6 +19,12 @@ from sr_olthad.prompts.backtracker.exhaustive_effort_clf import (
 from sr_olthad.prompts.backtracker.exhaustive_effort_clf import (
     PROMPT_REGISTRY as EXHAUSTIVE_EFFORT_CLF_PROMPT_REGISTRY,
 )
+from sr_olthad.prompts.backtracker.fused_clf import (
+    PROMPT_REGISTRY as FUSED_CLF_PROMPT_REGISTRY,
+)
+from sr_olthad.prompts.backtracker.fused_clf import (
+    BacktrackerFusedClfLmResponseOutputData,
+)
 from sr_olthad.prompts.backtracker.most_worthwhile_pursuit_clf import (
     IS_MOST_WORTHWHILE_PURSUIT_OPTIONS,
 )
@@ -17,3 +17,14 @@ class BacktrackerSubAgentLmResponseOutputData(BaseModel):
         description="A short retrospective that could be added to the OLTHAD.",
         json_schema_extra={"field_type": "str"},
     )
+
+
+# Follow-up prompts for the classifiers' logprob classification mode (see `LogprobClfAgent`)
+ANSWER_ONLY_PROMPT = (
+    "Skip your usual response format: respond with only the multiple choice label (e.g., "
+    '"A") of your answer choice and nothing else.'
+)
+RETROSPECTIVE_PROMPT = (
+    "Now, respond with only a short retrospective that could be added to the OLTHAD in "
+    "light of your answer (1-4 sentences of the important takeaways) and nothing else."
+)
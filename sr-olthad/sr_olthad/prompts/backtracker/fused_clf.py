@@ -0,0 +1,174 @@
+from typing import ClassVar
+
+from jinja2 import Template
+from pydantic import BaseModel, Field
+
+from sr_olthad.framework.utils import get_prompt_json_spec
+from sr_olthad.prompts.backtracker.exhaustive_effort_clf import (
+    EFFORT_WAS_EXHAUSTIVE_OPTIONS,
+)
+from sr_olthad.prompts.backtracker.exhaustive_effort_clf import (
+    V1_0_QUESTION as EXHAUSTIVE_EFFORT_V1_0_QUESTION,
+)
+from sr_olthad.prompts.backtracker.partial_success_clf import (
+    V1_0_QUESTION as PARTIAL_SUCCESS_V1_0_QUESTION,
+)
+from sr_olthad.prompts.backtracker.partial_success_clf import (
+    WAS_PARTIAL_SUCCESS_OPTIONS,
+)
+from sr_olthad.prompts.backtracker.successful_completion_clf import (
+    V1_0_QUESTION as SUCCESSFUL_COMPLETION_V1_0_QUESTION,
+)
+from sr_olthad.prompts.backtracker.successful_completion_clf import (
+    WAS_SUCCESSFULLY_COMPLETED_OPTIONS,
+)
+from sr_olthad.schema import (
+    DomainSpecificSysPromptInputFields,
+    PromptRegistry,
+    SingleTurnPromptTemplates,
+    UserPromptInputFields,
+)
+
+
+class BacktrackerFusedClfLmResponseOutputData(BaseModel):
+    """
+    Output data for the fused classifier, which answers the successful completion,
+    exhaustive effort, and partial success questions at once.
+
+    Attributes:
+        successful_completion_answer (str): The answer choice for question 1.
+        successful_completion_retrospective (str): The retrospective for question 1.
+        exhaustive_effort_answer (str): The answer choice for question 2 (or empty).
+        partial_success_answer (str): The answer choice for question 3 (or empty).
+        partial_success_retrospective (str): The retrospective for question 3 (or empty).
+    """
+
+    # NOTE: These must correspond to the field attrs below.
+    successful_completion_answer_attr: ClassVar[str] = "successful_completion_answer"
+    successful_completion_retrospective_attr: ClassVar[str] = (
+        "successful_completion_retrospective"
+    )
+    exhaustive_effort_answer_attr: ClassVar[str] = "exhaustive_effort_answer"
+    partial_success_answer_attr: ClassVar[str] = "partial_success_answer"
+    partial_success_retrospective_attr: ClassVar[str] = "partial_success_retrospective"
+
+    # Fields
+    successful_completion_answer: str = Field(
+        description="Your answer choice for question 1.",
+        json_schema_extra={"field_type": "str"},
+    )
+    successful_completion_retrospective: str = Field(
+        description=(
+            "A short retrospective that could be added to the OLTHAD if the task is done "
+            "(empty if your answer to question 1 isn't \""
+            f'{WAS_SUCCESSFULLY_COMPLETED_OPTIONS[True].letter}").'
+        ),
+        json_schema_extra={"field_type": "str"},
+    )
+    exhaustive_effort_answer: str = Field(
+        description=(
+            'Your answer choice for question 2 (empty if your answer to question 1 is "'
+            f'{WAS_SUCCESSFULLY_COMPLETED_OPTIONS[True].letter}").'
+        ),
+        json_schema_extra={"field_type": "str"},
+    )
+    partial_success_answer: str = Field(
+        description=(
+            "Your answer choice for question 3 (empty unless your answer to question 2 is "
+            f'"{EFFORT_WAS_EXHAUSTIVE_OPTIONS[True].letter}").'
+        ),
+        json_schema_extra={"field_type": "str"},
+    )
+    partial_success_retrospective: str = Field(
+        description=(
+            "A short retrospective that could be added to the OLTHAD as the task is "
+            "abandoned (empty unless your answer to question 2 is "
+            f'"{EFFORT_WAS_EXHAUSTIVE_OPTIONS[True].letter}").'
+        ),
+        json_schema_extra={"field_type": "str"},
+    )
+
+
+######################
+######## v1.0 ########
+######################
+
+
+SYS_1_0 = f"""You are a helpful thinking assistant that {{{{ {DomainSpecificSysPromptInputFields.LM_ROLE_AS_VERB_PHRASE} }}}}. Your job is to evaluate a task in question by answering up to three questions in order: (1) whether it has been successfully completed, if not, (2) whether it has been given a reasonably exhaustive effort, and, if so, (3) whether it should be considered a partial success or a failure.
+
+## Your Inputs
+
+You will be provided:
+1. PROGRESS/PLANS: a JSON depicting your ongoing progress and hierarchical plans, where the root task is your overall goal.
+2. TASK IN QUESTION: a JSON object defining the task you are evaluating. Please note that the `status` of your "task in question" will be a question mark since you are evaluating it.
+3. CURRENT ENVIRONMENT STATE: a representation of the most recently observed state of the environment you are in.
+4. QUESTIONS: The questions you are to answer.
+
+## Your Response
+
+1. For question 1 (successful completion):
+    a. You will assume the most likely interpretation of the "task in question" in the context of the ongoing progress and plans, and think about what outcome state it is phrased to achieve.
+    b. Considering only how the task is worded (do **not** extrapolate about hypothetical alternatives to the task in question), you will reason about the evidence (or lack thereof) in the current environment state (e.g., if you want 4 'strawberries', and you currently have 2 'strawberries', that is not enough to consider the task completed) and in the previous retrospectives and tasks.
+2. Only if the task hasn't been successfully completed, for question 2 (exhaustive effort), you will think step-by-step about (1) what, in your current situation, a "reasonably exhaustive effort" might entail, and (2) whether the attempted effort (attempted subtasks of the "TASK IN QUESTION", if any) has been exhaustive:
+    - Given a realistic evaluation of your capabilities, have you exhausted all situationally *reasonable* strategies for accomplishing this task?
+    - Are you leaving obvious steps/strategies on the table?
+3. Only if the effort has been exhaustive, for question 3 (partial success), you will think about whether the stated outcome(s) of the task have been partially realized or whether the attempt is better considered a failure.
+4. Only after reasoning through the above, you will output your final answers as a JSON that strictly adheres to this specification:
+
+```json
+{get_prompt_json_spec(BacktrackerFusedClfLmResponseOutputData)}
+```
+
+## Auxiliary Information About Domain
+
+{{{{ {DomainSpecificSysPromptInputFields.DOMAIN_EXPOSITION} }}}}"""
+
+USER_1_0 = f"""PROGRESS/PLANS:
+```json
+{{{{ {UserPromptInputFields.OLTHAD} }}}}
+```
+
+TASK IN QUESTION:
+```json
+{{{{ {UserPromptInputFields.TASK_IN_QUESTION} }}}}
+```
+
+CURRENT ENVIRONMENT STATE:
+{{{{ {UserPromptInputFields.ENV_STATE} }}}}
+
+QUESTIONS:
+1. {SUCCESSFUL_COMPLETION_V1_0_QUESTION}
+{WAS_SUCCESSFULLY_COMPLETED_OPTIONS[True].letter}. {WAS_SUCCESSFULLY_COMPLETED_OPTIONS[True].text}
+{WAS_SUCCESSFULLY_COMPLETED_OPTIONS[False].letter}. {WAS_SUCCESSFULLY_COMPLETED_OPTIONS[False].text}
+
+2. {EXHAUSTIVE_EFFORT_V1_0_QUESTION}
+{EFFORT_WAS_EXHAUSTIVE_OPTIONS[True].letter}. {EFFORT_WAS_EXHAUSTIVE_OPTIONS[True].text}
+{EFFORT_WAS_EXHAUSTIVE_OPTIONS[False].letter}. {EFFORT_WAS_EXHAUSTIVE_OPTIONS[False].text}
+
+3. {PARTIAL_SUCCESS_V1_0_QUESTION}
+{WAS_PARTIAL_SUCCESS_OPTIONS[True].letter}. {WAS_PARTIAL_SUCCESS_OPTIONS[True].text}
+{WAS_PARTIAL_SUCCESS_OPTIONS[False].letter}. {WAS_PARTIAL_SUCCESS_OPTIONS[False].text}
+
+Remember to follow your instructions for your response, leaving the answers (and retrospectives) of the questions you don't need to answer empty.
+
+IMPORTANT: Retrospectives should be short: 1-4 sentences of the important takeaways.
+
+IMPORTANT: Completion of a task should be kept in context to that task only. Completion of higher-level tasks is not decided with the completion of a subtask.
+
+IMPORTANT: Having the "ability" to complete the current task, given the current environment state, is NOT completing the current task.
+"""
+
+V1_0_PROMPTS = SingleTurnPromptTemplates(
+    sys_prompt_template=Template(SYS_1_0),
+    user_prompt_template=Template(USER_1_0),
+)
+
+
+######################
+###### Registry ######
+######################
+
+
+PROMPT_REGISTRY: PromptRegistry = {
+    "1.0": V1_0_PROMPTS,
+}
@@ -0,0 +1,311 @@
+"""Deterministic record/replay of whole sr-OLTHAD runs (e.g., to benchmark them offline)."""
+
+import gzip
+import hashlib
+import json
+from collections import defaultdict, deque
+from collections.abc import Callable, Hashable, Iterator
+from contextlib import contextmanager
+
+from pydantic import BaseModel, Field, JsonValue
+
+import sr_olthad.config as cfg
+from sr_olthad.framework.schema import (
+    INSTRUCT_LM_CALL_CONTEXT,
+    InstructLm,
+    InstructLmCallContext,
+    InstructLmMessage,
+    LmBackoffPolicy,
+    LmErrorKind,
+    LmStreamHandler,
+)
+from sr_olthad.framework.utils import call_or_await, call_stream_handler
+from sr_olthad.sr_olthad import JsonSerializable, SrOlthad
+
+
+class SrOlthadTrace(BaseModel):
+    """
+    Everything an `SrOlthad` run received from the "outside world" (i.e., the env states,
+    the skill-invocation checks, and the LM responses), along with what it returned.
+
+    LM responses are stored under a hash of their requests (see
+    `get_instruct_lm_request_key`) rather than with the (much larger) messages.
+    """
+
+    highest_level_task: str
+    env_states: list[JsonValue] = Field(default_factory=list)
+    skill_invocations: list[str | None] = Field(default_factory=list)
+    is_task_executable_skill_invocation: dict[str, bool] = Field(default_factory=dict)
+    lm_responses: dict[str, list[str]] = Field(default_factory=dict)
+
+    def save(self, fpath: str) -> None:
+        """Saves the trace as JSON (gzipped if `fpath` ends with '.gz')."""
+        open_fn = gzip.open if fpath.endswith(".gz") else open
+        with open_fn(fpath, "wt", encoding="utf-8") as f:
+            f.write(self.model_dump_json())
+
+    @classmethod
+    def load(cls, fpath: str) -> "SrOlthadTrace":
+        """Loads a trace saved with `SrOlthadTrace.save`."""
+        open_fn = gzip.open if fpath.endswith(".gz") else open
+        with open_fn(fpath, "rt", encoding="utf-8") as f:
+            return cls.model_validate_json(f.read())
+
+
+def get_instruct_lm_request_key(messages: list[InstructLmMessage], **kwargs) -> str:
+    """
+    Gets a hash of an `InstructLm.generate` request that is stable across runs, including
+    the voting sample and attempt indices of the current `InstructLmCallContext`.
+    """
+    call_context = INSTRUCT_LM_CALL_CONTEXT.get() or InstructLmCallContext()
+    key_data = {
+        "messages": messages,
+        "kwargs": kwargs,
+        "voting_sample_idx": call_context.voting_sample_idx,
+        "attempt_idx": call_context.attempt_idx,
+    }
+    key_json = json.dumps(key_data, sort_keys=True, default=repr)
+    return hashlib.sha256(key_json.encode()).hexdigest()
+
+
+class RecordingInstructLm(InstructLm):
+    """
+    Wraps an `InstructLm`, recording its responses into an `SrOlthadTrace`.
+    """
+
+    def __init__(self, instruct_lm: InstructLm, trace: SrOlthadTrace):
+        super().__init__()
+
+        self.instruct_lm = instruct_lm
+        self.trace = trace
+
+    async def warm_up(self) -> None:
+        await self.instruct_lm.warm_up()
+
+    @property
+    def client_key(self) -> Hashable:
+        return self.instruct_lm.client_key
+
+    @property
+    def backoff_policy(self) -> LmBackoffPolicy:
+        return self.instruct_lm.backoff_policy
+
+    def classify_error(self, error: Exception) -> LmErrorKind:
+        return self.instruct_lm.classify_error(error)
+
+    def get_retry_after_seconds(self, error: Exception) -> float | None:
+        return self.instruct_lm.get_retry_after_seconds(error)
+
+    async def generate(
+        self,
+        messages: list[InstructLmMessage],
+        stream_handler: LmStreamHandler | None = None,
+        **kwargs,
+    ) -> str:
+        key = get_instruct_lm_request_key(messages, **kwargs)
+        response = await self.instruct_lm.generate(messages, stream_handler, **kwargs)
+        self.trace.lm_responses.setdefault(key, []).append(response)
+        return response
+
+    async def get_next_token_logprobs(
+        self,
+        messages: list[InstructLmMessage],
+        n_top: int = 20,
+        **kwargs,
+    ) -> dict[str, float]:
+        key = get_instruct_lm_request_key(
+            messages, next_token_logprobs_n_top=n_top, **kwargs
+        )
+        logprobs = await self.instruct_lm.get_next_token_logprobs(messages, n_top, **kwargs)
+        # (Stored as JSON amongst the responses)
+        self.trace.lm_responses.setdefault(key, []).append(json.dumps(logprobs))
+        return logprobs
+
+
+class ReplayInstructLm(InstructLm):
+    """
+    `InstructLm` that responds with the responses recorded in an `SrOlthadTrace`.
+
+    Raises:
+        KeyError: If asked for a response to a request that wasn't recorded (e.g., when
+            the run has diverged from the recorded one).
+    """
+
+    def __init__(self, trace: SrOlthadTrace):
+        super().__init__()
+
+        # Same requests (e.g., same-prompt retries) are answered in the recorded order
+        self._responses: defaultdict[str, deque[str]] = defaultdict(deque)
+        for key, responses in trace.lm_responses.items():
+            self._responses[key].extend(responses)
+
+    async def generate(
+        self,
+        messages: list[InstructLmMessage],
+        stream_handler: LmStreamHandler | None = None,
+        **kwargs,
+    ) -> str:
+        key = get_instruct_lm_request_key(messages, **kwargs)
+        if not self._responses[key]:
+            raise KeyError(f"No (more) recorded responses for request with key '{key}'")
+        response = self._responses[key].popleft()
+        if stream_handler is not None:
+            # "Stream" the whole response as one chunk (nothing is left to stop)
+            call_stream_handler(stream_handler, response)
+        return response
+
+    async def get_next_token_logprobs(
+        self,
+        messages: list[InstructLmMessage],
+        n_top: int = 20,
+        **kwargs,
+    ) -> dict[str, float]:
+        key = get_instruct_lm_request_key(
+            messages, next_token_logprobs_n_top=n_top, **kwargs
+        )
+        if not self._responses[key]:
+            raise KeyError(f"No (more) recorded logprobs for request with key '{key}'")
+        return json.loads(self._responses[key].popleft())
+
+
+@contextmanager
+def _patched_cfg_instruct_lms(
+    get_instruct_lm: Callable[[InstructLm], InstructLm],
+) -> Iterator[None]:
+    """
+    Temporarily replaces every LM agent config's `INSTRUCT_LM` (e.g., while constructing
+    an `SrOlthad`, whose agents read them upon initialization).
+    """
+    original_instruct_lms = [agent_cfg.INSTRUCT_LM for agent_cfg in cfg.LM_AGENT_CFGS]
+    try:
+        for agent_cfg, instruct_lm in zip(
+            cfg.LM_AGENT_CFGS, original_instruct_lms, strict=True
+        ):
+            agent_cfg.INSTRUCT_LM = get_instruct_lm(instruct_lm)
+        yield
+    finally:
+        for agent_cfg, instruct_lm in zip(
+            cfg.LM_AGENT_CFGS, original_instruct_lms, strict=True
+        ):
+            agent_cfg.INSTRUCT_LM = instruct_lm
+
+
+class RecordingSrOlthad(SrOlthad):
+    """
+    `SrOlthad` that records its run into an `SrOlthadTrace` (`self.trace`) that can later
+    be replayed with `ReplaySrOlthad` (e.g., without any API calls).
+
+    Takes the same args as `SrOlthad`.
+    """
+
+    def __init__(
+        self,
+        highest_level_task: str,
+        is_task_executable_skill_invocation: Callable[[str], bool],
+        **kwargs,
+    ):
+        self.trace = SrOlthadTrace(highest_level_task=highest_level_task)
+
+        async def recording_is_task_executable_skill_invocation(task: str) -> bool:
+            is_skill_invocation = await call_or_await(
+                is_task_executable_skill_invocation, task
+            )
+            self.trace.is_task_executable_skill_invocation[task] = is_skill_invocation
+            return is_skill_invocation
+
+        with _patched_cfg_instruct_lms(lambda lm: RecordingInstructLm(lm, self.trace)):
+            super().__init__(
+                highest_level_task=highest_level_task,
+                is_task_executable_skill_invocation=recording_is_task_executable_skill_invocation,
+                **kwargs,
+            )
+
+    async def get_next_skill_invocation(
+        self, env_state: str | JsonSerializable
+    ) -> str | None:
+        self.trace.env_states.append(env_state)
+        skill_invocation = await super().get_next_skill_invocation(env_state)
+        self.trace.skill_invocations.append(skill_invocation)
+        return skill_invocation
+
+
+class ReplaySrOlthad(SrOlthad):
+    """
+    `SrOlthad` that replays a recorded `SrOlthadTrace`, using `ReplayInstructLm`s in
+    place of the configured `InstructLm`s.
+
+    Args:
+        trace (SrOlthadTrace): The trace to replay.
+        **kwargs: Other args for `SrOlthad` (e.g., handlers).
+    """
+
+    def __init__(self, trace: SrOlthadTrace, **kwargs):
+        replay_instruct_lm = ReplayInstructLm(trace)
+        with _patched_cfg_instruct_lms(lambda _: replay_instruct_lm):
+            super().__init__(
+                highest_level_task=trace.highest_level_task,
+                is_task_executable_skill_invocation=trace.is_task_executable_skill_invocation.__getitem__,
+                **kwargs,
+            )
+
+
+class ReplayEnv:
+    """
+    Env stub that yields the env states of an `SrOlthadTrace`, checking that the skill
+    invocations it gets are those that were recorded.
+
+    Args:
+        trace (SrOlthadTrace): The trace to replay.
+    """
+
+    def __init__(self, trace: SrOlthadTrace):
+        self.trace = trace
+        self._step_idx = 0
+
+    def reset(self) -> str | JsonSerializable:
+        """Gets the initial env state."""
+        self._step_idx = 0
+        return self.trace.env_states[0]
+
+    def step(self, skill_invocation: str) -> str | JsonSerializable | None:
+        """
+        Gets the env state after the next skill invocation (or None if the recorded run
+        ended after it).
+
+        Raises:
+            ValueError: If the skill invocation isn't the recorded one.
+        """
+        recorded_skill_invocation = self.trace.skill_invocations[self._step_idx]
+        if skill_invocation != recorded_skill_invocation:
+            raise ValueError(
+                f"Replay diverged at step {self._step_idx}: got skill invocation "
+                f"'{skill_invocation}', but '{recorded_skill_invocation}' was recorded"
+            )
+        self._step_idx += 1
+        if self._step_idx >= len(self.trace.env_states):
+            return None
+        return self.trace.env_states[self._step_idx]
+
+
+async def replay_sr_olthad_run(trace: SrOlthadTrace, **kwargs) -> list[str | None]:
+    """
+    Replays a recorded sr-OLTHAD run end-to-end.
+
+    Args:
+        trace (SrOlthadTrace): The trace to replay.
+        **kwargs: Other args for `SrOlthad` (e.g., handlers).
+
+    Returns:
+        list[str | None]: The skill invocations returned during the replay.
+    """
+    sr_olthad = ReplaySrOlthad(trace, **kwargs)
+    env = ReplayEnv(trace)
+    skill_invocations = []
+    env_state = env.reset()
+    while env_state is not None:
+        skill_invocation = await sr_olthad.get_next_skill_invocation(env_state)
+        skill_invocations.append(skill_invocation)
+        if skill_invocation is None:
+            break
+        env_state = env.step(skill_invocation)
+    return skill_invocations
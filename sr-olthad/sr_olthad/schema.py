@@ -20,6 +20,22 @@ class LmAgentName(StrEnum):
     MOST_WORTHWHILE_PURSUIT_CLF = "Backtracker: Most Worthwhile Pursuit Classifier"
     PARTIAL_SUCCESS_CLF = "Backtracker: Partial Success Classifier"
     SUCCESSFUL_COMPLETION_CLF = "Backtracker: Successful Completion Classifier"
+    FUSED_CLF = "Backtracker: Fused Classifier"
+
+
+############################################################
+### Enum of strategies for the backtracker's classifiers ###
+############################################################
+
+
+class BacktrackerStrategy(StrEnum):
+    """
+    How the backtracker asks the successful completion, exhaustive effort, and partial
+    success questions about the task in question.
+    """
+
+    CASCADED = "cascaded"  # One LM call per question, as the decision tree needs them
+    FUSED = "fused"  # One LM call that answers all the (needed) questions at once
 
 
 ########################
@@ -1,10 +1,11 @@
+import asyncio
 import json
 from collections.abc import Callable
 
 import sr_olthad.config as cfg
 from sr_olthad.agents import AttemptSummarizer, Backtracker, Forgetter, Planner
 from sr_olthad.framework.agents import LmRetryHandler
-from sr_olthad.framework.schema import LmStreamsHandler
+from sr_olthad.framework.schema import InstructLm, LmStreamsHandler
 from sr_olthad.framework.utils import call_or_await
 from sr_olthad.lm_step import (
     LmStepTemplate,
@@ -12,7 +13,11 @@ from sr_olthad.lm_step import (
     PreLmStepHandler,
 )
 from sr_olthad.olthad import OlthadTraversal
-from sr_olthad.schema import GetDomainSpecificSysPromptInputData, TaskStatus
+from sr_olthad.schema import (
+    BacktrackerStrategy,
+    GetDomainSpecificSysPromptInputData,
+    TaskStatus,
+)
 
 # TODO: Forgetter(?)
 
@@ -43,9 +48,9 @@ class SrOlthad:
         self,
         highest_level_task: str,
         is_task_executable_skill_invocation: Callable[[str], bool],
-        pre_lm_step_handler: PreLmStepHandler = lambda _: None,
-        lm_retry_handler: LmRetryHandler = lambda _, __: None,
-        post_lm_step_approver: PostLmStepApprover = lambda _: True,
+        pre_lm_step_handler: PreLmStepHandler | None = None,
+        lm_retry_handler: LmRetryHandler = lambda _, __, ___=None: None,
+        post_lm_step_approver: PostLmStepApprover | None = None,
         # TODO: Make this non-optional since sr-OLTHAD will never been run w/out domains?
         # ...or keep it optional for _true_ plug-and-play to enable seeing if the LM can
         # just infer good plans/actions without explicit domain exposition?
@@ -88,6 +93,59 @@ class SrOlthad:
             streams_handler=streams_handler,
         )
 
+        # The LMs of the agents that are run (e.g., not the forgetter's, which isn't yet),
+        # one per client (since warming up one warms up all the LMs sharing its client)
+        if cfg.BacktrackerCfg.STRATEGY == BacktrackerStrategy.FUSED:
+            backtracker_clf_cfgs = (
+                cfg.BacktrackerCfg.FusedClfCfg,
+                cfg.BacktrackerCfg.MostWorthwhilePursuitClfCfg,
+            )
+        else:
+            backtracker_clf_cfgs = (
+                cfg.BacktrackerCfg.SuccessfulCompletionClfCfg,
+                cfg.BacktrackerCfg.ExhaustiveEffortClf,
+                cfg.BacktrackerCfg.PartialSuccessClfCfg,
+                cfg.BacktrackerCfg.MostWorthwhilePursuitClfCfg,
+            )
+        self._instruct_lms_to_warm_up: list[InstructLm] = list(
+            {
+                agent_cfg.INSTRUCT_LM.client_key: agent_cfg.INSTRUCT_LM
+                for agent_cfg in (
+                    cfg.AttemptSummarizerCfg,
+                    cfg.PlannerCfg,
+                    *backtracker_clf_cfgs,
+                )
+            }.values()
+        )
+        self._lm_clients_warm_up_task: asyncio.Task | None = None
+        if cfg.SrOlthadCfg.WARM_UP_LM_CLIENTS:
+            try:  # Warm up in the background if constructed in a running event loop
+                loop = asyncio.get_running_loop()
+                self._lm_clients_warm_up_task = loop.create_task(self.warm_up_lm_clients())
+            except RuntimeError:  # (No running event loop)
+                pass
+
+    async def warm_up_lm_clients(self) -> None:
+        """
+        Warms up the clients of the agents' LMs (e.g., opening connections to the APIs) so
+        that the first step doesn't pay for the connection setup.
+        """
+        await asyncio.gather(
+            *(instruct_lm.warm_up() for instruct_lm in self._instruct_lms_to_warm_up)
+        )
+
+    async def _finish_lm_clients_warm_up(self) -> None:
+        """
+        Awaits the background warm-up (if still pending), since the first step needs the
+        connections anyway.
+
+        NOTE: If it was started in an event loop that has since been closed (e.g., by
+            `asyncio.run`), it was already cancelled along with that loop.
+        """
+        task, self._lm_clients_warm_up_task = self._lm_clients_warm_up_task, None
+        if task is not None and not task.done():
+            await task
+
     async def _traverse_and_get_next_skill_invocation(self, env_state: str) -> str | None:
         if (
             self.has_been_called_at_least_once_before
@@ -150,6 +208,8 @@ class SrOlthad:
         if not isinstance(env_state, str):
             env_state = json.dumps(env_state, cfg.SrOlthadCfg.JSON_DUMPS_INDENT)
 
+        await self._finish_lm_clients_warm_up()
+
         if self.has_been_called_at_least_once_before:
             # Summarize previous execution (action attempt)
             await self.attempt_summarizer.run(env_state=env_state)
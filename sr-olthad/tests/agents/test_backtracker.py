@@ -0,0 +1,243 @@
+import asyncio
+import re
+
+from sr_olthad.agents.backtracker import Backtracker
+from sr_olthad.config import BacktrackerCfg
+from sr_olthad.framework.agents import InstructLmAgentOutput
+from sr_olthad.framework.schema import InstructLm, InstructLmChatRole
+from sr_olthad.framework.utils import call_stream_handler
+from sr_olthad.lm_step import LmStepTemplate
+from sr_olthad.olthad import OlthadTraversal
+from sr_olthad.prompts import (
+    BacktrackerFusedClfLmResponseOutputData,
+    BacktrackerSubAgentLmResponseOutputData,
+)
+from sr_olthad.schema import BacktrackerStrategy, TaskStatus
+
+
+class DummyClassifier:
+    """
+    Stands in for a backtracker classifier, answering per task-in-question id (and
+    streaming that id).
+    """
+
+    TASK_IN_QUESTION_ID_PATTERN = r'TASK IN QUESTION:\s*```json\s*\{\s*"id": "([\d.]+)"'
+
+    def __init__(
+        self, answers: dict[str, str], n_in_flight: list[int], streams_handler=None
+    ):
+        self.answers = answers
+        self.n_in_flight = n_in_flight  # [current, max] shared across classifiers
+        self.streams_handler = streams_handler
+        self.num_calls_for_voting = 1
+        self.asked_about: list[str] = []
+
+    async def run(self, input_messages, retry_callback=None, streams_handler=None, **kwargs):
+        user_prompt = input_messages[-1]["content"]
+        node_id = re.search(self.TASK_IN_QUESTION_ID_PATTERN, user_prompt).group(1)
+        self.asked_about.append(node_id)
+        if (streams_handler or self.streams_handler) is not None:
+            (streams_handler or self.streams_handler)(node_id, stream_idx=0)
+        self.n_in_flight[0] += 1
+        self.n_in_flight[1] = max(self.n_in_flight)
+        await asyncio.sleep(0.01)
+        self.n_in_flight[0] -= 1
+        data = BacktrackerSubAgentLmResponseOutputData(
+            answer=self.answers.get(node_id, "A"), retrospective="Because."
+        )
+        return InstructLmAgentOutput(data=data, messages=input_messages)
+
+
+class DummyFusedClassifier:
+    """Stands in for the fused classifier, always answering with the same answers."""
+
+    def __init__(self, exhaustive_effort_answer: str):
+        self.exhaustive_effort_answer = exhaustive_effort_answer
+        self.num_calls_for_voting = 1
+        self.n_calls = 0
+
+    async def run(self, input_messages, retry_callback=None, **kwargs):
+        self.n_calls += 1
+        data = BacktrackerFusedClfLmResponseOutputData(
+            successful_completion_answer="B",
+            successful_completion_retrospective="",
+            exhaustive_effort_answer=self.exhaustive_effort_answer,
+            partial_success_answer="A",
+            partial_success_retrospective="Got some wood.",
+        )
+        return InstructLmAgentOutput(data=data, messages=input_messages)
+
+
+class RamblingClfInstructLm(InstructLm):
+    """Streams a final (fenced) JSON answer followed by (a lot of) trailing prose."""
+
+    CHUNKS = [
+        '```json\n{"answer": "A", ',
+        '"retrospective": "Done."}\n```',
+        " In conclusion,",
+    ] + [" blah"] * 100
+
+    def __init__(self):
+        super().__init__()
+        self.n_chunks_generated = 0
+
+    async def generate(self, messages, stream_handler=None, **kwargs) -> str:
+        full_response = ""
+        for chunk in self.CHUNKS:
+            self.n_chunks_generated += 1
+            full_response += chunk
+            if stream_handler is not None and call_stream_handler(stream_handler, chunk):
+                break
+        return full_response
+
+
+class TestBacktracker:
+    @staticmethod
+    def get_traversal() -> OlthadTraversal:
+        traversal = OlthadTraversal(highest_level_task="Build a house.")
+        traversal.update_planned_subtasks_of_cur_node(["Gather wood.", "Build."]).commit()
+        traversal.recurse_inward()
+        traversal.update_planned_subtasks_of_cur_node(["Find a tree.", "Chop."]).commit()
+        traversal.recurse_inward()
+        return traversal
+
+    def run_backtracker(
+        self,
+        fused_clf: DummyFusedClassifier | None = None,
+        lm_step_template: LmStepTemplate | None = None,
+        streams_handler=None,
+    ) -> tuple[OlthadTraversal, bool, dict, list[int]]:
+        traversal = self.get_traversal()
+        backtracker = Backtracker(
+            traversal, lm_step_template or LmStepTemplate(), streams_handler
+        )
+        if fused_clf is not None:
+            backtracker.fused_clf = fused_clf
+        n_in_flight = [0, 0]
+        classifiers = {
+            "successful_completion_clf": DummyClassifier(
+                {"1.1.1": "B"}, n_in_flight, streams_handler
+            ),
+            "exhaustive_effort_clf": DummyClassifier(
+                {"1.1.1": "B"}, n_in_flight, streams_handler
+            ),
+            "partial_success_clf": DummyClassifier({}, n_in_flight, streams_handler),
+            "most_worthwhile_pursuit_clf": DummyClassifier(
+                {"1.1": "B"}, n_in_flight, streams_handler
+            ),
+        }
+        for attr, classifier in classifiers.items():
+            setattr(backtracker, attr, classifier)
+        did_backtrack = asyncio.run(backtracker.run(env_state="In a forest."))
+        return traversal, did_backtrack, classifiers, n_in_flight
+
+    def test_classifier_streams_stop_at_valid_json_if_configured(self, monkeypatch):
+        clf_cfg = BacktrackerCfg.SuccessfulCompletionClfCfg
+        for stop_streams_at_valid_json, n_chunks in ((True, 2), (False, 103)):
+            instruct_lm = RamblingClfInstructLm()
+            monkeypatch.setattr(clf_cfg, "INSTRUCT_LM", instruct_lm)
+            monkeypatch.setattr(
+                clf_cfg, "STOP_STREAMS_AT_VALID_JSON", stop_streams_at_valid_json
+            )
+            backtracker = Backtracker(self.get_traversal(), LmStepTemplate())
+            messages = [{"role": InstructLmChatRole.USER, "content": "Done?"}]
+            output = asyncio.run(backtracker.successful_completion_clf.run(messages))
+            assert output.data.answer == "A"
+            assert instruct_lm.n_chunks_generated == n_chunks
+
+    def test_drops_first_not_most_worthwhile_ancestor(self):
+        traversal, did_backtrack, classifiers, n_in_flight = self.run_backtracker()
+        assert did_backtrack
+        assert traversal.cur_node.id == "1"
+        assert traversal.nodes["1.1"].status == TaskStatus.DROPPED
+        assert classifiers["most_worthwhile_pursuit_clf"].asked_about == ["1", "1.1"]
+        assert classifiers["partial_success_clf"].asked_about == []
+        assert n_in_flight[1] == 1
+
+    def test_speculative_mode_runs_concurrently_with_same_outcome(self, monkeypatch):
+        monkeypatch.setattr(BacktrackerCfg, "SPECULATIVE_MODE", True)
+        monkeypatch.setattr(BacktrackerCfg, "MAX_SPECULATIVE_LM_CALLS", 5)
+        traversal, did_backtrack, classifiers, n_in_flight = self.run_backtracker()
+        assert did_backtrack
+        assert traversal.cur_node.id == "1"
+        assert traversal.nodes["1.1"].status == TaskStatus.DROPPED
+        # The cap of 5 calls leaves out the deepest most-worthwhile-pursuit question
+        assert classifiers["most_worthwhile_pursuit_clf"].asked_about == ["1", "1.1"]
+        assert classifiers["partial_success_clf"].asked_about == ["1.1.1"]
+        assert n_in_flight[1] == 5
+
+    def test_speculative_streams_are_emitted_after_their_step(self, monkeypatch):
+        monkeypatch.setattr(BacktrackerCfg, "SPECULATIVE_MODE", True)
+        monkeypatch.setattr(BacktrackerCfg, "MAX_SPECULATIVE_LM_CALLS", 5)
+        emitted = []
+        lm_step_template = LmStepTemplate(
+            pre_lm_step_handler=lambda emission: emitted.append(
+                ("step", emission.cur_node_id)
+            )
+        )
+        self.run_backtracker(
+            lm_step_template=lm_step_template,
+            streams_handler=lambda chunk_str, stream_idx=None: emitted.append(
+                ("chunk", chunk_str)
+            ),
+        )
+        # (Each step's stream comes right after it, incl. those of speculative runs)
+        assert emitted == [
+            ("step", "1.1.1"),
+            ("chunk", "1.1.1"),
+            ("step", "1.1.1"),
+            ("chunk", "1.1.1"),
+            ("step", "1"),
+            ("chunk", "1"),
+            ("step", "1.1"),
+            ("chunk", "1.1"),
+        ]
+
+    def test_concurrent_level_evaluation_has_same_outcome(self, monkeypatch):
+        monkeypatch.setattr(
+            BacktrackerCfg.MostWorthwhilePursuitClfCfg, "EVALUATE_LEVELS_CONCURRENTLY", True
+        )
+        traversal, did_backtrack, classifiers, n_in_flight = self.run_backtracker()
+        assert did_backtrack
+        assert traversal.cur_node.id == "1"
+        assert traversal.nodes["1.1"].status == TaskStatus.DROPPED
+        # All levels are classified at once (the deepest one's result is discarded)
+        assert classifiers["most_worthwhile_pursuit_clf"].asked_about == [
+            "1",
+            "1.1",
+            "1.1.1",
+        ]
+        assert n_in_flight[1] == 3
+
+    def test_fused_strategy_backtracks_after_one_call(self, monkeypatch):
+        monkeypatch.setattr(BacktrackerCfg, "STRATEGY", BacktrackerStrategy.FUSED)
+        fused_clf = DummyFusedClassifier(exhaustive_effort_answer="A")
+        traversal, did_backtrack, classifiers, _ = self.run_backtracker(fused_clf)
+        assert did_backtrack
+        assert traversal.cur_node.id == "1.1"
+        assert traversal.nodes["1.1.1"].status == TaskStatus.PARTIAL_SUCCESS
+        assert traversal.nodes["1.1.1"].retrospective == "Got some wood."
+        assert fused_clf.n_calls == 1
+        assert all(not clf.asked_about for clf in classifiers.values())
+
+    def test_fused_strategy_falls_through_to_most_worthwhile_pursuit(self, monkeypatch):
+        monkeypatch.setattr(BacktrackerCfg, "STRATEGY", BacktrackerStrategy.FUSED)
+        monkeypatch.setattr(BacktrackerCfg, "SPECULATIVE_MODE", True)
+        fused_clf = DummyFusedClassifier(exhaustive_effort_answer="B")
+        traversal, did_backtrack, classifiers, _ = self.run_backtracker(fused_clf)
+        assert did_backtrack
+        assert traversal.cur_node.id == "1"
+        assert traversal.nodes["1.1"].status == TaskStatus.DROPPED
+        assert fused_clf.n_calls == 1
+        assert classifiers["successful_completion_clf"].asked_about == []
+        # (With one call for the fused questions, all levels fit in the speculative cap)
+        assert classifiers["most_worthwhile_pursuit_clf"].asked_about == [
+            "1",
+            "1.1",
+            "1.1.1",
+        ]
+
+
+if __name__ == "__main__":
+    test = TestBacktracker()
+    test.test_drops_first_not_most_worthwhile_ancestor()
@@ -1,8 +1,15 @@
+from enum import StrEnum
 from typing import ClassVar
 
-from pydantic import BaseModel, Field
+import pytest
+from pydantic import BaseModel, Field, ValidationError
 
-from sr_olthad.framework.utils import get_prompt_json_spec
+from sr_olthad.framework.utils import (
+    StreamingJsonDetector,
+    detect_extract_and_parse_json_from_text,
+    get_portable_json_schema,
+    get_prompt_json_spec,
+)
 
 
 class TestGetPromptJsonSpec:
@@ -25,6 +32,121 @@ class TestGetPromptJsonSpec:
         assert get_prompt_json_spec(TestGetPromptJsonSpec.DummyBaseModel) == expected
 
 
+class TestGetPortableJsonSchema:
+    class Color(StrEnum):
+        RED = "red"
+        BLUE = "blue"
+
+    class DummyBaseModel(BaseModel):
+        color: "TestGetPortableJsonSchema.Color" = Field(
+            description="A color.", json_schema_extra={"field_type": "str"}
+        )
+        tags: list[str] = Field(default_factory=list)
+
+    def test_output_is_as_expected(self):
+        schema = get_portable_json_schema(
+            TestGetPortableJsonSchema.DummyBaseModel, forbid_additional_properties=True
+        )
+        assert schema == {
+            "type": "object",
+            "properties": {
+                "color": {
+                    "description": "A color.",
+                    "enum": ["red", "blue"],
+                    "type": "string",
+                },
+                "tags": {"items": {"type": "string"}, "type": "array"},
+            },
+            "required": ["color", "tags"],
+            "additionalProperties": False,
+        }
+
+
+class TestStreamingJsonDetector:
+    class DummyBaseModel(BaseModel):
+        answer: str
+
+    def test_detects_first_final_valid_object_across_chunks(self):
+        text = (
+            'I "think" {not JSON}, and {"other": 1} is not it. '
+            '{"answer": "A \\"}\\\\ {B}"}\n``` Trailing prose {"answer": "C"}'
+        )
+        for chunk_size in range(1, 8):
+            detector = StreamingJsonDetector(TestStreamingJsonDetector.DummyBaseModel)
+            chunks = [text[i : i + chunk_size] for i in range(0, len(text), chunk_size)]
+            n_chunks_fed = 0
+            for chunk in chunks:
+                n_chunks_fed += 1
+                if detector.feed(chunk):
+                    break
+            assert detector.detected.answer == 'A "}\\ {B}'
+            assert n_chunks_fed * chunk_size < text.index("Trailing") + chunk_size
+
+    def test_detects_nothing_in_incomplete_object(self):
+        detector = StreamingJsonDetector(TestStreamingJsonDetector.DummyBaseModel)
+        assert not detector.feed('Sure: {"answer": "}"')
+        assert detector.detected is None
+
+    def test_skips_draft_objects_not_followed_by_closing_fence(self):
+        detector = StreamingJsonDetector(TestStreamingJsonDetector.DummyBaseModel)
+        assert not detector.feed('E.g., {"answer": "draft"}')
+        assert not detector.feed("`")  # (Could still be a closing fence)
+        assert not detector.feed('` is wrong. Final:\n```json\n{"answer": "final"}\n`')
+        assert detector.detected is None
+        assert detector.feed("``\nDone.")
+        assert detector.detected.answer == "final"
+
+
+class TestDetectExtractAndParseJsonFromText:
+    class DummyBaseModel(BaseModel):
+        answer: str
+        details: dict
+
+    def test_extracts_last_deeply_nested_json(self):
+        text = (
+            'First: {"answer": "old", "details": {}}. Unbalanced { prose "quote". '
+            'Final: {"answer": "} {", "details": {"a": {"b": {"c": [{}]}}}} Done :}'
+        )
+        output = detect_extract_and_parse_json_from_text(
+            text, TestDetectExtractAndParseJsonFromText.DummyBaseModel
+        )
+        assert output.answer == "} {"
+        assert output.details == {"a": {"b": {"c": [{}]}}}
+
+    def test_extracts_json_followed_by_quoted_closing_braces(self):
+        model = TestDetectExtractAndParseJsonFromText.DummyBaseModel
+        for text in (
+            'Final: {"answer": "A", "details": {}}\nNote: I avoided the "}" char.',
+            'So {"answer":"A","details":{"x":1}} and then "quoted } text" done',
+        ):
+            output = detect_extract_and_parse_json_from_text(text, model)
+            assert output.answer == "A"
+
+    def test_raises_if_no_or_mismatched_json(self):
+        model = TestDetectExtractAndParseJsonFromText.DummyBaseModel
+        with pytest.raises(ValueError, match="No valid JSON"):
+            detect_extract_and_parse_json_from_text("{Not: JSON}", model)
+        with pytest.raises(ValidationError):
+            detect_extract_and_parse_json_from_text('{"answer": "A"}', model)
+
+    def test_raises_if_last_parsable_json_is_mismatched(self):
+        model = TestDetectExtractAndParseJsonFromText.DummyBaseModel
+        text = 'Draft: {"answer": "A", "details": {}}. Final: {"answer": "B"} {Not: JSON}'
+        with pytest.raises(ValidationError):
+            detect_extract_and_parse_json_from_text(text, model)
+
+
 if __name__ == "__main__":
     test = TestGetPromptJsonSpec()
     test.test_output_is_as_expected()
+    test = TestGetPortableJsonSchema()
+    test.test_output_is_as_expected()
+    test = TestStreamingJsonDetector()
+    test.test_detects_first_final_valid_object_across_chunks()
+    test.test_detects_nothing_in_incomplete_object()
+    test.test_skips_draft_objects_not_followed_by_closing_fence()
+    test = TestDetectExtractAndParseJsonFromText()
+    test.test_extracts_last_deeply_nested_json()
+    test.test_extracts_json_followed_by_quoted_closing_braces()
+    test.test_raises_if_no_or_mismatched_json()
+    test.test_raises_if_last_parsable_json_is_mismatched()
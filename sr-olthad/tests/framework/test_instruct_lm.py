@@ -0,0 +1,453 @@
+import asyncio
+import os
+
+import pytest
+from pydantic import BaseModel
+
+from sr_olthad.framework.agents import (
+    AdaptiveVotingPolicy,
+    InstructLmAgent,
+    LmRetryInfo,
+    LmRetryStrategy,
+    VotingAgreementCounts,
+    VotingAgreementHistory,
+)
+from sr_olthad.framework.schema import (
+    INSTRUCT_LM_CALL_CONTEXT,
+    InstructLm,
+    InstructLmChatRole,
+    LmBackoffPolicy,
+    LmErrorKind,
+)
+from sr_olthad.framework.utils import call_stream_handler
+
+
+class DummyOutputData(BaseModel):
+    answer: str
+
+
+class RamblingInstructLm(InstructLm):
+    """
+    Streams a draft JSON answer, then its final (fenced) JSON answer followed by (a lot
+    of) trailing prose, chunk by chunk.
+    """
+
+    CHUNKS = [
+        'Draft: {"answer": "B"}. Final:\n```json\n',
+        '{"answer":',
+        ' "A"}',
+        "\n```",
+        " In conclusion,",
+    ] + [" blah"] * 100
+
+    def __init__(self):
+        super().__init__()
+        self.n_chunks_generated = 0
+
+    async def generate(self, messages, stream_handler=None, **kwargs) -> str:
+        full_response = ""
+        for chunk in self.CHUNKS:
+            self.n_chunks_generated += 1
+            full_response += chunk
+            if stream_handler is not None and call_stream_handler(stream_handler, chunk):
+                break
+        return full_response
+
+
+class StructuredOutputInstructLm(InstructLm):
+    """
+    Answers with bare JSON if constrained to a response_json_model (or, if it isn't told
+    to support structured output, raises), and with unparsable text every other time
+    otherwise.
+    """
+
+    def __init__(self, supports_structured_output: bool):
+        super().__init__()
+        self.supports_structured_output = supports_structured_output
+        self.n_calls = 0
+
+    async def generate(
+        self, messages, stream_handler=None, response_json_model=None, **kwargs
+    ) -> str:
+        if response_json_model is not None:
+            if not self.supports_structured_output:
+                raise TypeError(
+                    "generate() got an unexpected keyword argument 'response_json_model'"
+                )
+            return '{"answer": "A"}'
+        self.n_calls += 1
+        return 'Sure: {"answer": "A"}' if self.n_calls % 2 == 0 else "Sure: {answer: A}"
+
+
+class BuggyInstructLm(InstructLm):
+    """Raises a `TypeError` that has nothing to do with structured output."""
+
+    async def generate(self, messages, stream_handler=None, **kwargs) -> str:
+        return None + "{}"
+
+
+class SloppyInstructLm(InstructLm):
+    """
+    Answers with a long reasoning and invalid JSON, unless asked to correct its JSON.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.received_messages = []
+
+    async def generate(self, messages, stream_handler=None, **kwargs) -> str:
+        self.received_messages.append(messages)
+        if (
+            messages[-1]["role"] == InstructLmChatRole.USER
+            and "corrected" in messages[-1]["content"]
+        ):
+            return '{"answer": "A"}'
+        return "Long reasoning... " * 100 + '{"answer": 1}'
+
+
+class ApiError(Exception):
+    def __init__(self, status_code: int, message: str = ""):
+        super().__init__(f"Error code: {status_code} {message}".strip())
+        self.status_code = status_code
+
+
+class FlakyInstructLm(InstructLm):
+    """
+    Raises API errors with the given status codes (one per call) before answering.
+    """
+
+    backoff_policy = LmBackoffPolicy(max_retries=2, base_delay_seconds=0.001)
+
+    def __init__(self, status_codes: list[int], error_message: str = ""):
+        super().__init__()
+        self.status_codes = status_codes
+        self.error_message = error_message
+        self.n_calls = 0
+
+    async def generate(self, messages, stream_handler=None, **kwargs) -> str:
+        self.n_calls += 1
+        if self.status_codes:
+            raise ApiError(self.status_codes.pop(0), self.error_message)
+        return '{"answer": "A"}'
+
+
+class VoterInstructLm(InstructLm):
+    """
+    Answers the voting samples with the given answers, the later samples taking longer.
+    """
+
+    def __init__(self, answers: list[str]):
+        super().__init__()
+        self.answers = answers
+        self.finished_sample_idxs = []
+        self.n_ongoing_calls = 0
+        self.max_n_ongoing_calls = 0
+
+    async def generate(self, messages, stream_handler=None, **kwargs) -> str:
+        sample_idx = INSTRUCT_LM_CALL_CONTEXT.get().voting_sample_idx
+        self.n_ongoing_calls += 1
+        self.max_n_ongoing_calls = max(self.max_n_ongoing_calls, self.n_ongoing_calls)
+        await asyncio.sleep(0.01 * sample_idx)
+        self.n_ongoing_calls -= 1
+        self.finished_sample_idxs.append(sample_idx)
+        return f'{{"answer": "{self.answers[sample_idx]}"}}'
+
+
+class NSamplingInstructLm(InstructLm):
+    """
+    Samples n responses in one `generate_many` call (one of them unparsable), and answers
+    `generate` calls (i.e., re-tries) with parsable responses.
+    """
+
+    def __init__(self, generate_many_error: Exception | None = None):
+        super().__init__()
+        self.generate_many_error = generate_many_error
+        self.generate_many_ns = []
+        self.n_generate_calls = 0
+
+    async def generate(self, messages, stream_handler=None, **kwargs) -> str:
+        self.n_generate_calls += 1
+        return '{"answer": "B"}'
+
+    async def generate_many(self, messages, n, streams_handler=None, **kwargs) -> list[str]:
+        self.generate_many_ns.append(n)
+        if self.generate_many_error is not None:
+            raise self.generate_many_error
+        return ['{"answer": "A"}'] * (n - 1) + ["{answer: A}"]
+
+
+class TestInstructLmAgent:
+    MESSAGES = [{"role": InstructLmChatRole.USER, "content": "Answer."}]
+
+    def test_stream_stops_at_valid_json(self):
+        lm = RamblingInstructLm()
+        streamed = []
+        agent = InstructLmAgent(
+            instruct_lm=lm,
+            response_json_model=DummyOutputData,
+            streams_handler=lambda chunk_str, stream_idx=None: streamed.append(chunk_str),
+            stop_streams_at_valid_json=True,
+        )
+        output = asyncio.run(agent.run(self.MESSAGES))
+        # (Not stopped at the draft, which isn't followed by a closing code fence)
+        assert output.data.answer == "A"
+        assert output.messages[-1]["content"] == "".join(RamblingInstructLm.CHUNKS[:4])
+        assert streamed == RamblingInstructLm.CHUNKS[:4]
+        assert lm.n_chunks_generated == 4
+
+    def test_stream_runs_to_end_by_default(self):
+        lm = RamblingInstructLm()
+        agent = InstructLmAgent(instruct_lm=lm, response_json_model=DummyOutputData)
+        output = asyncio.run(agent.run(self.MESSAGES))
+        assert output.data.answer == "A"
+        assert lm.n_chunks_generated == len(RamblingInstructLm.CHUNKS)
+
+    def test_structured_output_and_fallback(self):
+        for supports_structured_output in (True, False):
+            agent = InstructLmAgent(
+                instruct_lm=StructuredOutputInstructLm(supports_structured_output),
+                response_json_model=DummyOutputData,
+                max_tries_to_get_parsable_response=2,
+                use_structured_output=True,
+            )
+            for _ in range(3):
+                output = asyncio.run(agent.run(self.MESSAGES))
+                assert output.data.answer == "A"
+            if supports_structured_output:
+                assert agent.stats.n_structured_attempts == 3
+                assert agent.stats.n_attempts == 0
+                assert agent.stats.estimate_n_retries_saved(unparsable_rate=0.5) == 1.5
+            else:
+                assert agent.stats.n_structured_output_fallbacks == 1
+                assert not agent.use_structured_output
+                assert agent.stats.n_attempts == 6
+                assert agent.stats.n_unparsable == 3
+
+    def test_structured_output_only_falls_back_on_rejections(self):
+        # (A fatal error unrelated to structured output is raised, without falling back)
+        agent = InstructLmAgent(
+            instruct_lm=FlakyInstructLm([401], error_message="Invalid API key"),
+            response_json_model=DummyOutputData,
+            use_structured_output=True,
+        )
+        with pytest.raises(ApiError):
+            asyncio.run(agent.run(self.MESSAGES))
+        assert agent.use_structured_output
+        # (Nor is a TypeError that isn't about the response_json_model kwarg)
+        agent = InstructLmAgent(
+            instruct_lm=BuggyInstructLm(),
+            response_json_model=DummyOutputData,
+            use_structured_output=True,
+        )
+        with pytest.raises(TypeError):
+            asyncio.run(agent.run(self.MESSAGES))
+        assert agent.use_structured_output
+        assert agent.stats.n_structured_output_fallbacks == 0
+        assert agent.stats.n_structured_attempts == 0
+
+        # (A bad request about the schema is a rejection of structured output)
+        error_message = "Invalid schema for response_format 'DummyOutputData'"
+        agent.instruct_lm = FlakyInstructLm([400], error_message=error_message)
+        output = asyncio.run(agent.run(self.MESSAGES))
+        assert output.data.answer == "A"
+        assert not agent.use_structured_output
+        assert agent.stats.n_structured_output_fallbacks == 1
+
+    def test_repair_retry_only_asks_for_corrected_json(self):
+        lm = SloppyInstructLm()
+        agent = InstructLmAgent(
+            instruct_lm=lm,
+            response_json_model=DummyOutputData,
+            max_tries_to_get_parsable_response=2,
+            retry_strategy=LmRetryStrategy.REPAIR,
+        )
+        output = asyncio.run(agent.run(self.MESSAGES))
+        assert output.data.answer == "A"
+        repair_messages = lm.received_messages[1]
+        assert repair_messages[:-2] == self.MESSAGES
+        assert repair_messages[-2]["content"].endswith('{"answer": 1}')
+        assert "answer" in repair_messages[-1]["content"]  # (The validation error)
+        assert output.messages == repair_messages + [
+            {"role": InstructLmChatRole.ASSISTANT, "content": '{"answer": "A"}'}
+        ]
+
+    def test_transient_errors_are_retried_with_backoff(self):
+        retry_infos: list[LmRetryInfo] = []
+        agent = InstructLmAgent(
+            instruct_lm=FlakyInstructLm([429, 503]),
+            response_json_model=DummyOutputData,
+            max_tries_to_get_parsable_response=1,
+        )
+        output = asyncio.run(
+            agent.run(self.MESSAGES, retry_callback=lambda _, __, i: retry_infos.append(i))
+        )
+        assert output.data.answer == "A"
+        assert [i.error_kind for i in retry_infos] == [LmErrorKind.TRANSIENT] * 2
+        assert [i.n_transient_retries_left for i in retry_infos] == [1, 0]
+        assert all(i.n_tries_left == 1 for i in retry_infos)
+        assert retry_infos[-1].stats.n_transient_errors == 2
+        assert 0 < agent.stats.backoff_seconds <= 0.003
+
+    def test_fatal_errors_and_exhausted_retries_raise(self):
+        for status_codes, expected_n_calls in (([401], 1), ([429, 429, 429], 3)):
+            lm = FlakyInstructLm(status_codes)
+            agent = InstructLmAgent(instruct_lm=lm, response_json_model=DummyOutputData)
+            with pytest.raises(ApiError):
+                asyncio.run(agent.run(self.MESSAGES))
+            assert lm.n_calls == expected_n_calls
+
+    def test_voting_stops_early_once_winner_is_decided(self):
+        for early_stop_vote_share, expected_n_calls in ((None, 3), (0.9, 2)):
+            lm = VoterInstructLm(["A", "A", "A", "B", "B"])
+            agent = InstructLmAgent(
+                instruct_lm=lm,
+                response_json_model=DummyOutputData,
+                num_calls_for_voting=5,
+                max_async_calls=5,
+                vote_field="answer",
+                early_stop_voting=True,
+                early_stop_vote_share=early_stop_vote_share,
+            )
+            output = asyncio.run(agent.run(self.MESSAGES))
+            assert output.data.answer == "A"
+            assert lm.finished_sample_idxs == list(range(expected_n_calls))
+            assert len(output.messages) == expected_n_calls
+            assert agent.stats.n_voting_calls_saved == 5 - expected_n_calls
+
+    def test_votes_are_sampled_in_one_request(self):
+        lm = NSamplingInstructLm()
+        agent = InstructLmAgent(
+            instruct_lm=lm,
+            response_json_model=DummyOutputData,
+            max_tries_to_get_parsable_response=2,
+            num_calls_for_voting=3,
+            max_async_calls=3,
+            vote_field="answer",
+            sample_votes_in_one_request=True,
+        )
+        output = asyncio.run(agent.run(self.MESSAGES))
+        assert output.data.answer == "A"
+        assert lm.generate_many_ns == [3]
+        assert lm.n_generate_calls == 1  # (Only the unparsable sample is re-tried)
+        assert agent.stats.n_attempts == 4
+        assert agent.stats.n_unparsable == 1
+
+    def test_votes_are_sampled_separately_unless_fatal_error(self):
+        for error, is_fallen_back_from in (
+            (ApiError(429), True),
+            (ApiError(400, "Invalid 'n': only n=1 is supported"), True),
+            (ApiError(401), False),
+        ):
+            lm = NSamplingInstructLm(generate_many_error=error)
+            agent = InstructLmAgent(
+                instruct_lm=lm,
+                response_json_model=DummyOutputData,
+                num_calls_for_voting=3,
+                max_async_calls=3,
+                vote_field="answer",
+                sample_votes_in_one_request=True,
+            )
+            if is_fallen_back_from:
+                assert asyncio.run(agent.run(self.MESSAGES)).data.answer == "B"
+                assert lm.n_generate_calls == 3
+            else:
+                with pytest.raises(ApiError):
+                    asyncio.run(agent.run(self.MESSAGES))
+                assert lm.n_generate_calls == 0
+
+    def test_default_generate_many_generates_each_voting_sample(self):
+        lm = VoterInstructLm(["A", "B", "A"])
+        responses = asyncio.run(lm.generate_many(self.MESSAGES, n=3))
+        assert responses == ['{"answer": "A"}', '{"answer": "B"}', '{"answer": "A"}']
+        assert INSTRUCT_LM_CALL_CONTEXT.get() is None
+        assert lm.max_n_ongoing_calls == 3
+        lm = VoterInstructLm(["A", "B", "A"])
+        asyncio.run(lm.generate_many(self.MESSAGES, n=3, max_concurrent_calls=2))
+        assert lm.max_n_ongoing_calls == 2
+
+    def test_adaptive_voting_expands_only_when_first_votes_disagree(self):
+        history = VotingAgreementHistory()
+        history.counts["clf"] = VotingAgreementCounts(n_votings=8, n_unanimous=8)
+        for answers, expected_winner, expected_n_calls in (
+            (["A", "A", "B", "B", "B"], "A", 2),
+            (["A", "B", "B", "B", "A"], "B", 5),
+        ):
+            lm = VoterInstructLm(answers)
+            agent = InstructLmAgent(
+                instruct_lm=lm,
+                response_json_model=DummyOutputData,
+                num_calls_for_voting=5,
+                max_async_calls=5,
+                vote_field="answer",
+                adaptive_voting=AdaptiveVotingPolicy(history=history, key="clf"),
+            )
+            output = asyncio.run(agent.run(self.MESSAGES))
+            assert output.data.answer == expected_winner
+            assert sorted(lm.finished_sample_idxs) == list(range(expected_n_calls))
+            assert agent.stats.n_voting_calls_saved == 5 - expected_n_calls
+        assert history.counts["clf"] == VotingAgreementCounts(n_votings=10, n_unanimous=9)
+
+    def test_adaptive_voting_starts_with_all_calls_after_disagreements(self):
+        history = VotingAgreementHistory()
+        history.counts["clf"] = VotingAgreementCounts(n_votings=4, n_unanimous=1)
+        policy = AdaptiveVotingPolicy(history=history, key="clf")
+        assert policy.get_n_initial_calls(5) == 5
+        assert policy.get_n_initial_calls(1) == 1
+        assert AdaptiveVotingPolicy(history=history, key="new").get_n_initial_calls(5) == 5
+
+    def test_voting_agreement_history_persists(self, tmp_path):
+        fpath = str(tmp_path / "history" / "voting_agreement.json")
+        history = VotingAgreementHistory(fpath)
+        history.record("clf", is_unanimous=True)
+        assert not os.path.exists(fpath)  # (Only saved when persisted)
+
+        history.record("clf", is_unanimous=False)
+
+        async def persist_concurrently():
+            await asyncio.gather(history.persist(), history.persist())
+
+        asyncio.run(persist_concurrently())
+        loaded_history = VotingAgreementHistory(fpath)
+        assert loaded_history.counts == history.counts
+        assert loaded_history.get_unanimity_rate("clf") == 0.5
+
+    def test_voting_agreement_history_is_saved_in_background(self, monkeypatch, tmp_path):
+        fpath = str(tmp_path / "voting_agreement.json")
+        history = VotingAgreementHistory(fpath)
+        saved_counts = []
+        save_counts = VotingAgreementHistory._save_counts
+
+        def record_and_save_counts(fpath: str, counts: dict) -> None:
+            saved_counts.append(counts)
+            save_counts(fpath, counts)
+
+        monkeypatch.setattr(
+            VotingAgreementHistory, "_save_counts", staticmethod(record_and_save_counts)
+        )
+
+        async def record_then_flush():
+            for is_unanimous in (True, True, False):
+                history.record("clf", is_unanimous)  # (Without waiting for any save)
+            assert saved_counts == []
+            await history.persist()
+
+        asyncio.run(record_then_flush())
+        assert len(saved_counts) == 1  # (The updates were coalesced into one save)
+        assert VotingAgreementHistory(fpath).counts == history.counts
+
+
+if __name__ == "__main__":
+    test = TestInstructLmAgent()
+    test.test_stream_stops_at_valid_json()
+    test.test_stream_runs_to_end_by_default()
+    test.test_structured_output_and_fallback()
+    test.test_structured_output_only_falls_back_on_rejections()
+    test.test_repair_retry_only_asks_for_corrected_json()
+    test.test_transient_errors_are_retried_with_backoff()
+    test.test_fatal_errors_and_exhausted_retries_raise()
+    test.test_voting_stops_early_once_winner_is_decided()
+    test.test_votes_are_sampled_in_one_request()
+    test.test_votes_are_sampled_separately_unless_fatal_error()
+    test.test_default_generate_many_generates_each_voting_sample()
+    test.test_adaptive_voting_expands_only_when_first_votes_disagree()
+    test.test_adaptive_voting_starts_with_all_calls_after_disagreements()
@@ -0,0 +1,114 @@
+import asyncio
+
+from pydantic import BaseModel
+
+from sr_olthad.framework.agents import InstructLmAgent
+from sr_olthad.framework.lm_cache import (
+    CachedInstructLm,
+    LmResponseCache,
+    VotingSampleCachePolicy,
+)
+from sr_olthad.framework.schema import InstructLm, InstructLmChatRole
+
+
+class DummyOutputData(BaseModel):
+    answer: str
+
+
+class CountingInstructLm(InstructLm):
+    """
+    Responds with (valid JSON containing) the number of times it has been called.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.model = "dummy-model"
+        self.n_calls = 0
+
+    async def generate(self, messages, stream_handler=None, **kwargs) -> str:
+        self.n_calls += 1
+        return f'{{"answer": "{self.n_calls}"}}'
+
+
+class TestCachedInstructLm:
+    MESSAGES = [{"role": InstructLmChatRole.USER, "content": "Answer."}]
+
+    def test_identical_requests_hit_the_cache(self):
+        lm = CountingInstructLm()
+        cached_lm = CachedInstructLm(lm)
+        first = asyncio.run(cached_lm.generate(self.MESSAGES, temperature=0.0))
+        second = asyncio.run(cached_lm.generate(self.MESSAGES, temperature=0.0))
+        third = asyncio.run(cached_lm.generate(self.MESSAGES, temperature=1.0))
+        assert first == second != third
+        assert lm.n_calls == 2
+
+    def test_on_disk_tier_persists_across_instances(self, tmp_path):
+        db_fpath = str(tmp_path / "lm_cache.sqlite")
+        lm = CountingInstructLm()
+        cached_lm = CachedInstructLm(lm, cache=LmResponseCache(db_fpath=db_fpath))
+        first = asyncio.run(cached_lm.generate(self.MESSAGES))
+        cached_lm = CachedInstructLm(lm, cache=LmResponseCache(db_fpath=db_fpath))
+        assert asyncio.run(cached_lm.generate(self.MESSAGES)) == first
+        assert lm.n_calls == 1
+
+    def test_expired_and_evicted_entries_are_misses(self, monkeypatch):
+        now = 1000.0
+        monkeypatch.setattr("sr_olthad.framework.lm_cache.time.time", lambda: now)
+        cache = LmResponseCache(max_entries_in_memory=2, ttl_seconds=10)
+        for key in ("a", "b", "c"):
+            asyncio.run(cache.set(key, key.upper()))
+        assert asyncio.run(cache.get("a")) is None
+        assert asyncio.run(cache.get("b")) == "B"
+        now += 11
+        assert asyncio.run(cache.get("b")) is None
+
+    def test_on_disk_eviction_is_periodic_and_keeps_recently_accessed(
+        self, monkeypatch, tmp_path
+    ):
+        now = 1000.0
+        monkeypatch.setattr("sr_olthad.framework.lm_cache.time.time", lambda: now)
+        cache = LmResponseCache(
+            max_entries_in_memory=1,
+            db_fpath=str(tmp_path / "lm_cache.sqlite"),
+            max_entries_on_disk=2,
+            eviction_interval_n_sets=4,
+        )
+
+        def count_on_disk() -> int:
+            return cache._db.execute("SELECT COUNT(*) FROM lm_responses").fetchone()[0]
+
+        for key in ("a", "b", "c"):
+            asyncio.run(cache.set(key, key.upper()))
+            now += 1
+        assert count_on_disk() == 3  # (Not evicted yet)
+        assert asyncio.run(cache.get("a")) == "A"  # (From disk, so "a" is touched)
+        now += 1
+        asyncio.run(cache.set("d", "D"))  # Writes the touch of "a", then evicts
+        assert count_on_disk() == 2
+        assert asyncio.run(cache.get("a")) == "A"
+        assert asyncio.run(cache.get("b")) is None
+
+    def test_voting_sample_policies(self):
+        expected_n_calls = {
+            VotingSampleCachePolicy.SHARED: 1,
+            VotingSampleCachePolicy.PER_SAMPLE: 3,
+            VotingSampleCachePolicy.BYPASS: 6,
+        }
+        for policy, n_calls in expected_n_calls.items():
+            lm = CountingInstructLm()
+            agent = InstructLmAgent(
+                instruct_lm=CachedInstructLm(lm, voting_sample_policy=policy),
+                response_json_model=DummyOutputData,
+                vote_field="answer",
+                num_calls_for_voting=3,
+                max_async_calls=1,
+            )
+            for _ in range(2):
+                asyncio.run(agent.run(self.MESSAGES))
+            assert lm.n_calls == n_calls
+
+
+if __name__ == "__main__":
+    test = TestCachedInstructLm()
+    test.test_identical_requests_hit_the_cache()
+    test.test_voting_sample_policies()
@@ -0,0 +1,449 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import google.generativeai as genai
+import httpx
+import openai
+import pytest
+from google.api_core import exceptions as google_exceptions
+from openai import AsyncOpenAI
+from pydantic import BaseModel
+
+from sr_olthad.framework.lms import (
+    DeepSeekInstructLm,
+    GeminiInstructLm,
+    HttpClientPoolCfg,
+    OpenAIInstructLm,
+)
+from sr_olthad.framework.rate_limits import LmRateLimits
+from sr_olthad.framework.schema import (
+    InstructLmChatRole,
+    LmBackoffPolicy,
+    LmErrorKind,
+    StopLmStream,
+)
+
+
+class TestSharedClients:
+    def test_instruct_lms_of_same_endpoint_share_a_client(self):
+        lm_a = OpenAIInstructLm(api_key="x", model="gpt-4.1")
+        lm_b = OpenAIInstructLm(api_key="x", model="gpt-4.1-mini")
+        other_key_lm = OpenAIInstructLm(api_key="y", model="gpt-4.1")
+        other_pool_lm = OpenAIInstructLm(
+            api_key="x", model="gpt-4.1", pool_cfg=HttpClientPoolCfg(max_connections=1)
+        )
+        assert lm_a.client is lm_b.client
+        assert other_key_lm.client is not lm_a.client
+        assert other_pool_lm.client is not lm_a.client
+
+
+class TestDeepSeekInstructLm:
+    CHUNKS = ["Hello", ", ", "world!"]
+
+    @staticmethod
+    async def stream_sse_chunks():
+        for chunk_text in TestDeepSeekInstructLm.CHUNKS:
+            chunk = {
+                "id": "1",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": "deepseek-chat",
+                "choices": [{"index": 0, "delta": {"content": chunk_text}}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n".encode()
+            await asyncio.sleep(0.01)  # (Network latency between chunks)
+        yield b"data: [DONE]\n\n"
+
+    def test_concurrent_streams_overlap(self):
+        def handle_request(request: httpx.Request) -> httpx.Response:
+            assert request.url.host == "api.deepseek.com"
+            return httpx.Response(
+                200,
+                headers={"content-type": "text/event-stream"},
+                content=self.stream_sse_chunks(),
+            )
+
+        lm = DeepSeekInstructLm(api_key="x")
+        lm._client = AsyncOpenAI(
+            api_key="x",
+            base_url=lm._base_url,
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handle_request)),
+        )
+        received = []
+        messages = [{"role": InstructLmChatRole.USER, "content": "Say hello."}]
+
+        async def generate_concurrently() -> list[str]:
+            return await asyncio.gather(
+                lm.generate(messages, stream_handler=lambda c: received.append((0, c))),
+                lm.generate(messages, stream_handler=lambda c: received.append((1, c))),
+            )
+
+        responses = asyncio.run(generate_concurrently())
+        assert responses == ["Hello, world!"] * 2
+        stream_idxs = [stream_idx for stream_idx, _ in received]
+        assert stream_idxs != sorted(stream_idxs)  # The streams' chunks interleave
+
+    def test_requires_a_deepseek_api_key(self, monkeypatch):
+        # (The OpenAI key must never be sent to DeepSeek's API)
+        monkeypatch.delenv("DEEPSEEK_API_KEY", raising=False)
+        monkeypatch.setenv("OPENAI_API_KEY", "openai-secret")
+        with pytest.raises(ValueError, match="DEEPSEEK_API_KEY"):
+            DeepSeekInstructLm()
+        monkeypatch.setenv("DEEPSEEK_API_KEY", "deepseek-key")
+        assert DeepSeekInstructLm()._api_key == "deepseek-key"
+
+
+class TestGenerate:
+    def test_openai_refusal_without_content_is_an_empty_response(self):
+        def handle_request(request: httpx.Request) -> httpx.Response:
+            chat_completion = {
+                "id": "1",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "gpt-4.1",
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {
+                            "role": "assistant",
+                            "content": None,
+                            "refusal": "I can't help with that.",
+                        },
+                    }
+                ],
+            }
+            return httpx.Response(200, json=chat_completion)
+
+        # (W/ rate limits, so that the response's tokens are charged)
+        lm = OpenAIInstructLm(
+            api_key="x", model="gpt-4.1", rate_limits=LmRateLimits(tokens_per_minute=1000)
+        )
+        lm._client = AsyncOpenAI(
+            api_key="x",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handle_request)),
+        )
+        messages = [{"role": InstructLmChatRole.USER, "content": "Answer."}]
+        assert asyncio.run(lm.generate(messages)) == ""
+
+
+class TestStructuredOutput:
+    class DummyOutputData(BaseModel):
+        answer: str
+
+    def test_openai_request_has_strict_json_schema(self):
+        requests = []
+
+        def handle_request(request: httpx.Request) -> httpx.Response:
+            requests.append(json.loads(request.content))
+            chat_completion = {
+                "id": "1",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "gpt-4.1",
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": '{"answer": "A"}'},
+                    }
+                ],
+            }
+            return httpx.Response(200, json=chat_completion)
+
+        lm = OpenAIInstructLm(api_key="x", model="gpt-4.1")
+        lm._client = AsyncOpenAI(
+            api_key="x",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handle_request)),
+        )
+        messages = [{"role": InstructLmChatRole.USER, "content": "Answer."}]
+        response = asyncio.run(
+            lm.generate(messages, response_json_model=TestStructuredOutput.DummyOutputData)
+        )
+        assert response == '{"answer": "A"}'
+        json_schema = requests[0]["response_format"]["json_schema"]
+        assert json_schema["strict"]
+        assert json_schema["schema"]["additionalProperties"] is False
+        assert "response_json_model" not in requests[0]
+
+
+class TestGenerateMany:
+    # (Chunks of 2 responses, interleaved as in the API's streams)
+    CHUNKS = [
+        (0, '{"answer":'),
+        (1, "Hmm, "),
+        (0, ' "A"}'),
+        (1, '{"answer": "B"}'),
+        (0, "!"),
+    ]
+
+    @staticmethod
+    async def stream_sse_chunks():
+        for choice_idx, chunk_text in TestGenerateMany.CHUNKS:
+            chunk = {
+                "id": "1",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": "gpt-4.1",
+                "choices": [{"index": choice_idx, "delta": {"content": chunk_text}}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+    def test_openai_samples_in_one_request_and_fans_out_streams(self):
+        requests = []
+
+        def handle_request(request: httpx.Request) -> httpx.Response:
+            requests.append(json.loads(request.content))
+            return httpx.Response(
+                200,
+                headers={"content-type": "text/event-stream"},
+                content=self.stream_sse_chunks(),
+            )
+
+        lm = OpenAIInstructLm(api_key="x", model="gpt-4.1")
+        lm._client = AsyncOpenAI(
+            api_key="x",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handle_request)),
+        )
+        received = []
+        messages = [{"role": InstructLmChatRole.USER, "content": "Answer."}]
+        responses = asyncio.run(
+            lm.generate_many(
+                messages,
+                n=2,
+                streams_handler=lambda c, stream_idx=None: received.append((stream_idx, c)),
+            )
+        )
+        assert len(requests) == 1
+        assert requests[0]["n"] == 2
+        assert responses == ['{"answer": "A"}!', 'Hmm, {"answer": "B"}']
+        assert received == self.CHUNKS
+
+
+class TestNextTokenLogprobs:
+    def test_openai_requests_one_token_with_top_logprobs(self):
+        requests = []
+
+        def handle_request(request: httpx.Request) -> httpx.Response:
+            requests.append(json.loads(request.content))
+            top_logprobs = [
+                {"token": "A", "logprob": -0.1, "bytes": [65]},
+                {"token": " A", "logprob": -3.0, "bytes": [32, 65]},
+                {"token": "B", "logprob": -2.5, "bytes": [66]},
+            ]
+            chat_completion = {
+                "id": "1",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "gpt-4.1",
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "length",
+                        "message": {"role": "assistant", "content": "A"},
+                        "logprobs": {
+                            "content": [
+                                {
+                                    "token": "A",
+                                    "logprob": -0.1,
+                                    "bytes": [65],
+                                    "top_logprobs": top_logprobs,
+                                }
+                            ]
+                        },
+                    }
+                ],
+            }
+            return httpx.Response(200, json=chat_completion)
+
+        lm = OpenAIInstructLm(api_key="x", model="gpt-4.1")
+        lm._client = AsyncOpenAI(
+            api_key="x",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handle_request)),
+        )
+        messages = [{"role": InstructLmChatRole.USER, "content": "Answer."}]
+        token_logprobs = asyncio.run(lm.get_next_token_logprobs(messages, n_top=5))
+        assert token_logprobs == {"A": -0.1, " A": -3.0, "B": -2.5}
+        assert requests[0]["max_tokens"] == 1
+        assert requests[0]["logprobs"] is True
+        assert requests[0]["top_logprobs"] == 5
+
+
+class FakeGenerativeModel:
+    """Stands in for `genai.GenerativeModel`, recording how it is built and called."""
+
+    n_instances = 0
+
+    def __init__(self, model_name: str, system_instruction: str | None = None):
+        FakeGenerativeModel.n_instances += 1
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.calls = []
+
+    @classmethod
+    def from_cached_content(cls, cached_content):
+        return cls(cached_content.model, cached_content.system_instruction)
+
+    async def generate_content_async(self, contents, generation_config=None, stream=False):
+        self.calls.append((contents, generation_config))
+        usage_metadata = SimpleNamespace(
+            prompt_token_count=10, cached_content_token_count=0, candidates_token_count=2
+        )
+        if stream:
+            return FakeResponseStream(["Hi", "!", " Bye."], usage_metadata)
+        return SimpleNamespace(text="Hi!", usage_metadata=usage_metadata)
+
+
+class FakeResponseStream:
+    """Stands in for a streamed Gemini response, recording whether it was closed."""
+
+    def __init__(self, texts: list[str], usage_metadata: SimpleNamespace):
+        self.texts = texts
+        self.usage_metadata = usage_metadata
+        self.is_closed = False
+        self._iterator = self._iter_chunks()
+
+    async def _iter_chunks(self):
+        try:
+            for text in self.texts:
+                yield SimpleNamespace(text=text, usage_metadata=self.usage_metadata)
+        finally:
+            self.is_closed = True
+
+    async def __aiter__(self):
+        async for chunk in self._iterator:
+            yield chunk
+
+
+class TestGeminiInstructLm:
+    def test_system_prompt_is_system_instruction_of_reused_model(self, monkeypatch):
+        monkeypatch.setattr(genai, "GenerativeModel", FakeGenerativeModel)
+        monkeypatch.setattr(FakeGenerativeModel, "n_instances", 0)
+        lm = GeminiInstructLm(api_key="x")
+        messages = [
+            {"role": InstructLmChatRole.SYS, "content": "Be nice."},
+            {"role": InstructLmChatRole.USER, "content": "Hello."},
+        ]
+        other_sys_messages = [{**messages[0], "content": "Be mean."}, messages[1]]
+
+        async def generate_thrice() -> list[str]:
+            return [
+                await lm.generate(messages, temperature=0.5),
+                await lm.generate(messages),
+                await lm.generate(other_sys_messages),
+            ]
+
+        assert asyncio.run(generate_thrice()) == ["Hi!"] * 3
+        assert FakeGenerativeModel.n_instances == 2
+        genai_model = asyncio.run(lm._get_genai_model("Be nice."))
+        assert genai_model.system_instruction == "Be nice."
+        contents, generation_config = genai_model.calls[0]
+        assert contents == [{"role": "user", "parts": [{"text": "Hello."}]}]
+        assert generation_config == {"temperature": 0.5}
+        assert lm.token_usage.n_calls == 3
+        assert lm.token_usage.prompt_tokens == 30
+        assert lm.token_usage.completion_tokens == 6
+
+    def test_stopped_stream_is_closed(self, monkeypatch):
+        streams = []
+        original_generate = FakeGenerativeModel.generate_content_async
+
+        async def generate_content_async(self, *args, **kwargs):
+            streams.append(await original_generate(self, *args, **kwargs))
+            return streams[-1]
+
+        monkeypatch.setattr(genai, "GenerativeModel", FakeGenerativeModel)
+        monkeypatch.setattr(
+            FakeGenerativeModel, "generate_content_async", generate_content_async
+        )
+        lm = GeminiInstructLm(api_key="x")
+
+        def stop_at_exclamation(chunk_str: str):
+            if chunk_str == "!":
+                raise StopLmStream
+
+        messages = [{"role": InstructLmChatRole.USER, "content": "Hello."}]
+        response = asyncio.run(lm.generate(messages, stream_handler=stop_at_exclamation))
+        assert response == "Hi!"
+        assert streams[0].is_closed
+
+    def test_concurrent_calls_create_one_cached_content(self, monkeypatch):
+        created = []
+
+        def create_cached_content(model, system_instruction, ttl):
+            created.append(system_instruction)
+            time.sleep(0.01)  # (Run in a thread, during which the other calls come in)
+            return SimpleNamespace(model=model, system_instruction=system_instruction)
+
+        monkeypatch.setattr(genai, "GenerativeModel", FakeGenerativeModel)
+        monkeypatch.setattr(genai.caching.CachedContent, "create", create_cached_content)
+        lm = GeminiInstructLm(api_key="x", context_cache_ttl_seconds=60)
+        messages = [
+            {"role": InstructLmChatRole.SYS, "content": "Be nice."},
+            {"role": InstructLmChatRole.USER, "content": "Hello."},
+        ]
+
+        async def generate_concurrently() -> list[str]:
+            return await asyncio.gather(*(lm.generate(messages) for _ in range(3)))
+
+        assert asyncio.run(generate_concurrently()) == ["Hi!"] * 3
+        assert created == ["Be nice."]
+        assert lm._pending_genai_models == {}
+
+
+class TestErrorClassification:
+    @staticmethod
+    def get_openai_error(status_code: int, headers: dict[str, str] | None = None):
+        request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+        response = httpx.Response(status_code, headers=headers, request=request)
+        return openai.APIStatusError("Error", response=response, body=None)
+
+    def test_openai_errors_are_classified_with_retry_after(self):
+        lm = OpenAIInstructLm(api_key="x", model="gpt-4.1")
+        rate_limit_error = self.get_openai_error(429, {"retry-after": "3"})
+        assert lm.classify_error(rate_limit_error) == LmErrorKind.TRANSIENT
+        assert lm.get_retry_after_seconds(rate_limit_error) == 3.0
+        ms_error = self.get_openai_error(503, {"retry-after-ms": "250"})
+        assert lm.classify_error(ms_error) == LmErrorKind.TRANSIENT
+        assert lm.get_retry_after_seconds(ms_error) == 0.25
+        assert lm.classify_error(self.get_openai_error(401)) == LmErrorKind.FATAL
+        assert lm.classify_error(ValueError()) == LmErrorKind.OTHER
+
+    def test_gemini_errors_are_classified(self):
+        lm = GeminiInstructLm(api_key="x", model="gemini-2.0-flash")
+        error = google_exceptions.ResourceExhausted("Quota exceeded")
+        assert lm.classify_error(error) == LmErrorKind.TRANSIENT
+        error = google_exceptions.InvalidArgument("Bad request")
+        assert lm.classify_error(error) == LmErrorKind.FATAL
+
+    def test_backoff_delays_grow_and_respect_retry_after(self):
+        policy = LmBackoffPolicy(
+            base_delay_seconds=1.0, max_delay_seconds=10.0, jitter=False
+        )
+        assert [policy.get_delay_seconds(i) for i in range(5)] == [1, 2, 4, 8, 10]
+        assert policy.get_delay_seconds(0, retry_after_seconds=5.0) == 5.0
+        assert policy.get_delay_seconds(0, retry_after_seconds=100.0) == 10.0
+        jittered_policy = LmBackoffPolicy(base_delay_seconds=1.0)
+        assert all(0 <= jittered_policy.get_delay_seconds(3) <= 8 for _ in range(100))
+
+
+if __name__ == "__main__":
+    test = TestSharedClients()
+    test.test_instruct_lms_of_same_endpoint_share_a_client()
+    test = TestDeepSeekInstructLm()
+    test.test_concurrent_streams_overlap()
+    test = TestGenerate()
+    test.test_openai_refusal_without_content_is_an_empty_response()
+    test = TestStructuredOutput()
+    test.test_openai_request_has_strict_json_schema()
+    test = TestGenerateMany()
+    test.test_openai_samples_in_one_request_and_fans_out_streams()
+    test = TestNextTokenLogprobs()
+    test.test_openai_requests_one_token_with_top_logprobs()
+    test = TestErrorClassification()
+    test.test_openai_errors_are_classified_with_retry_after()
+    test.test_gemini_errors_are_classified()
+    test.test_backoff_delays_grow_and_respect_retry_after()
@@ -0,0 +1,169 @@
+import asyncio
+import math
+
+import pytest
+from pydantic import BaseModel
+
+from sr_olthad.framework.agents import (
+    InstructLmAgent,
+    LogprobClfAgent,
+    LogprobClfAgentOutput,
+    get_option_probabilities,
+)
+from sr_olthad.framework.lm_cache import CachedInstructLm
+from sr_olthad.framework.schema import InstructLm, InstructLmChatRole, LmBackoffPolicy
+
+
+class DummyOutputData(BaseModel):
+    answer: str
+    reason: str
+
+
+class LogprobsInstructLm(InstructLm):
+    """
+    Exposes fixed first-token logprobs (unless told not to) and answers with a reason (or,
+    if not asked for one, with a reasoned JSON answer).
+    """
+
+    def __init__(self, token_logprobs: dict[str, float] | None):
+        super().__init__()
+        self.token_logprobs = token_logprobs
+        self.n_logprobs_calls = 0
+        self.received_messages = []
+
+    async def generate(self, messages, stream_handler=None, **kwargs) -> str:
+        self.received_messages.append(messages)
+        if messages[-1]["content"] == "Why?":
+            return " Because. "
+        return 'Hmm... {"answer": "A", "reason": "Fallback."}'
+
+    async def get_next_token_logprobs(self, messages, n_top=20, **kwargs):
+        self.n_logprobs_calls += 1
+        if self.token_logprobs is None:
+            raise NotImplementedError
+        return self.token_logprobs
+
+
+class RateLimitedLogprobsInstructLm(LogprobsInstructLm):
+    """Times out on its first `n_timeouts` logprobs calls (i.e., transient errors)."""
+
+    backoff_policy = LmBackoffPolicy(max_retries=2, base_delay_seconds=0.001)
+
+    def __init__(self, token_logprobs: dict[str, float], n_timeouts: int):
+        super().__init__(token_logprobs)
+        self.n_timeouts = n_timeouts
+
+    async def get_next_token_logprobs(self, messages, n_top=20, **kwargs):
+        if self.n_timeouts > 0:
+            self.n_logprobs_calls += 1
+            self.n_timeouts -= 1
+            raise TimeoutError("Request timed out.")
+        return await super().get_next_token_logprobs(messages, n_top, **kwargs)
+
+
+def get_agent(instruct_lm: InstructLm, letters_needing_reason=None) -> LogprobClfAgent:
+    return LogprobClfAgent(
+        instruct_lm=instruct_lm,
+        response_json_model=DummyOutputData,
+        answer_field="answer",
+        reason_field="reason",
+        option_letters=["A", "B"],
+        answer_only_prompt="Letter only.",
+        reason_prompt="Why?",
+        letters_needing_reason=letters_needing_reason,
+        fallback_agent=InstructLmAgent(instruct_lm, response_json_model=DummyOutputData),
+    )
+
+
+INPUT_MESSAGES = [{"role": InstructLmChatRole.USER, "content": "A or B?"}]
+
+
+class TestLogprobClfAgent:
+    def test_option_probabilities_are_renormalized_over_option_tokens(self):
+        token_logprobs = {
+            "A": math.log(0.5),
+            " A": math.log(0.1),
+            "B.": math.log(0.2),
+            "Sure": math.log(0.2),
+        }
+        option_probs = get_option_probabilities(token_logprobs, ["A", "B"])
+        assert option_probs == pytest.approx({"A": 0.75, "B": 0.25})
+        assert get_option_probabilities({"Sure": 0.0}, ["A", "B"]) is None
+
+    def test_reason_is_only_generated_for_answers_needing_it(self):
+        lm = LogprobsInstructLm({"B": math.log(0.9), "A": math.log(0.1)})
+        agent = get_agent(lm, letters_needing_reason=["A"])
+        output = asyncio.run(agent.run(INPUT_MESSAGES))
+        assert isinstance(output, LogprobClfAgentOutput)
+        assert output.data == DummyOutputData(answer="B", reason="")
+        assert output.option_probs == pytest.approx({"A": 0.1, "B": 0.9})
+        assert lm.received_messages == []
+        assert output.messages[-1] == {"role": InstructLmChatRole.ASSISTANT, "content": "B"}
+
+        lm.token_logprobs = {"A": math.log(0.9), "B": math.log(0.1)}
+        output = asyncio.run(agent.run(INPUT_MESSAGES))
+        assert output.data == DummyOutputData(answer="A", reason="Because.")
+        assert [msg["content"] for msg in lm.received_messages[0]] == [
+            "A or B?",
+            "Letter only.",
+            "A",
+            "Why?",
+        ]
+        assert agent.stats.n_classifications == 2
+        assert agent.stats.n_reasons_generated == 1
+
+    def test_falls_back_when_logprobs_are_unusable(self):
+        # (None of the options are amongst the top tokens: falls back for this run only)
+        lm = LogprobsInstructLm({"Sure": 0.0})
+        agent = get_agent(lm)
+        output = asyncio.run(agent.run(INPUT_MESSAGES))
+        assert output.data == DummyOutputData(answer="A", reason="Fallback.")
+        assert agent.use_logprobs
+
+        # (Logprobs aren't exposed: falls back for good)
+        lm.token_logprobs = None
+        for _ in range(2):
+            output = asyncio.run(agent.run(INPUT_MESSAGES))
+            assert output.data == DummyOutputData(answer="A", reason="Fallback.")
+        assert not agent.use_logprobs
+        assert lm.n_logprobs_calls == 2
+        assert agent.stats.n_fallbacks == 2
+
+    def test_transient_errors_are_retried_before_falling_back(self):
+        token_logprobs = {"A": math.log(0.9), "B": math.log(0.1)}
+        lm = RateLimitedLogprobsInstructLm(token_logprobs, n_timeouts=2)
+        agent = get_agent(lm, letters_needing_reason=[])
+        output = asyncio.run(agent.run(INPUT_MESSAGES))
+        assert isinstance(output, LogprobClfAgentOutput)
+        assert output.data == DummyOutputData(answer="A", reason="")
+        assert lm.n_logprobs_calls == 3
+        assert agent.stats.n_transient_retries == 2
+        assert agent.stats.n_fallbacks == 0
+
+        # (Falls back, for this run only, once the retries are used up)
+        lm = RateLimitedLogprobsInstructLm(token_logprobs, n_timeouts=3)
+        agent = get_agent(lm, letters_needing_reason=[])
+        output = asyncio.run(agent.run(INPUT_MESSAGES))
+        assert output.data == DummyOutputData(answer="A", reason="Fallback.")
+        assert lm.n_logprobs_calls == 3
+        assert agent.stats.n_fallbacks == 1
+        assert agent.use_logprobs
+
+    def test_cached_instruct_lm_caches_logprobs(self):
+        lm = LogprobsInstructLm({"A": math.log(0.9), "B": math.log(0.1)})
+        cached_lm = CachedInstructLm(lm)
+        for _ in range(2):
+            token_logprobs = asyncio.run(cached_lm.get_next_token_logprobs(INPUT_MESSAGES))
+            assert token_logprobs == lm.token_logprobs
+        assert lm.n_logprobs_calls == 1
+        # (Not served as a response to a `generate` request with the same messages)
+        assert asyncio.run(cached_lm.generate(INPUT_MESSAGES)).startswith("Hmm...")
+
+
+if __name__ == "__main__":
+    test = TestLogprobClfAgent()
+    test.test_option_probabilities_are_renormalized_over_option_tokens()
+    test.test_reason_is_only_generated_for_answers_needing_it()
+    test.test_falls_back_when_logprobs_are_unusable()
+    test.test_transient_errors_are_retried_before_falling_back()
+    test.test_cached_instruct_lm_caches_logprobs()
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from sr_olthad.framework.lms import GeminiInstructLm, OpenAIInstructLm
+from sr_olthad.framework.rate_limits import LmRateLimiter, LmRateLimits
+
+
+class TestLmRateLimiter:
+    def test_instruct_lms_of_same_model_share_a_rate_limiter(self):
+        rate_limits = LmRateLimits(max_concurrent_requests=2)
+        lm_a = OpenAIInstructLm(api_key="x", model="test-model-a", rate_limits=rate_limits)
+        lm_b = OpenAIInstructLm(api_key="y", model="test-model-a", rate_limits=rate_limits)
+        other_model_lm = OpenAIInstructLm(model="test-model-b", rate_limits=rate_limits)
+        other_provider_lm = GeminiInstructLm(model="test-model-a", rate_limits=rate_limits)
+        assert lm_a.rate_limiter is lm_b.rate_limiter
+        assert other_model_lm.rate_limiter is not lm_a.rate_limiter
+        assert other_provider_lm.rate_limiter is not lm_a.rate_limiter
+        assert OpenAIInstructLm(model="test-model-a").rate_limiter is None
+        with pytest.raises(ValueError):
+            OpenAIInstructLm(model="test-model-a", rate_limits=LmRateLimits())
+
+    def test_concurrent_requests_are_capped(self):
+        rate_limiter = LmRateLimiter(LmRateLimits(max_concurrent_requests=2))
+
+        async def request():
+            async with rate_limiter.acquire():
+                await asyncio.sleep(0.01)
+
+        async def main():
+            await asyncio.gather(*(request() for _ in range(5)))
+
+        asyncio.run(main())
+        asyncio.run(main())  # (In a new event loop)
+        assert rate_limiter.stats.n_requests == 10
+        assert rate_limiter.stats.max_n_in_flight == 2
+        assert rate_limiter.stats.n_delayed_requests == 6
+        assert rate_limiter.stats.max_n_waiting == 3
+        assert rate_limiter.stats.n_in_flight == rate_limiter.stats.n_waiting == 0
+
+    def test_requests_wait_for_tokens_per_minute_budget(self):
+        # (100 tokens per second)
+        rate_limiter = LmRateLimiter(LmRateLimits(tokens_per_minute=6000))
+
+        async def main():
+            async with rate_limiter.acquire(n_tokens=5000):
+                pass
+            rate_limiter.charge_tokens(1000)  # (E.g., the response's tokens)
+            async with rate_limiter.acquire(n_tokens=5):
+                pass
+
+        asyncio.run(main())
+        assert rate_limiter.stats.n_delayed_requests == 1
+        assert 0.04 <= rate_limiter.stats.max_wait_seconds < 0.5
+
+
+if __name__ == "__main__":
+    test = TestLmRateLimiter()
+    test.test_instruct_lms_of_same_model_share_a_rate_limiter()
+    test.test_concurrent_requests_are_capped()
+    test.test_requests_wait_for_tokens_per_minute_budget()
@@ -0,0 +1,20 @@
+import subprocess
+import sys
+
+
+class TestImports:
+    def test_importing_sr_olthad_does_not_import_provider_sdks(self):
+        code = (
+            "import sys, sr_olthad; "
+            "sdks = ['deepseek', 'google.generativeai', 'groq', 'openai']; "
+            "print([sdk for sdk in sdks if sdk in sys.modules])"
+        )
+        completed_process = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        assert completed_process.stdout.strip() == "[]"
+
+
+if __name__ == "__main__":
+    test = TestImports()
+    test.test_importing_sr_olthad_does_not_import_provider_sdks()
@@ -0,0 +1,68 @@
+import asyncio
+
+from sr_olthad.framework.agents import InstructLmAgentOutput
+from sr_olthad.lm_step import LmStepTemplate, PostLmStepEmission
+from sr_olthad.olthad import PendingOlthadUpdate
+from sr_olthad.prompts import PlannerLmResponseOutputData
+from sr_olthad.schema import LmAgentName, UserPromptInputData
+
+
+class TestLmStepTemplate:
+    DUMMY_PROMPT_INPUT_DATA = UserPromptInputData(
+        env_state="You are hungry.",
+        olthad="{}",
+        task_in_question="{}",
+    )
+
+    @staticmethod
+    async def dummy_run_step(input_messages, retry_callback=None, **kwargs):
+        return InstructLmAgentOutput(
+            data=PlannerLmResponseOutputData(new_planned_subtasks=["Eat."]),
+            messages=input_messages,
+        )
+
+    def compose_and_run_step(
+        self, lm_step_template: LmStepTemplate, pending_update: PendingOlthadUpdate
+    ) -> str:
+        lm_step = lm_step_template.compose(
+            run_step=self.dummy_run_step,
+            process_output=lambda _: ("approved", pending_update),
+            lm_agent_name=LmAgentName.PLANNER,
+            cur_node_id="1",
+            prompt_input_data=self.DUMMY_PROMPT_INPUT_DATA,
+        )
+        return asyncio.run(lm_step())
+
+    def test_diff_is_not_computed_without_hooks(self):
+        def get_diff():
+            raise AssertionError("The diff should not have been computed")
+
+        committed = []
+        pending_update = PendingOlthadUpdate(
+            _do_update=lambda: committed.append(True), _get_diff=get_diff
+        )
+        result = self.compose_and_run_step(LmStepTemplate(), pending_update)
+        assert result == "approved"
+        assert committed == [True]
+
+    def test_diff_is_computed_once_when_accessed(self):
+        n_diff_computations = 0
+
+        def get_diff():
+            nonlocal n_diff_computations
+            n_diff_computations += 1
+            return ["  {}"]
+
+        def approve(emission: PostLmStepEmission) -> bool:
+            return emission.diff == emission.diff == ["  {}"]
+
+        pending_update = PendingOlthadUpdate(_do_update=lambda: None, _get_diff=get_diff)
+        lm_step_template = LmStepTemplate(post_lm_step_approver=approve)
+        assert self.compose_and_run_step(lm_step_template, pending_update) == "approved"
+        assert n_diff_computations == 1
+
+
+if __name__ == "__main__":
+    test = TestLmStepTemplate()
+    test.test_diff_is_not_computed_without_hooks()
+    test.test_diff_is_computed_once_when_accessed()
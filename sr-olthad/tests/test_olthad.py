@@ -1,6 +1,8 @@
 import re
 
-from sr_olthad.olthad import TaskNode
+import pytest
+
+from sr_olthad.olthad import OlthadTraversal, OlthadUsageError, TaskNode
 from sr_olthad.schema import TaskStatus
 
 
@@ -93,14 +95,113 @@ class TestTaskNode:
         assert root._REDACTED_PLANS_STR in stringified
 
 
+class TestOlthadTraversal:
+    def test_stringify_reflects_updates_after_cached_stringify(self):
+        traversal = OlthadTraversal(highest_level_task="Satiate your hunger.")
+        traversal.update_planned_subtasks_of_cur_node(["Order a pizza.", "Eat it."]).commit()
+        traversal.recurse_inward()
+        before = traversal.root_node.stringify()  # Populates the cached fragments
+        sibling_fragments = traversal.root_node.subtasks[1]._stringified_fragments_cache
+        assert len(sibling_fragments) > 0
+
+        traversal.update_status_and_retrospective_of(
+            node=traversal.cur_node,
+            new_status=TaskStatus.SUCCESS,
+            new_retrospective="You ordered a pizza.",
+        ).commit()
+        after = traversal.root_node.stringify()
+
+        assert "You ordered a pizza." not in before
+        assert "You ordered a pizza." in after
+        assert TaskStatus.SUCCESS in after
+        # Fragments off of the path from the updated node to the root are kept
+        assert len(sibling_fragments) > 0
+
+    def test_pending_update_diff_reconstructs_before_and_after(self):
+        traversal = OlthadTraversal(highest_level_task="Satiate your hunger.")
+        traversal.update_planned_subtasks_of_cur_node(["Order a pizza.", "Eat it."]).commit()
+        before = traversal.root_node.stringify()
+
+        pending_update = traversal.update_planned_subtasks_of_cur_node(["Cook pasta."])
+        diff = pending_update.get_diff()
+        pending_update.commit()
+        after = traversal.root_node.stringify()
+
+        assert {line[:2] for line in diff} == {"  ", "- ", "+ "}
+        assert "".join(ln[2:] for ln in diff if not ln.startswith("+ ")) == before
+        assert "".join(ln[2:] for ln in diff if not ln.startswith("- ")) == after
+
+    def test_update_nothing_diff_is_all_context(self):
+        traversal = OlthadTraversal(highest_level_task="Satiate your hunger.")
+        traversal.update_planned_subtasks_of_cur_node(["Order a pizza."]).commit()
+        diff = traversal.update_nothing().get_diff()
+        assert all(line.startswith("  ") for line in diff)
+        assert "".join(line[2:] for line in diff) == traversal.root_node.stringify()
+
+    def test_iter_in_progress_descendants_truncates_below_each_level(self):
+        traversal = OlthadTraversal(highest_level_task="Satiate your hunger.")
+        traversal.update_planned_subtasks_of_cur_node(["Order a pizza.", "Eat it."]).commit()
+        traversal.recurse_inward()
+        traversal.update_planned_subtasks_of_cur_node(["Call the pizzeria."]).commit()
+        full = traversal.root_node.stringify()
+
+        levels = list(traversal.root_node.iter_in_progress_descendants())
+        assert [original.id for _, _, original in levels] == ["1", "1.1"]
+        (root_view_0, cur_view_0, _), (root_view_1, cur_view_1, _) = levels
+        assert root_view_0.stringify() == cur_view_0.stringify()
+        assert '"subtasks": null' in root_view_0.stringify()
+        assert '"id": "1.2"' in root_view_1.stringify()
+        assert '"id": "1.1.1"' not in root_view_1.stringify()
+        assert '"subtasks": null' in cur_view_1.stringify()
+        # The original tree (and its stringification) is left untouched
+        assert traversal.root_node.stringify() == full
+        assert '"id": "1.1.1"' in full
+
+    def test_sibling_with_id_prefix_is_not_mistaken_for_ancestor(self):
+        traversal = OlthadTraversal(highest_level_task="Eat ten slices of pizza.")
+        slices = [f"Eat slice {i}." for i in range(1, 11)]
+        traversal.update_planned_subtasks_of_cur_node(slices).commit()
+        for _ in range(9):
+            traversal.recurse_inward()
+            traversal.update_status_and_retrospective_of(
+                traversal.cur_node, TaskStatus.SUCCESS
+            ).commit()
+            traversal.backtrack_to(traversal.root_node.id)
+        traversal.recurse_inward()
+        assert traversal.cur_node.id == "1.10"
+        with pytest.raises(OlthadUsageError):  # "1.1" is a sibling, not an ancestor
+            traversal.update_status_and_retrospective_of(
+                traversal.nodes["1.1"], TaskStatus.FAILURE
+            )
+        traversal.update_status_and_retrospective_of(traversal.root_node, TaskStatus.FAILURE)
+
+        # (Same one level deeper, where "1.10" is an ancestor but "1.1" still isn't)
+        traversal.update_planned_subtasks_of_cur_node(["Take a bite."]).commit()
+        traversal.recurse_inward()
+        assert traversal.cur_node.id == "1.10.1"
+        with pytest.raises(OlthadUsageError):
+            traversal.update_status_and_retrospective_of(
+                traversal.nodes["1.1"], TaskStatus.FAILURE
+            )
+        traversal.update_status_and_retrospective_of(
+            traversal.nodes["1.10"], TaskStatus.FAILURE
+        ).commit()
+
+
 if __name__ == "__main__":
     test = TestTaskNode()
     test.test_stringify_w_obfuscate_status_of()
     test.test_stringify_w_redact_planned_subtasks_below()
+    test = TestOlthadTraversal()
+    test.test_stringify_reflects_updates_after_cached_stringify()
+    test.test_pending_update_diff_reconstructs_before_and_after()
+    test.test_update_nothing_diff_is_all_context()
+    test.test_iter_in_progress_descendants_truncates_below_each_level()
+    test.test_sibling_with_id_prefix_is_not_mistaken_for_ancestor()
     # Print to sanity check
     print(
-        test.DUMMY_ROOT_TASK_NODE.stringify(
-            obfuscate_status_of=test.DUMMY_TASK_IN_QUESTION.id,
-            redact_planned_subtasks_below=test.DUMMY_TASK_IN_QUESTION.id,
+        TestTaskNode.DUMMY_ROOT_TASK_NODE.stringify(
+            obfuscate_status_of=TestTaskNode.DUMMY_TASK_IN_QUESTION.id,
+            redact_planned_subtasks_below=TestTaskNode.DUMMY_TASK_IN_QUESTION.id,
         )
     )
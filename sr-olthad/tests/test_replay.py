@@ -0,0 +1,69 @@
+import asyncio
+import json
+
+import pytest
+
+from sr_olthad.config import LM_AGENT_CFGS
+from sr_olthad.framework.schema import InstructLm
+from sr_olthad.replay import (
+    RecordingSrOlthad,
+    SrOlthadTrace,
+    replay_sr_olthad_run,
+)
+
+
+class ScriptedInstructLm(InstructLm):
+    """Answers every sr-OLTHAD agent with a fixed (valid) response."""
+
+    def __init__(self):
+        super().__init__()
+        self.n_calls = 0
+
+    async def generate(self, messages, stream_handler=None, **kwargs) -> str:
+        self.n_calls += 1
+        prompts = "".join(message["content"] for message in messages)
+        if '"new_planned_subtasks"' in prompts:
+            return json.dumps({"new_planned_subtasks": ["Chop a tree."]})
+        if '"status_to_assign"' in prompts:
+            return json.dumps(
+                {"status_to_assign": "Attempted (success)", "retrospective_to_assign": "."}
+            )
+        return json.dumps({"answer": "A", "retrospective": "Because."})
+
+
+class TestReplay:
+    ENV_STATES = ["In a forest.", "Holding wood."]
+
+    @staticmethod
+    def record_run(monkeypatch) -> tuple[SrOlthadTrace, ScriptedInstructLm]:
+        instruct_lm = ScriptedInstructLm()
+        for agent_cfg in LM_AGENT_CFGS:
+            monkeypatch.setattr(agent_cfg, "INSTRUCT_LM", instruct_lm)
+        sr_olthad = RecordingSrOlthad(
+            highest_level_task="Get wood.",
+            is_task_executable_skill_invocation=lambda task: task == "Chop a tree.",
+        )
+        for env_state in TestReplay.ENV_STATES:
+            asyncio.run(sr_olthad.get_next_skill_invocation(env_state))
+        return sr_olthad.trace, instruct_lm
+
+    def test_replay_reproduces_recorded_run(self, monkeypatch, tmp_path):
+        trace, instruct_lm = self.record_run(monkeypatch)
+        assert trace.env_states == self.ENV_STATES
+        assert trace.skill_invocations == ["Chop a tree.", None]
+        n_calls_while_recording = instruct_lm.n_calls
+
+        trace_fpath = str(tmp_path / "trace.json.gz")
+        trace.save(trace_fpath)
+        loaded_trace = SrOlthadTrace.load(trace_fpath)
+        assert loaded_trace == trace
+
+        skill_invocations = asyncio.run(replay_sr_olthad_run(loaded_trace))
+        assert skill_invocations == trace.skill_invocations
+        assert instruct_lm.n_calls == n_calls_while_recording
+
+    def test_diverging_replay_raises(self, monkeypatch):
+        trace, _ = self.record_run(monkeypatch)
+        trace.env_states[0] = "In a desert."
+        with pytest.raises(KeyError):
+            asyncio.run(replay_sr_olthad_run(trace))
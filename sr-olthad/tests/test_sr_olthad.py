@@ -0,0 +1,59 @@
+import asyncio
+from collections.abc import Hashable
+
+from sr_olthad import SrOlthad
+from sr_olthad.config import LM_AGENT_CFGS, BacktrackerCfg, ForgetterCfg
+from sr_olthad.framework.schema import InstructLm
+
+
+class WarmUpCountingInstructLm(InstructLm):
+    def __init__(self, client_key: str | None = None):
+        super().__init__()
+        self.n_warm_ups = 0
+        self._client_key = client_key
+
+    async def generate(self, messages, stream_handler=None, **kwargs) -> str:
+        raise NotImplementedError
+
+    async def warm_up(self) -> None:
+        await asyncio.sleep(0)
+        self.n_warm_ups += 1
+
+    @property
+    def client_key(self) -> Hashable:
+        return self if self._client_key is None else self._client_key
+
+
+class TestSrOlthad:
+    def test_lm_clients_are_warmed_up_once_in_background(self, monkeypatch):
+        instruct_lm = WarmUpCountingInstructLm()
+        for agent_cfg in LM_AGENT_CFGS:
+            monkeypatch.setattr(agent_cfg, "INSTRUCT_LM", instruct_lm)
+
+        async def construct_in_event_loop() -> SrOlthad:
+            sr_olthad = SrOlthad("Get wood.", lambda _: True)
+            await sr_olthad._lm_clients_warm_up_task
+            return sr_olthad
+
+        asyncio.run(construct_in_event_loop())
+        assert instruct_lm.n_warm_ups == 1
+        # (No running event loop to warm up in)
+        assert SrOlthad("Get wood.", lambda _: True)._lm_clients_warm_up_task is None
+
+    def test_only_one_lm_per_client_of_the_run_agents_is_warmed_up(self, monkeypatch):
+        instruct_lms = {}
+        for agent_cfg in LM_AGENT_CFGS:
+            instruct_lms[agent_cfg] = WarmUpCountingInstructLm(client_key="shared")
+            monkeypatch.setattr(agent_cfg, "INSTRUCT_LM", instruct_lms[agent_cfg])
+        unused_instruct_lm = WarmUpCountingInstructLm()  # (Not run w/ the CASCADED strategy)
+        monkeypatch.setattr(BacktrackerCfg.FusedClfCfg, "INSTRUCT_LM", unused_instruct_lm)
+        monkeypatch.setattr(ForgetterCfg, "INSTRUCT_LM", unused_instruct_lm)
+
+        async def construct_and_finish_warm_up() -> None:
+            sr_olthad = SrOlthad("Get wood.", lambda _: True)
+            await sr_olthad._finish_lm_clients_warm_up()
+            assert sr_olthad._lm_clients_warm_up_task is None
+
+        asyncio.run(construct_and_finish_warm_up())
+        assert sum(instruct_lm.n_warm_ups for instruct_lm in instruct_lms.values()) == 1
+        assert unused_instruct_lm.n_warm_ups == 0